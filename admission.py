@@ -0,0 +1,486 @@
+import math
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+
+from tenants import DEFAULT_TENANT
+
+logger = logging.getLogger("Admission")
+
+# 平均处理时长的初始估计（秒），用于估算排队时间
+DEFAULT_RUN_SECONDS = 90.0
+# 排队凭证的有效期（秒），等待方每次轮询时续期，进程退出后自动失效
+TICKET_TTL_SECONDS = 15.0
+
+
+def _connect(db_path, local):
+    # 每个线程持有自己的连接，SQLite连接不能跨线程共享
+    conn = getattr(local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        local.conn = conn
+    return conn
+
+
+class TokenBucketLimiter:
+    """
+    按工作流ID的令牌桶限速，令牌数存放在SQLite中，同一存储目录下的页面、工作进程和批处理共用
+    """
+
+    def __init__(self, db_path, rates, burst=3):
+        """
+        初始化限速器
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            rates (dict): 工作流ID -> 每分钟调用次数，未配置的工作流不限速
+            burst (int): 桶容量，空闲后允许连续发起的调用数
+        """
+        self.db_path = str(db_path)
+        self.rates = {workflow_id: float(rate) for workflow_id, rate in (rates or {}).items() if rate}
+        self.burst = max(1, int(burst))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            " workflow_id TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        return _connect(self.db_path, self._local)
+
+    def try_take(self, workflow_id):
+        """
+        尝试取一个令牌
+
+        返回:
+            float: 0表示已取得；否则为下一个令牌可用前需要等待的秒数
+        """
+        rate = self.rates.get(workflow_id)
+        if not rate:
+            return 0.0
+        per_second = rate / 60.0
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM token_buckets WHERE workflow_id = ?", (workflow_id,)
+            ).fetchone()
+            tokens = float(self.burst) if row is None else min(self.burst, row[0] + (now - row[1]) * per_second)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / per_second
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (workflow_id, tokens, updated_at) VALUES (?, ?, ?)",
+                (workflow_id, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def take(self, workflow_id, cancel=None, timeout=None):
+        """
+        取一个令牌，令牌不足时等待
+
+        参数:
+            workflow_id (str): 工作流ID
+            cancel (CancelToken): 取消标记，被取消后停止等待
+            timeout (float): 最长等待时间（秒），None表示一直等待
+
+        返回:
+            bool: 是否取得令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        counted = False
+        while True:
+            wait = self.try_take(workflow_id)
+            if not wait:
+                return True
+            if not counted:
+                counted = True
+                with self._lock:
+                    self.throttled += 1
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if cancel is not None:
+                if cancel.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def stats(self):
+        with self._lock:
+            return {"rates": dict(self.rates), "burst": self.burst, "throttled": self.throttled}
+
+
+class Permit:
+    """
+    已占用的处理名额，执行期间后台线程续约，处理结束后调用release()归还
+    """
+
+    def __init__(self, controller, slot_id):
+        self._controller = controller
+        self.slot_id = slot_id
+        self.acquired_at = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="admission-permit", daemon=True)
+        self._thread.start()
+
+    def _heartbeat(self):
+        lease = self._controller.lease_seconds
+        while not self._stop.wait(lease / 3):
+            try:
+                self._controller._renew(self.slot_id)
+            except Exception as e:
+                logger.error(f"处理名额续约失败: {e}")
+
+    def release(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._controller._release(self.slot_id, time.time() - self.acquired_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """
+    限制整个部署同时处理的视频数，超出时排队，队列已满时直接拒绝
+
+    排队按加权公平排队（WFQ）出队：每个 (租户, 用户) 是一个流，按租户权重分配处理名额，
+    租户内按用户平分，单个用户连续提交时排在其他用户之后，不会占满全部名额。
+    名额和排队凭证存放在SQLite中并带有效期，页面、任务工作进程和批处理共用同一上限，
+    进程退出后其名额在租约过期后自动释放。
+    """
+
+    def __init__(self, db_path, max_concurrent, max_queue, lease_seconds=120, poll_interval=1.0, weights=None):
+        """
+        初始化准入控制
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            max_concurrent (int): 同时处理的视频数上限
+            max_queue (int): 页面请求的最大排队数，超出时直接拒绝
+            lease_seconds (float): 名额租约时长，处理期间自动续约
+            poll_interval (float): 排队时的轮询间隔（秒）
+            weights (dict): 租户名 -> 权重，未配置的租户权重为1
+        """
+        self.db_path = str(db_path)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.weights = dict(weights or {})
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self._init_schema()
+
+    def _conn(self):
+        return _connect(self.db_path, self._local)
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_slots ("
+            " slot_id TEXT PRIMARY KEY,"
+            " acquired_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_queue ("
+            " ticket_id TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        for table, column, decl in (
+            ("admission_slots", "tenant", "TEXT"),
+            ("admission_slots", "identity", "TEXT"),
+            ("admission_queue", "tenant", "TEXT"),
+            ("admission_queue", "identity", "TEXT"),
+            ("admission_queue", "start_tag", "REAL NOT NULL DEFAULT 0"),
+            ("admission_queue", "finish_tag", "REAL NOT NULL DEFAULT 0"),
+        ):
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_admission_queue_finish ON admission_queue(finish_tag, created_at)")
+        # 每个流最后一个请求的完成标记，新请求从这里开始排
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_flows ("
+            " flow TEXT PRIMARY KEY,"
+            " last_finish REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # 按租户累计的排队统计，所有进程共用
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS admission_tenants ("
+            " tenant TEXT PRIMARY KEY,"
+            " admitted INTEGER NOT NULL DEFAULT 0,"
+            " rejected INTEGER NOT NULL DEFAULT 0,"
+            " total_wait REAL NOT NULL DEFAULT 0,"
+            " max_wait REAL NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS admission_meta (name TEXT PRIMARY KEY, value REAL)")
+
+    def _count(self, conn, table):
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _prune(self, conn, now):
+        # 清理已退出进程留下的名额和排队凭证，以及一天内没有请求的流
+        conn.execute("DELETE FROM admission_slots WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM admission_queue WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM admission_flows WHERE updated_at < ?", (now - 86400,))
+
+    def _meta(self, conn, name, default):
+        row = conn.execute("SELECT value FROM admission_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, conn, name, value):
+        conn.execute("INSERT OR REPLACE INTO admission_meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _tags(self, conn, tenant, identity, now):
+        # 计算新请求的开始和完成标记：流的权重为租户权重除以该租户当前活跃的用户数
+        flow = f"{tenant}\x1f{identity or ''}"
+        active = conn.execute(
+            "SELECT COUNT(DISTINCT identity) FROM ("
+            " SELECT identity FROM admission_queue WHERE tenant = ?"
+            " UNION SELECT identity FROM admission_slots WHERE tenant = ?"
+            " UNION SELECT ?)",
+            (tenant, tenant, identity),
+        ).fetchone()[0]
+        weight = self.weights.get(tenant, 1.0) / max(1, active)
+        row = conn.execute("SELECT last_finish FROM admission_flows WHERE flow = ?", (flow,)).fetchone()
+        start = max(self._meta(conn, "virtual_time", 0.0), row[0] if row else 0.0)
+        finish = start + 1.0 / weight
+        conn.execute(
+            "INSERT OR REPLACE INTO admission_flows (flow, last_finish, updated_at) VALUES (?, ?, ?)",
+            (flow, finish, now),
+        )
+        return start, finish
+
+    def _take_slot(self, conn, now, tenant, identity, start_tag, waited):
+        slot_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO admission_slots (slot_id, acquired_at, expires_at, tenant, identity) VALUES (?, ?, ?, ?, ?)",
+            (slot_id, now, now + self.lease_seconds, tenant, identity),
+        )
+        # 虚拟时间推进到正在服务的请求的开始标记
+        if start_tag > self._meta(conn, "virtual_time", 0.0):
+            self._set_meta(conn, "virtual_time", start_tag)
+        conn.execute(
+            "INSERT INTO admission_tenants (tenant, admitted, total_wait, max_wait) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT(tenant) DO UPDATE SET admitted = admitted + 1, total_wait = total_wait + excluded.total_wait, "
+            "max_wait = MAX(max_wait, excluded.max_wait)",
+            (tenant, waited, waited),
+        )
+        return slot_id
+
+    def _renew(self, slot_id):
+        self._conn().execute(
+            "UPDATE admission_slots SET expires_at = ? WHERE slot_id = ?",
+            (time.time() + self.lease_seconds, slot_id),
+        )
+
+    def _release(self, slot_id, duration):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM admission_slots WHERE slot_id = ?", (slot_id,))
+            # 按指数移动平均更新平均处理时长
+            conn.execute(
+                "INSERT INTO admission_meta (name, value) VALUES ('avg_run_seconds', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value * 0.8 + excluded.value * 0.2",
+                (duration,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def average_run_seconds(self):
+        return self._meta(self._conn(), "avg_run_seconds", DEFAULT_RUN_SECONDS)
+
+    def estimate_wait(self, ahead):
+        """
+        估算排在第ahead位（前面有ahead个请求）时的等待时间
+
+        返回:
+            float: 预计等待秒数
+        """
+        return math.ceil((ahead + 1) / self.max_concurrent) * self.average_run_seconds()
+
+    def admit(self, cancel=None, on_wait=None, bounded=True, tenant=DEFAULT_TENANT, identity=None):
+        """
+        获取处理名额，名额已满时排队等待
+
+        参数:
+            cancel (CancelToken): 取消标记，被取消后退出队列
+            on_wait (callable): 排队期间每次轮询后回调，参数为 (前面的请求数, 预计等待秒数)
+            bounded (bool): 是否受最大排队数限制；后台任务传False，一直排队直到取得名额
+            tenant (str): 租户名（访问密钥）
+            identity (str): 提交者标识
+
+        返回:
+            Permit: 处理名额；队列已满或被取消时返回None
+        """
+        conn = self._conn()
+        ticket_id = uuid.uuid4().hex
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._prune(conn, now)
+            waiting = self._count(conn, "admission_queue")
+            slot_id = None
+            rejected = False
+            if waiting == 0 and self._count(conn, "admission_slots") < self.max_concurrent:
+                start, finish = self._tags(conn, tenant, identity, now)
+                slot_id = self._take_slot(conn, now, tenant, identity, start, 0.0)
+            elif bounded and waiting >= self.max_queue:
+                rejected = True
+                conn.execute(
+                    "INSERT INTO admission_tenants (tenant, rejected) VALUES (?, 1) "
+                    "ON CONFLICT(tenant) DO UPDATE SET rejected = rejected + 1",
+                    (tenant,),
+                )
+            else:
+                start, finish = self._tags(conn, tenant, identity, now)
+                conn.execute(
+                    "INSERT INTO admission_queue (ticket_id, created_at, expires_at, tenant, identity, "
+                    "start_tag, finish_tag) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (ticket_id, now, now + TICKET_TTL_SECONDS, tenant, identity, start, finish),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if slot_id is not None:
+            return self._admitted(slot_id)
+        if rejected:
+            with self._lock:
+                self.rejected += 1
+            return None
+
+        with self._lock:
+            self.queued += 1
+        ticket = (ticket_id, now, tenant, identity, start, finish)
+        try:
+            while True:
+                slot_id, ahead = self._poll_ticket(ticket)
+                if slot_id is not None:
+                    return self._admitted(slot_id)
+                if on_wait is not None:
+                    on_wait(ahead, self.estimate_wait(ahead))
+                if cancel is not None:
+                    if cancel.wait(self.poll_interval):
+                        return None
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            self._conn().execute("DELETE FROM admission_queue WHERE ticket_id = ?", (ticket_id,))
+
+    def _poll_ticket(self, ticket):
+        # 续期排队凭证；按完成标记排在前面的请求数少于空闲名额时取得名额
+        ticket_id, created_at, tenant, identity, start, finish = ticket
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._prune(conn, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO admission_queue (ticket_id, created_at, expires_at, tenant, identity, "
+                "start_tag, finish_tag) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ticket_id, created_at, now + TICKET_TTL_SECONDS, tenant, identity, start, finish),
+            )
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM admission_queue WHERE finish_tag < ? OR (finish_tag = ? AND "
+                "(created_at < ? OR (created_at = ? AND ticket_id < ?)))",
+                (finish, finish, created_at, created_at, ticket_id),
+            ).fetchone()[0]
+            slot_id = None
+            if ahead < self.max_concurrent - self._count(conn, "admission_slots"):
+                conn.execute("DELETE FROM admission_queue WHERE ticket_id = ?", (ticket_id,))
+                slot_id = self._take_slot(conn, now, tenant, identity, start, now - created_at)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return slot_id, ahead
+
+    def _admitted(self, slot_id):
+        with self._lock:
+            self.admitted += 1
+        return Permit(self, slot_id)
+
+    def tenant_stats(self):
+        """
+        按租户统计当前排队数、处理中的数量和累计的等待时间
+
+        返回:
+            dict: 租户名 -> {"waiting", "running", "admitted", "rejected", "avg_wait_seconds", "max_wait_seconds"}
+        """
+        conn = self._conn()
+        now = time.time()
+        tenants = {}
+
+        def entry(name):
+            return tenants.setdefault(name, {
+                "waiting": 0, "running": 0, "admitted": 0, "rejected": 0,
+                "avg_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            })
+
+        for name, count in conn.execute(
+                "SELECT tenant, COUNT(*) FROM admission_queue WHERE expires_at >= ? GROUP BY tenant", (now,)):
+            entry(name)["waiting"] = count
+        for name, count in conn.execute(
+                "SELECT tenant, COUNT(*) FROM admission_slots WHERE expires_at >= ? GROUP BY tenant", (now,)):
+            entry(name)["running"] = count
+        for name, admitted, rejected, total_wait, max_wait in conn.execute(
+                "SELECT tenant, admitted, rejected, total_wait, max_wait FROM admission_tenants"):
+            item = entry(name)
+            item.update(
+                admitted=admitted,
+                rejected=rejected,
+                avg_wait_seconds=round(total_wait / admitted, 1) if admitted else 0.0,
+                max_wait_seconds=round(max_wait, 1),
+            )
+        return tenants
+
+    def stats(self):
+        """
+        当前名额占用、排队数，以及本进程内的准入统计
+        """
+        conn = self._conn()
+        now = time.time()
+        running = conn.execute("SELECT COUNT(*) FROM admission_slots WHERE expires_at >= ?", (now,)).fetchone()[0]
+        waiting = conn.execute("SELECT COUNT(*) FROM admission_queue WHERE expires_at >= ?", (now,)).fetchone()[0]
+        with self._lock:
+            return {
+                "running": running,
+                "max_concurrent": self.max_concurrent,
+                "waiting": waiting,
+                "max_queue": self.max_queue,
+                "avg_run_seconds": round(self.average_run_seconds(), 1),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+            }
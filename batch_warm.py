@@ -0,0 +1,415 @@
+"""
+批量处理视频链接并预热结果缓存，无需打开页面
+
+用法:
+    python batch_warm.py urls.txt --workers 4 --rate 6
+    cat urls.txt | python batch_warm.py - --workers 2
+    python batch_warm.py --retry-failed          # 重新处理上次失败的视频
+
+已缓存的视频会被跳过；每处理完一个视频就记录状态，中断后重新运行即可继续。
+"""
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+import tomllib
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from coze_api import CozeAPI
+from cache_store import ExpirySweeper, open_results_store, has_transcript
+from singleflight import SingleFlight
+from admission import AdmissionController, TokenBucketLimiter
+from tenants import load_tenants, tenant_weights
+from workflow_router import WorkflowRouter, ROUTES
+from exports import ExportStore, save_export_bundles
+from retry_policy import RetryPolicy
+from workflow_runner import WorkflowRunner, to_result_data, is_content_failure
+from utils import parse_video_identity, canonical_video_url, make_cache_key, cache_key_bvid
+
+logger = logging.getLogger("BatchWarm")
+
+MAX_PRIMARY_RETRY = 2
+MAX_BACKUP_RETRY = 2
+
+STATUS_DONE = "done"
+STATUS_CACHED = "cached"
+STATUS_FAILED = "failed"
+
+# 批处理在排队时使用的租户名，与页面的访问密钥租户公平分配处理名额
+BATCH_TENANT = "batch"
+
+
+def load_service_config(secrets_path):
+    """
+    读取与页面相同的 .streamlit/secrets.toml 配置
+
+    参数:
+        secrets_path (Path): secrets.toml路径
+
+    返回:
+        dict: my_service配置段
+    """
+    with open(secrets_path, "rb") as f:
+        return tomllib.load(f)["my_service"]
+
+
+def load_cookies(service):
+    cookies = {
+        "SESSDATA": service["SESSDATA"],
+        "bili_jct": service["bili_jct"],
+        "DedeUserID": service["DedeUserID"],
+    }
+    for cookie in ["DedeUserID__ckMd5", "sid", "buvid3", "buvid_fp"]:
+        if cookie in service:
+            cookies[cookie] = service[cookie]
+    return cookies
+
+
+def build_runner(service, rate_limiter=None):
+    """
+    按页面相同的配置创建工作流调度器
+    """
+    cookies = load_cookies(service)
+    new_bot_id = service.get("NEW_BOT_ID")
+    hedge_delay = service.get("HEDGE_DELAY_SECONDS")
+    return WorkflowRunner(
+        CozeAPI(service["API_URL"], service["COZE_API_TOKEN"], new_bot_id) if new_bot_id else None,
+        CozeAPI(service["API_URL"], service["COZE_API_TOKEN"], service["BOT_ID"]),
+        cookies,
+        async_mode=bool(service.get("WORKFLOW_ASYNC_MODE", True)),
+        hedge_delay=float(hedge_delay) if hedge_delay is not None else None,
+        primary_policy=RetryPolicy(max_attempts=MAX_PRIMARY_RETRY, base_delay=1.0, retry_on_empty=False),
+        backup_policy=RetryPolicy(max_attempts=MAX_BACKUP_RETRY, base_delay=3.0),
+        deadline_seconds=float(service.get("WORKFLOW_DEADLINE_SECONDS", 1800)),
+        rate_limiter=rate_limiter,
+    )
+
+
+def build_rate_limiter(service, storage):
+    """
+    按页面相同的配置创建工作流限速器，未配置限速时返回None
+    """
+    rates = dict(service.get("WORKFLOW_RATE_LIMITS", {}))
+    if not rates:
+        return None
+    return TokenBucketLimiter(Path(storage) / "admission.db", rates, burst=int(service.get("WORKFLOW_RATE_BURST", 3)))
+
+
+def build_router(service, storage, mode=None):
+    """
+    按页面相同的配置创建字幕/语音识别路由器
+
+    参数:
+        mode (str): 覆盖配置中的ROUTING_MODE，None表示使用配置
+    """
+    return WorkflowRouter(
+        Path(storage) / "routing.db",
+        cookies=load_cookies(service),
+        mode=mode or service.get("ROUTING_MODE", "auto"),
+        overrides=dict(service.get("ROUTE_OVERRIDES", {})),
+        fetch_meta=bool(service.get("ROUTING_FETCH_META", True)),
+        explore_rate=float(service.get("ROUTING_EXPLORE_RATE", 0.05)),
+    )
+
+
+def build_admission(service, storage):
+    """
+    创建与页面共用的并发上限，MAX_CONCURRENT_RUNS为0时返回None
+    """
+    max_concurrent = int(service.get("MAX_CONCURRENT_RUNS", 8))
+    if max_concurrent <= 0:
+        return None
+    return AdmissionController(
+        Path(storage) / "admission.db", max_concurrent, int(service.get("ADMISSION_QUEUE_SIZE", 20)),
+        weights=tenant_weights(load_tenants(service)),
+    )
+
+
+def negative_cache_ttl(service):
+    """
+    读取失败记录的退避配置
+
+    返回:
+        tuple: (首次退避秒数, 退避上限秒数)
+    """
+    return (
+        float(service.get("NEGATIVE_CACHE_MINUTES", 30)) * 60,
+        float(service.get("NEGATIVE_CACHE_MAX_HOURS", 24)) * 3600,
+    )
+
+
+def result_ttl_seconds(service):
+    return int(service.get("RESULT_TTL_DAYS", 14)) * 86400
+
+
+def pinned_ttl(service):
+    """
+    读取置顶课程配置，页面、批处理和任务工作进程写入结果时共用
+
+    返回:
+        tuple: (置顶课程的BV号集合, 置顶课程保留秒数)
+    """
+    return set(service.get("PINNED_VIDEOS", [])), int(service.get("PINNED_TTL_DAYS", 180)) * 86400
+
+
+def stamp_result(key, data, pinned=None):
+    """
+    为待写入缓存的结果加上写入时间，置顶课程按更长时间保留
+
+    参数:
+        key (str): 缓存键
+        data (dict): 结果数据
+        pinned (tuple): pinned_ttl()的返回，None表示没有置顶课程
+
+    返回:
+        dict: 新的结果数据，不修改传入的data
+    """
+    result = dict(data, timestamp=datetime.now())
+    if pinned and cache_key_bvid(key) in pinned[0]:
+        result["ttl_seconds"] = pinned[1]
+    return result
+
+
+class RateLimiter:
+    """
+    限制每分钟开始处理的视频数量
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        time.sleep(max(0.0, start_at - now))
+
+
+class BatchState:
+    """
+    记录每个视频的处理状态，用于中断后继续和重新处理失败的视频
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                self.entries = {}
+
+    def set(self, key, url, status, message=""):
+        with self._lock:
+            self.entries[key] = {
+                "url": url,
+                "status": status,
+                "message": message,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+            }
+            # 先写临时文件再替换，避免中断时留下损坏的状态文件
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries, ensure_ascii=False, indent=1), encoding="utf-8")
+            tmp.replace(self.path)
+
+    def failed_urls(self):
+        with self._lock:
+            return [v["url"] for v in self.entries.values() if v["status"] == STATUS_FAILED]
+
+
+def read_urls(source):
+    """
+    从文件或标准输入读取链接，忽略空行和#开头的注释
+    """
+    stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.strip().startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def dedupe(urls):
+    """
+    解析并按视频标识去重，同一视频的av/BV链接和p=1/不带p的链接只处理一次
+
+    返回:
+        tuple: ([(缓存键, 规范化链接)], [(原始链接, 错误信息)])
+    """
+    jobs, invalid, seen = [], [], set()
+    for url in urls:
+        is_valid, identity = parse_video_identity(url)
+        if not is_valid:
+            invalid.append((url, identity))
+            continue
+        key = make_cache_key(identity)
+        if key not in seen:
+            seen.add(key)
+            jobs.append((key, canonical_video_url(identity)))
+    return jobs, invalid
+
+
+def is_cached(store, key):
+    return has_transcript(store.get(key))
+
+
+def lookup_result(store, key):
+    # 其他进程处理完成后读取结果，失败记录同样视为已有结果
+    result = store.get(key)
+    if result:
+        return result
+    failure = store.get_failure(key)
+    if failure:
+        return {"error": True, "message": failure["message"]}
+    return None
+
+
+def process_one(key, parsed_url, runner, store, single_flight, limiter, negative_ttl, admission=None,
+                tenant=BATCH_TENANT, identity=None, router=None, retry_failed=False, pinned=None,
+                exports=None):
+    """
+    处理单个视频并写入缓存
+
+    参数:
+        negative_ttl (tuple): 失败记录的 (首次退避秒数, 退避上限秒数)
+        admission (AdmissionController): 与页面共用的并发上限，后台任务不受排队数限制
+        tenant (str): 排队时使用的租户名
+        identity (str): 排队时使用的提交者标识
+        router (WorkflowRouter): 字幕/语音识别路由器，为None时按原有顺序调用
+        retry_failed (bool): 明确要求重新处理失败的视频，清除失败记录，不等退避期结束
+        pinned (tuple): pinned_ttl()的返回，置顶课程的结果按更长时间保留
+        exports (ExportStore): 导出文件目录，写入结果后生成导出文件；为None时由页面首次查看时补生成
+
+    返回:
+        tuple: (状态, 说明)
+    """
+    if is_cached(store, key):
+        return STATUS_CACHED, ""
+    if retry_failed:
+        store.clear_failure(key)
+    else:
+        failure = store.get_failure(key)
+        if failure:
+            return STATUS_FAILED, failure["message"]
+
+    def run():
+        limiter.wait()
+        permit = None
+        if admission is not None:
+            permit = admission.admit(bounded=False, tenant=tenant, identity=identity)
+        try:
+            route, on_attempt = None, None
+            if router is not None:
+                features, decision = router.plan(cache_key_bvid(key))
+                route, on_attempt = decision["route"], router.observer(features)
+            result, success, api_used = runner.run(parsed_url, route=route, on_attempt=on_attempt)
+        finally:
+            if permit is not None:
+                permit.release()
+        if not success:
+            if is_content_failure(result):
+                # 与页面共用失败记录，退避期内不再重复处理
+                store.record_failure(key, result.get("message"), *negative_ttl)
+            return {"error": True, "message": result.get("message")}
+        data = to_result_data(result, api_used)
+        if data.get("error"):
+            return data
+        store.put(key, stamp_result(key, data, pinned))
+        if exports is not None:
+            try:
+                save_export_bundles(exports, store, [(key, data.get("summary", ""))])
+            except Exception as e:
+                # 导出文件可在页面查看时补生成，不影响本次处理结果
+                logger.error(f"生成导出文件失败 {key}: {e}")
+        return data
+
+    # 与页面进程共用租约，避免同一视频被重复处理
+    data, shared = single_flight.do(key, run, lookup=lambda: lookup_result(store, key))
+    if data.get("error"):
+        return STATUS_FAILED, data.get("message") or ""
+    return (STATUS_CACHED if shared else STATUS_DONE), data.get("api_used") or ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量处理B站视频并预热结果缓存")
+    parser.add_argument("source", nargs="?", help="链接文件，每行一个；'-'表示从标准输入读取")
+    parser.add_argument("--workers", type=int, default=2, help="并发处理的视频数")
+    parser.add_argument("--rate", type=float, default=0, help="每分钟最多开始处理的视频数，0为不限")
+    parser.add_argument("--retry-failed", action="store_true", help="重新处理状态文件中失败的视频")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="配置文件路径")
+    parser.add_argument("--storage", default="./storage", help="缓存目录，与页面保持一致")
+    parser.add_argument("--route", choices=ROUTES, help="字幕/语音识别路由，默认使用配置中的ROUTING_MODE")
+    args = parser.parse_args(argv)
+
+    # coze_api已将根日志级别设为ERROR，这里只放开批处理自身的进度日志
+    logger.setLevel(logging.INFO)
+    storage = Path(args.storage)
+    storage.mkdir(exist_ok=True)
+    state = BatchState(storage / "batch_state.json")
+
+    urls = read_urls(args.source) if args.source else []
+    retry_keys = set()
+    if args.retry_failed:
+        failed_urls = state.failed_urls()
+        retry_keys = {key for key, _ in dedupe(failed_urls)[0]}
+        urls += failed_urls
+    if not urls:
+        parser.error("没有需要处理的链接")
+
+    jobs, invalid = dedupe(urls)
+    for url, message in invalid:
+        logger.warning(f"跳过无效链接 {url}: {message}")
+
+    service = load_service_config(args.secrets)
+    store = open_results_store(storage, default_ttl_seconds=result_ttl_seconds(service))
+    pending = []
+    for key, parsed_url in jobs:
+        if is_cached(store, key):
+            state.set(key, parsed_url, STATUS_CACHED)
+        else:
+            pending.append((key, parsed_url))
+    logger.info(f"共 {len(jobs)} 个视频，已缓存 {len(jobs) - len(pending)} 个，待处理 {len(pending)} 个")
+
+    runner = build_runner(service, rate_limiter=build_rate_limiter(service, storage))
+    admission = build_admission(service, storage)
+    router = build_router(service, storage, args.route)
+    single_flight = SingleFlight(store=store)
+    limiter = RateLimiter(args.rate)
+    negative_ttl = negative_cache_ttl(service)
+    pinned = pinned_ttl(service)
+    exports = ExportStore(storage / "exports")
+    counts = {STATUS_DONE: 0, STATUS_CACHED: 0, STATUS_FAILED: 0}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(process_one, key, parsed_url, runner, store, single_flight, limiter, negative_ttl,
+                            admission, router=router, retry_failed=key in retry_keys,
+                            pinned=pinned, exports=exports): (key, parsed_url)
+            for key, parsed_url in pending
+        }
+        for future in as_completed(futures):
+            key, parsed_url = futures[future]
+            try:
+                status, message = future.result()
+            except Exception as e:
+                status, message = STATUS_FAILED, str(e)
+            counts[status] += 1
+            state.set(key, parsed_url, status, message)
+            logger.info(f"[{status}] {parsed_url} {message}")
+
+    logger.info(f"清理过期缓存 {ExpirySweeper(store).sweep()} 条")
+    logger.info(f"完成 {counts[STATUS_DONE]}，已缓存 {counts[STATUS_CACHED]}，失败 {counts[STATUS_FAILED]}")
+    return 1 if counts[STATUS_FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,951 @@
+import sqlite3
+import pickle
+import threading
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from utils import CACHE_KEY_VERSION, upgrade_cache_key
+from search_index import to_index_text, build_match_query, make_snippet, summary_title
+
+logger = logging.getLogger("CacheStore")
+
+# 单独压缩存放的大字段，命中缓存时不随元数据一起读取
+LARGE_FIELDS = ("transcript",)
+COMPRESS_LEVEL = 6
+# 默认保留时间，条目可用 ttl_seconds 字段单独指定
+DEFAULT_TTL_SECONDS = 14 * 86400
+# 失败记录在可重试后继续保留的时间，用于计算退避
+FAILURE_RETENTION_SECONDS = 7 * 86400
+
+
+def make_metadata(result):
+    """
+    从完整结果中去掉大字段得到元数据，并记录逐字稿长度
+
+    参数:
+        result (dict): 完整结果
+
+    返回:
+        dict: 元数据
+    """
+    if not isinstance(result, dict):
+        return result
+    metadata = dict(result)
+    for field in LARGE_FIELDS:
+        if field in metadata:
+            metadata[f"{field}_length"] = len((metadata.pop(field) or "").strip())
+    return metadata
+
+
+def has_transcript(entry):
+    """
+    判断缓存条目是否包含非空逐字稿，无需读取逐字稿本身
+
+    参数:
+        entry (dict): 缓存条目（元数据或完整结果）
+
+    返回:
+        bool: 是否有逐字稿
+    """
+    if not entry:
+        return False
+    if "transcript_length" in entry:
+        return entry["transcript_length"] > 0
+    transcript = entry.get("transcript") or ""
+    return transcript.strip() != ""
+
+
+def to_epoch(ts):
+    """
+    将缓存条目中的时间戳统一转换为epoch秒
+
+    参数:
+        ts: datetime、ISO格式字符串或None
+
+    返回:
+        float: epoch秒，无法识别时返回当前时间
+    """
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    if isinstance(ts, str):
+        try:
+            return datetime.fromisoformat(ts).timestamp()
+        except ValueError:
+            pass
+    return datetime.now().timestamp()
+
+
+def entry_expires_at(entry, default_ttl_seconds=DEFAULT_TTL_SECONDS):
+    """
+    计算缓存条目的过期时间，优先使用条目自带的ttl_seconds
+
+    参数:
+        entry (dict): 缓存条目（元数据或完整结果）
+        default_ttl_seconds (float): 默认保留时间（秒）
+
+    返回:
+        float: 过期时间的epoch秒
+    """
+    if not isinstance(entry, dict):
+        return datetime.now().timestamp() + default_ttl_seconds
+    if entry.get("expires_at") is not None:
+        return entry["expires_at"]
+    return to_epoch(entry.get("timestamp")) + (entry.get("ttl_seconds") or default_ttl_seconds)
+
+
+class ResultsStore:
+    """
+    基于SQLite的结果缓存，按key点查和写入，不再整文件读写pickle
+    """
+
+    def __init__(self, db_path, legacy_pickle=None, default_ttl_seconds=DEFAULT_TTL_SECONDS):
+        """
+        初始化结果缓存
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            legacy_pickle (str|Path): 旧版results_cache.pkl路径，存在时执行一次性迁移
+            default_ttl_seconds (float): 条目未指定ttl_seconds时的保留时间（秒）
+        """
+        self.db_path = str(db_path)
+        self.default_ttl_seconds = default_ttl_seconds
+        self._local = threading.local()
+        self._init_schema()
+        if legacy_pickle:
+            self._migrate_pickle(Path(legacy_pickle))
+        self._split_large_fields()
+        self._backfill_expiry()
+        self._build_search_index()
+
+    def _conn(self):
+        # 每个线程持有自己的连接，SQLite连接不能跨线程共享
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE results ADD COLUMN expires_at REAL")
+        # 过期索引，清理时只访问已过期的条目
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_expires ON results(expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS result_fields ("
+            " key TEXT NOT NULL,"
+            " field TEXT NOT NULL,"
+            " data BLOB NOT NULL,"
+            " PRIMARY KEY (key, field))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            " key TEXT PRIMARY KEY,"
+            " message TEXT,"
+            " failures INTEGER NOT NULL DEFAULT 0,"
+            " retry_after REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_failures_retry ON failures(retry_after)")
+        # 导出文件按内容哈希存放在磁盘上，这里记录每个条目各格式对应的哈希
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS exports ("
+            " key TEXT NOT NULL,"
+            " fmt TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " PRIMARY KEY (key, fmt))"
+        )
+        # 全文索引：文档编号与缓存键的对应关系，词元为预先切分的中文二元组和英文单词
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_docs ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL UNIQUE)"
+        )
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(summary, transcript, tokenize='unicode61')"
+            )
+            self.search_enabled = True
+        except sqlite3.OperationalError as e:
+            # 部分SQLite构建没有FTS5，此时不提供搜索
+            logger.warning(f"SQLite不支持FTS5，全文搜索不可用: {e}")
+            self.search_enabled = False
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS inflight ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _migrate_pickle(self, pickle_path):
+        """
+        将旧版pickle缓存一次性导入SQLite，导入后把原文件改名保留
+
+        页面、任务工作进程和批处理可能同时启动，导入在写事务中进行并再次检查导入标记，
+        只有一个进程执行导入；原文件已被其他进程改名时视为已导入。
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'pickle_migrated'").fetchone():
+            return
+        rows = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'pickle_migrated'").fetchone() is None:
+                try:
+                    with open(pickle_path, "rb") as f:
+                        legacy = pickle.load(f)
+                except FileNotFoundError:
+                    legacy = None
+                except (pickle.UnpicklingError, EOFError, ValueError):
+                    legacy = {}
+                if legacy is not None:
+                    rows = []
+                    for k, v in legacy.items():
+                        ts = v.get("timestamp") if isinstance(v, dict) else None
+                        rows.append((k, pickle.dumps(v), to_epoch(ts)))
+                    conn.executemany("INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('pickle_migrated', ?)", (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if rows is None:
+            return
+        try:
+            pickle_path.rename(pickle_path.with_suffix(pickle_path.suffix + ".migrated"))
+        except FileNotFoundError:
+            pass
+        logger.info("已从 %s 迁移 %d 条缓存", pickle_path, len(rows))
+
+    def _backfill_expiry(self):
+        # 旧条目和导入的条目没有过期时间，按默认保留时间补齐
+        self._conn().execute(
+            "UPDATE results SET expires_at = created_at + ? WHERE expires_at IS NULL", (self.default_ttl_seconds,)
+        )
+
+    def _index_search(self, conn, key, result):
+        # 更新单条缓存的全文索引，逐字稿为空的条目不参与搜索
+        self._unindex_search(conn, [key])
+        if not self.search_enabled or not has_transcript(result):
+            return
+        doc_id = conn.execute("INSERT INTO search_docs (key) VALUES (?)", (key,)).lastrowid
+        conn.execute(
+            "INSERT INTO search_fts (rowid, summary, transcript) VALUES (?, ?, ?)",
+            (doc_id, to_index_text(result.get("summary")), to_index_text(result.get("transcript"))),
+        )
+
+    def _unindex_search(self, conn, keys):
+        if not self.search_enabled:
+            return
+        for key in keys:
+            row = conn.execute("SELECT doc_id FROM search_docs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM search_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM search_docs WHERE doc_id = ?", (row[0],))
+
+    def _build_search_index(self):
+        """
+        为已有缓存建立全文索引，只执行一次，之后随写入和清理增量维护
+        """
+        if not self.search_enabled:
+            return
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'search_indexed'").fetchone():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            indexed = 0
+            for (key,) in conn.execute("SELECT key FROM results").fetchall():
+                metadata = self.get(key)
+                if not isinstance(metadata, dict):
+                    continue
+                self._index_search(conn, key, dict(metadata, transcript=self.get_transcript(key)))
+                indexed += 1
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('search_indexed', ?)", (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if indexed:
+            logger.info("已为 %d 条缓存建立全文索引", indexed)
+
+    def _write(self, conn, key, result):
+        metadata = make_metadata(result)
+        ts = metadata.get("timestamp") if isinstance(metadata, dict) else None
+        expires_at = entry_expires_at(metadata, self.default_ttl_seconds)
+        if isinstance(metadata, dict):
+            metadata["expires_at"] = expires_at
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(metadata), to_epoch(ts), expires_at),
+        )
+        conn.execute("DELETE FROM result_fields WHERE key = ?", (key,))
+        # 成功写入后清除该视频的失败记录和旧的导出文件
+        conn.execute("DELETE FROM failures WHERE key = ?", (key,))
+        conn.execute("DELETE FROM exports WHERE key = ?", (key,))
+        if isinstance(result, dict) and "transcript" in result:
+            self._index_search(conn, key, result)
+        if isinstance(result, dict):
+            # 大字段压缩后单独存放
+            conn.executemany(
+                "INSERT INTO result_fields (key, field, data) VALUES (?, ?, ?)",
+                [
+                    (key, field, zlib.compress((result[field] or "").encode("utf-8"), COMPRESS_LEVEL))
+                    for field in LARGE_FIELDS if field in result
+                ],
+            )
+        return metadata
+
+    def set_synchronous(self, mode):
+        """
+        设置当前线程连接的落盘策略
+
+        参数:
+            mode (str): OFF / NORMAL / FULL
+        """
+        self._conn().execute(f"PRAGMA synchronous={mode}")
+
+    def _split_large_fields(self):
+        """
+        将旧条目中内嵌的逐字稿拆出并压缩，只执行一次
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'fields_split'").fetchone():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            converted = 0
+            for key, value in conn.execute("SELECT key, value FROM results").fetchall():
+                try:
+                    result = pickle.loads(value)
+                except (pickle.UnpicklingError, EOFError, ValueError):
+                    continue
+                if isinstance(result, dict) and any(field in result for field in LARGE_FIELDS):
+                    self._write(conn, key, result)
+                    converted += 1
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('fields_split', ?)", (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if converted:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.info("已压缩 %d 条缓存的逐字稿", converted)
+
+    def migrate_keys(self, version, convert):
+        """
+        缓存键格式变更时一次性改写已有条目的key
+
+        同一新key对应多个旧条目时保留最新的一条。
+
+        参数:
+            version (int): 目标键格式版本，已达到该版本时跳过
+            convert (callable): 旧key -> 新key，返回None表示保持不变
+
+        返回:
+            int: 改写的条目数
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM meta WHERE name = 'key_version'").fetchone()
+        if row is not None and int(row[0]) >= version:
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = 0
+            rows = conn.execute("SELECT key, created_at FROM results ORDER BY created_at").fetchall()
+            for old_key, created_at in rows:
+                new_key = convert(old_key)
+                if not new_key or new_key == old_key:
+                    continue
+                # 按时间顺序处理，较新的条目覆盖较旧的
+                conn.execute("DELETE FROM results WHERE key = ?", (new_key,))
+                conn.execute("DELETE FROM result_fields WHERE key = ?", (new_key,))
+                conn.execute("UPDATE results SET key = ? WHERE key = ?", (new_key, old_key))
+                conn.execute("UPDATE result_fields SET key = ? WHERE key = ?", (new_key, old_key))
+                self._unindex_search(conn, [new_key])
+                conn.execute("UPDATE search_docs SET key = ? WHERE key = ?", (new_key, old_key))
+                conn.execute("DELETE FROM exports WHERE key = ?", (new_key,))
+                conn.execute("UPDATE exports SET key = ? WHERE key = ?", (new_key, old_key))
+                moved += 1
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('key_version', ?)", (str(version),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if moved:
+            logger.info("已改写 %d 条缓存键到版本 %d", moved, version)
+        return moved
+
+    def get(self, key):
+        """
+        按key查询缓存元数据，不包含逐字稿等大字段
+
+        参数:
+            key (str): 缓存键
+
+        返回:
+            dict: 缓存的结果元数据，不存在或已过期时返回None
+        """
+        # 已过期但尚未被清理的条目视为不存在
+        row = self._conn().execute(
+            "SELECT value FROM results WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            return None
+
+    def get_field(self, key, field):
+        """
+        读取并解压单独存放的大字段
+
+        参数:
+            key (str): 缓存键
+            field (str): 字段名，如 transcript
+
+        返回:
+            str: 字段内容，不存在时返回None
+        """
+        row = self._conn().execute(
+            "SELECT data FROM result_fields WHERE key = ? AND field = ?", (key, field)
+        ).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def get_transcript(self, key):
+        return self.get_field(key, "transcript")
+
+    def put(self, key, result):
+        """
+        写入单条缓存，逐字稿压缩后与元数据分开存放，只影响该key所在的行
+
+        参数:
+            key (str): 缓存键
+            result (dict): 结果数据
+
+        返回:
+            dict: 写入的元数据（不含大字段）
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            metadata = self._write(conn, key, result)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return metadata
+
+    def put_many(self, items):
+        """
+        在一个事务中写入多条缓存
+
+        参数:
+            items (list): [(缓存键, 结果数据)]
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, result in items:
+                self._write(conn, key, result)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key):
+        """
+        删除单条缓存
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM result_fields WHERE key = ?", (key,))
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.execute("DELETE FROM exports WHERE key = ?", (key,))
+            self._unindex_search(conn, [key])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def set_expiry(self, key, expires_at):
+        """
+        修改单条缓存的过期时间，如延长置顶课程的保留时间
+
+        参数:
+            key (str): 缓存键
+            expires_at (float): 新的过期时间（epoch秒），None表示永不过期
+
+        返回:
+            bool: 条目是否存在
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                metadata = pickle.loads(row[0])
+                if isinstance(metadata, dict):
+                    metadata["expires_at"] = expires_at
+                conn.execute(
+                    "UPDATE results SET value = ?, expires_at = ? WHERE key = ?",
+                    (pickle.dumps(metadata), expires_at, key),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def set_exports(self, items):
+        """
+        登记导出文件，缓存条目已被删除时忽略
+
+        参数:
+            items (list): [(缓存键, {格式: 内容哈希})]
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, digests in items:
+                if conn.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is None:
+                    continue
+                conn.executemany(
+                    "INSERT OR REPLACE INTO exports (key, fmt, digest) VALUES (?, ?, ?)",
+                    [(key, fmt, digest) for fmt, digest in digests.items()],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_exports(self, key):
+        """
+        查询缓存条目的导出文件
+
+        返回:
+            dict: 格式 -> 内容哈希，尚未生成时为空
+        """
+        rows = self._conn().execute("SELECT fmt, digest FROM exports WHERE key = ?", (key,)).fetchall()
+        return dict(rows)
+
+    def export_digests(self):
+        return {row[0] for row in self._conn().execute("SELECT DISTINCT digest FROM exports")}
+
+    def search(self, query, limit=20):
+        """
+        按关键词搜索已缓存的视频，按BM25相关度排序，AI总结中的匹配权重更高
+
+        参数:
+            query (str): 关键词，中文按二元组匹配
+            limit (int): 最多返回的视频数
+
+        返回:
+            list: [{"key", "title", "snippet", "metadata"}]
+        """
+        match = build_match_query(query)
+        if not self.search_enabled or not match:
+            return []
+        try:
+            rows = self._conn().execute(
+                "SELECT d.key FROM search_fts f JOIN search_docs d ON d.doc_id = f.rowid "
+                "WHERE search_fts MATCH ? ORDER BY bm25(search_fts, 2.0, 1.0) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"全文搜索失败: {e}")
+            return []
+        results = []
+        for (key,) in rows:
+            metadata = self.get(key)
+            if not isinstance(metadata, dict):
+                continue
+            summary = metadata.get("summary")
+            # 片段优先取自总结，总结中没有时才解压逐字稿
+            snippet = make_snippet(summary, query) or make_snippet(self.get_transcript(key), query)
+            results.append({
+                "key": key,
+                "title": summary_title(summary),
+                "snippet": snippet,
+                "metadata": metadata,
+            })
+        return results
+
+    def get_failure(self, key, now=None):
+        """
+        查询仍在退避期内的失败记录
+
+        参数:
+            key (str): 缓存键
+            now (float): 当前时间（epoch秒），默认time.time()
+
+        返回:
+            dict: {"message", "failures", "retry_after"}，没有记录或已可重试时返回None
+        """
+        now = time.time() if now is None else now
+        row = self._conn().execute(
+            "SELECT message, failures, retry_after FROM failures WHERE key = ? AND retry_after > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"message": row[0], "failures": row[1], "retry_after": row[2]}
+
+    def record_failure(self, key, message, base_ttl_seconds, max_ttl_seconds):
+        """
+        记录一次失败，连续失败时退避时间按2倍增长
+
+        参数:
+            key (str): 缓存键
+            message (str): 失败原因
+            base_ttl_seconds (float): 首次失败的退避时间（秒）
+            max_ttl_seconds (float): 退避时间上限（秒）
+
+        返回:
+            dict: {"message", "failures", "retry_after"}
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            failures = conn.execute(
+                "INSERT INTO failures (key, message, failures, retry_after, updated_at) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET"
+                " message = excluded.message, failures = failures + 1, updated_at = excluded.updated_at "
+                "RETURNING failures",
+                (key, message, now, now),
+            ).fetchone()[0]
+            retry_after = now + min(max_ttl_seconds, base_ttl_seconds * (2 ** (failures - 1)))
+            conn.execute("UPDATE failures SET retry_after = ? WHERE key = ?", (retry_after, key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"message": message, "failures": failures, "retry_after": retry_after}
+
+    def clear_failure(self, key):
+        self._conn().execute("DELETE FROM failures WHERE key = ?", (key,))
+
+    def purge_expired(self, now=None, limit=500):
+        """
+        删除一批已过期的缓存，按过期索引顺序访问，代价只与过期条目数有关
+
+        参数:
+            now (float): 当前时间（epoch秒），默认time.time()
+            limit (int): 本批最多删除的条目数
+
+        返回:
+            int: 删除的条目数
+        """
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [
+                (row[0],) for row in conn.execute(
+                    "SELECT key FROM results WHERE expires_at <= ? ORDER BY expires_at LIMIT ?", (now, limit)
+                )
+            ]
+            conn.executemany("DELETE FROM result_fields WHERE key = ?", keys)
+            conn.executemany("DELETE FROM results WHERE key = ?", keys)
+            conn.executemany("DELETE FROM exports WHERE key = ?", keys)
+            self._unindex_search(conn, [key for (key,) in keys])
+            # 长时间没有再失败的记录不再参与退避
+            conn.execute("DELETE FROM failures WHERE retry_after <= ?", (now - FAILURE_RETENTION_SECONDS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(keys)
+
+    def acquire_lease(self, key, owner, ttl_seconds):
+        """
+        尝试获取某个key的处理租约，用于跨进程合并相同视频的请求
+
+        参数:
+            key (str): 缓存键
+            owner (str): 租约持有者标识
+            ttl_seconds (float): 租约有效期（秒）
+
+        返回:
+            bool: 是否由owner持有租约
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at < ?", (key, now))
+            conn.execute(
+                "INSERT OR IGNORE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + ttl_seconds),
+            )
+            row = conn.execute("SELECT owner FROM inflight WHERE key = ?", (key,)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None and row[0] == owner
+
+    def renew_lease(self, key, owner, ttl_seconds):
+        """
+        延长租约，返回租约是否仍由owner持有
+        """
+        cur = self._conn().execute(
+            "UPDATE inflight SET expires_at = ? WHERE key = ? AND owner = ?",
+            (time.time() + ttl_seconds, key, owner),
+        )
+        return cur.rowcount > 0
+
+    def release_lease(self, key, owner):
+        self._conn().execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    def lease_active(self, key):
+        """
+        判断是否有其他进程正在处理该key
+        """
+        row = self._conn().execute(
+            "SELECT 1 FROM inflight WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def __contains__(self, key):
+        return self._conn().execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def open_results_store(storage_dir, default_ttl_seconds=DEFAULT_TTL_SECONDS):
+    """
+    打开存储目录下的结果库，并完成旧pickle导入和缓存键升级
+
+    参数:
+        storage_dir (str|Path): 存储目录
+        default_ttl_seconds (float): 默认保留时间（秒）
+
+    返回:
+        ResultsStore: 结果库
+    """
+    storage_dir = Path(storage_dir)
+    store = ResultsStore(
+        storage_dir / "results_cache.db",
+        legacy_pickle=storage_dir / "results_cache.pkl",
+        default_ttl_seconds=default_ttl_seconds,
+    )
+    store.migrate_keys(CACHE_KEY_VERSION, upgrade_cache_key)
+    return store
+
+
+class ExpirySweeper:
+    """
+    后台定期清理过期缓存，写入路径不再承担清理开销
+    """
+
+    def __init__(self, store, interval=300.0, batch_size=500, exports=None):
+        """
+        初始化清理线程
+
+        参数:
+            store (ResultsStore): 结果库
+            interval (float): 两次清理之间的间隔（秒）
+            batch_size (int): 每个事务最多删除的条目数，避免长时间占用写锁
+            exports (ExportStore): 导出文件目录，清理后一并删除不再引用的文件
+        """
+        self.store = store
+        self.exports = exports
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.evicted = 0
+        self.last_evicted = 0
+        self.last_run = None
+        self._thread = threading.Thread(target=self._run, name="expiry-sweeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self):
+        """
+        立即清理所有过期条目
+
+        返回:
+            int: 本次删除的条目数
+        """
+        total = 0
+        while True:
+            removed = self.store.purge_expired(limit=self.batch_size)
+            total += removed
+            if removed < self.batch_size:
+                break
+        if self.exports is not None:
+            self.exports.collect_garbage(self.store.export_digests())
+        with self._lock:
+            self.runs += 1
+            self.evicted += total
+            self.last_evicted = total
+            self.last_run = datetime.now()
+        if total:
+            logger.info("已清理 %d 条过期缓存", total)
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"清理过期缓存失败: {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "evicted": self.evicted,
+                "last_evicted": self.last_evicted,
+                "last_run": self.last_run.isoformat(timespec="seconds") if self.last_run else None,
+            }
+
+
+def estimate_size(value):
+    """
+    粗略估算缓存条目占用的字节数，主要计入字符串内容
+
+    参数:
+        value: 任意缓存值
+
+    返回:
+        int: 估算的字节数
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 49
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + 33
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return 32
+
+
+class MemoryCache:
+    """
+    进程内共享的结果缓存，按字节预算做LRU淘汰，并按TTL过期
+    """
+
+    def __init__(self, max_bytes, ttl_seconds):
+        """
+        初始化内存缓存
+
+        参数:
+            max_bytes (int): 内存预算（字节）
+            ttl_seconds (float): 条目存活时间（秒）
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        查询缓存，命中时移到LRU队尾
+
+        返回:
+            缓存值，未命中或已过期返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, expires_at=None):
+        """
+        写入缓存，超出预算时从最久未使用的条目开始淘汰
+
+        参数:
+            key (str): 缓存键
+            value: 缓存值
+            expires_at (float): 过期的epoch秒，默认为当前时间加TTL
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if expires_at is None:
+            expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self):
+        """
+        返回命中、未命中、淘汰等计数，用于监控
+
+        返回:
+            dict: 统计信息
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,73 @@
+import threading
+
+# 被取消的调用在结果中使用的错误类型
+CANCELLED_ERROR_TYPE = "cancelled"
+
+
+class CancelToken:
+    """
+    协作式取消标记：调用方在轮询、重试等待等位置检查，被取消后尽快停止
+
+    可以指定父标记，父标记被取消时子标记一并取消，子标记取消不影响父标记。
+    """
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._children = []
+        self.reason = None
+        if parent is not None:
+            parent._add_child(self)
+
+    def _add_child(self, child):
+        with self._lock:
+            if not self._event.is_set():
+                self._children.append(child)
+                return
+        child.cancel(self.reason)
+
+    def cancel(self, reason="cancelled"):
+        """
+        取消，重复调用时保留第一次的原因
+
+        参数:
+            reason (str): 取消原因，用于日志和统计
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            children, self._children = self._children, []
+        for child in children:
+            child.cancel(reason)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        等待取消，可代替time.sleep使用
+
+        返回:
+            bool: 是否已被取消
+        """
+        return self._event.wait(timeout)
+
+
+def cancelled_result(reason=None, **extra):
+    """
+    生成被取消调用的结果，格式与工作流错误响应一致
+    """
+    result = {
+        "error": True,
+        "error_type": CANCELLED_ERROR_TYPE,
+        "message": f"处理已取消（{reason}）" if reason else "处理已取消",
+    }
+    result.update(extra)
+    return result
+
+
+def is_cancelled_result(result):
+    return bool(result) and result.get("error_type") == CANCELLED_ERROR_TYPE
@@ -1,9 +1,15 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import logging
 import os
+import time
+import asyncio
+import threading
 from datetime import datetime
 
+from cancellation import cancelled_result
+
 # 配置日志级别为ERROR，减少不必要的输出
 logging.basicConfig(
     level=logging.ERROR,
@@ -11,6 +17,257 @@ logging.basicConfig(
 )
 logger = logging.getLogger("CozeAPI")
 
+# 连接池与超时配置：连接超时短，读取超时覆盖工作流最长运行时间
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 1200
+POLL_READ_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+_active_requests = 0
+_total_requests = 0
+
+def get_session():
+    """
+    获取进程内共享的HTTP会话，所有CozeAPI实例和工作流复用同一个连接池
+    
+    返回:
+        requests.Session: 带keep-alive连接池的会话
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive"
+            })
+            _session = session
+        return _session
+
+def _request(method, url, **kwargs):
+    # 通过共享会话发送请求，并记录正在进行的请求数
+    global _active_requests, _total_requests
+    with _session_lock:
+        _active_requests += 1
+        _total_requests += 1
+    try:
+        return get_session().request(method, url, **kwargs)
+    finally:
+        with _session_lock:
+            _active_requests -= 1
+
+def get_pool_stats():
+    """
+    获取连接池使用情况，用于监控
+    
+    返回:
+        dict: 各主机的连接数、空闲连接数以及正在进行的请求数
+    """
+    session = get_session()
+    adapter = session.get_adapter("https://")
+    hosts = {}
+    for pool_key in list(adapter.poolmanager.pools.keys()):
+        pool = adapter.poolmanager.pools.get(pool_key)
+        if pool is None:
+            continue
+        hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+            "opened_connections": pool.num_connections,
+            "requests": pool.num_requests,
+            # 连接队列中用None占位未创建的连接
+            "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+            "maxsize": POOL_MAXSIZE,
+        }
+    with _session_lock:
+        return {
+            "active_requests": _active_requests,
+            "total_requests": _total_requests,
+            "hosts": hosts,
+        }
+
+def _request_error(e):
+    """
+    将请求异常转换为错误响应，error_type用于区分超时、连接失败等可重试错误
+    """
+    if isinstance(e, requests.exceptions.Timeout):
+        error_type = "timeout"
+    elif isinstance(e, requests.exceptions.ConnectionError):
+        error_type = "connection"
+    else:
+        error_type = "request"
+    return {
+        "error": True,
+        "error_type": error_type,
+        "message": f"请求异常: {str(e)}"
+    }
+
+def iter_sse_events(lines):
+    """
+    将SSE文本行解析为事件
+    
+    参数:
+        lines (iterable): 逐行的响应文本（已解码，不含换行符）
+        
+    返回:
+        generator: 依次产出 {"id", "event", "data"} 字典，data为解析后的JSON或原始字符串
+    """
+    event = {"id": None, "event": "message", "data": []}
+    for line in lines:
+        if line is None:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if line == "":
+            if event["data"]:
+                raw = "\n".join(event["data"])
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    data = raw
+                yield {"id": event["id"], "event": event["event"], "data": data}
+            event = {"id": None, "event": "message", "data": []}
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            event["data"].append(value)
+        elif field == "event":
+            event["event"] = value
+        elif field == "id":
+            event["id"] = value
+    if event["data"]:
+        raw = "\n".join(event["data"])
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = raw
+        yield {"id": event["id"], "event": event["event"], "data": data}
+
+class WorkflowStream:
+    """
+    消费流式工作流事件：text_deltas()逐段产出总结文本，结束后result()给出完整结果
+    
+    约定输出节点以Message事件流式返回总结文本，结束节点返回包含transcript和summary的JSON，
+    result()将其转换为与run_workflow一致的响应格式。
+    """
+    
+    def __init__(self, events):
+        self._events = events
+        self._final_output = None
+        self._text_parts = []
+        self._error = None
+        self._done = False
+        self._closed = False
+    
+    def close(self):
+        """
+        放弃未读取的事件并关闭底层连接，之后result()返回已取消
+        """
+        if not self._done:
+            self._closed = True
+            close = getattr(self._events, "close", None)
+            if close is not None:
+                close()
+    
+    @staticmethod
+    def _as_final_output(content):
+        # 结束节点的输出是包含逐字稿的JSON对象
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(data, dict) and set(data.keys()) == {"Output"}:
+            try:
+                data = json.loads(data["Output"]) if isinstance(data["Output"], str) else data["Output"]
+            except ValueError:
+                return None
+        if isinstance(data, dict) and "transcript" in data:
+            return data
+        return None
+    
+    def text_deltas(self):
+        """
+        逐段产出总结文本，可直接传给st.write_stream
+        """
+        for event in self._events:
+            name = event.get("event")
+            data = event.get("data") if isinstance(event.get("data"), dict) else {}
+            if name == "Message":
+                content = data.get("content") or ""
+                final = self._as_final_output(content) if data.get("node_is_finish") else None
+                if final is not None:
+                    self._final_output = final
+                elif content:
+                    self._text_parts.append(content)
+                    yield content
+            elif name == "Error":
+                self._error = data.get("error_message") or str(event.get("data"))
+                break
+            elif name == "Done":
+                break
+        self._done = True
+    
+    def result(self):
+        """
+        返回完整结果，格式与run_workflow一致
+        
+        返回:
+            dict: API响应
+        """
+        if self._closed:
+            return cancelled_result("stream_closed")
+        if not self._done:
+            for _ in self.text_deltas():
+                pass
+        if self._error:
+            return {
+                "error": True,
+                "error_type": "workflow",
+                "message": f"工作流执行失败: {self._error}"
+            }
+        if self._final_output is None:
+            return {
+                "error": True,
+                "error_type": "workflow",
+                "message": "流式工作流未返回结果"
+            }
+        data = dict(self._final_output)
+        if not data.get("summary") and self._text_parts:
+            data["summary"] = "".join(self._text_parts)
+        return {"code": 0, "data": data}
+
+# 异步工作流的执行状态
+EXECUTE_RUNNING = "Running"
+EXECUTE_SUCCESS = "Success"
+EXECUTE_FAIL = "Fail"
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_background_loop():
+    """
+    获取后台事件循环，所有返回Future的异步任务共用这一个线程轮询
+    
+    返回:
+        asyncio.AbstractEventLoop: 在守护线程中运行的事件循环
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            t = threading.Thread(target=_loop.run_forever, name="coze-async-loop", daemon=True)
+            t.start()
+        return _loop
+
 class CozeAPI:
     def __init__(self, api_url=None, api_token=None, workflow_id=None):
         """
@@ -24,21 +281,30 @@ class CozeAPI:
         self.api_url = api_url
         self.api_token = api_token 
         self.workflow_id = workflow_id
+        # 查询异步执行状态的地址与运行地址同域，如 https://api.coze.cn/v1/workflows/{id}/run_histories/{execute_id}
+        self.api_base = api_url.split("/v1/")[0] if api_url and "/v1/" in api_url else api_url
         
-    def run_workflow(self, parameters=None):
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_token}",
+            "Content-Type": "application/json"
+        }
+        
+    def run_workflow(self, parameters=None, timeout=None, cancel=None):
         """
         运行Coze工作流
         
         参数:
             parameters (dict): 工作流参数
+            timeout (float): 读取超时（秒），默认READ_TIMEOUT
+            cancel (CancelToken): 取消标记；同步调用发出后无法中断，只在发出前检查
             
         返回:
             dict: API响应
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
+        if cancel is not None and cancel.cancelled:
+            return cancelled_result(cancel.reason)
+        headers = self._headers()
         
         payload = {
             "workflow_id": self.workflow_id
@@ -48,38 +314,293 @@ class CozeAPI:
             payload["parameters"] = parameters
         
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=1200)
+            response = _request("POST", self.api_url, headers=headers, json=payload, timeout=(CONNECT_TIMEOUT, timeout or READ_TIMEOUT))
             
             if response.status_code == 200:
                 return response.json()
             else:
                 return {
                     "error": True,
+                    "error_type": "http",
                     "status_code": response.status_code,
                     "message": f"API 调用失败: {response.text}"
                 }
                 
         except requests.exceptions.RequestException as e:
-            return {
-                "error": True,
-                "message": f"请求异常: {str(e)}"
-            }
+            return _request_error(e)
             
-    def run_workflow_with_cookies(self, video_url, cookies_dict):
+    def submit_workflow(self, parameters=None):
         """
-        运行需要cookie的工作流
+        以异步方式提交工作流，立即返回执行ID
+        
+        参数:
+            parameters (dict): 工作流参数
+            
+        返回:
+            dict: 包含execute_id的API响应，失败时包含error
+        """
+        payload = {
+            "workflow_id": self.workflow_id,
+            "is_async": True
+        }
+        
+        if parameters:
+            payload["parameters"] = parameters
+        
+        try:
+            response = _request("POST", self.api_url, headers=self._headers(), json=payload, timeout=(CONNECT_TIMEOUT, POLL_READ_TIMEOUT))
+            
+            if response.status_code != 200:
+                return {
+                    "error": True,
+                    "error_type": "http",
+                    "status_code": response.status_code,
+                    "message": f"API 调用失败: {response.text}"
+                }
+            result = response.json()
+            if result.get("code") != 0 or not result.get("execute_id"):
+                return {
+                    "error": True,
+                    "error_type": "workflow",
+                    "message": f"异步提交失败: {result.get('msg')}",
+                    "raw": result
+                }
+            return result
+                
+        except requests.exceptions.RequestException as e:
+            return _request_error(e)
+    
+    def get_execution_status(self, execute_id, workflow_id=None):
+        """
+        查询异步工作流的执行状态
+        
+        参数:
+            execute_id (str): 提交时返回的执行ID
+            workflow_id (str): 工作流ID，默认使用当前workflow_id
+            
+        返回:
+            dict: 包含execute_status的执行记录，失败时包含error
+        """
+        workflow_id = workflow_id or self.workflow_id
+        url = f"{self.api_base}/v1/workflows/{workflow_id}/run_histories/{execute_id}"
+        
+        try:
+            response = _request("GET", url, headers=self._headers(), timeout=(CONNECT_TIMEOUT, POLL_READ_TIMEOUT))
+            
+            if response.status_code != 200:
+                return {
+                    "error": True,
+                    "error_type": "http",
+                    "status_code": response.status_code,
+                    "message": f"状态查询失败: {response.text}"
+                }
+            result = response.json()
+            records = result.get("data") or []
+            if result.get("code") != 0 or not records:
+                return {
+                    "error": True,
+                    "error_type": "workflow",
+                    "message": f"状态查询失败: {result.get('msg')}",
+                    "raw": result
+                }
+            return records[0]
+                
+        except requests.exceptions.RequestException as e:
+            return _request_error(e)
+    
+    @staticmethod
+    def _to_run_response(record, execute_id):
+        """
+        将执行记录转换为与同步run_workflow相同格式的响应，便于复用parse_workflow_response
+        """
+        status = record.get("execute_status")
+        if status == EXECUTE_SUCCESS:
+            output = record.get("output")
+            # 执行记录的输出通常包了一层 {"Output": "..."}
+            try:
+                wrapped = json.loads(output) if isinstance(output, str) else output
+                if isinstance(wrapped, dict) and set(wrapped.keys()) == {"Output"}:
+                    output = wrapped["Output"]
+            except (TypeError, ValueError):
+                pass
+            return {"code": 0, "data": output, "execute_id": execute_id}
+        return {
+            "error": True,
+            "error_type": "workflow",
+            "execute_id": execute_id,
+            "message": f"工作流执行失败: {record.get('error_message') or record.get('error_code')}"
+        }
+    
+    def _poll_delays(self, initial_interval, max_interval, backoff):
+        delay = initial_interval
+        while True:
+            yield delay
+            delay = min(delay * backoff, max_interval)
+    
+    def wait_for_execution(self, execute_id, timeout=1200, initial_interval=2, max_interval=15, backoff=1.5, on_progress=None, cancel=None):
+        """
+        按退避间隔轮询异步工作流，直到完成或超时
+        
+        参数:
+            execute_id (str): 执行ID
+            timeout (float): 最长等待时间（秒）
+            initial_interval (float): 首次轮询间隔（秒）
+            max_interval (float): 最大轮询间隔（秒）
+            backoff (float): 间隔增长倍数
+            on_progress (callable): 每次轮询后回调，参数为 (执行状态, 已等待秒数)
+            cancel (CancelToken): 取消标记，被取消后停止轮询
+            
+        返回:
+            dict: 与run_workflow格式一致的API响应
+        """
+        start = time.monotonic()
+        for delay in self._poll_delays(initial_interval, max_interval, backoff):
+            elapsed = time.monotonic() - start
+            if elapsed + delay > timeout:
+                break
+            if cancel is not None:
+                if cancel.wait(delay):
+                    return cancelled_result(cancel.reason, execute_id=execute_id)
+            else:
+                time.sleep(delay)
+            record = self.get_execution_status(execute_id)
+            elapsed = time.monotonic() - start
+            status = EXECUTE_RUNNING if record.get("error") else record.get("execute_status")
+            if on_progress:
+                on_progress(status, elapsed)
+            # 状态查询的临时失败不终止轮询
+            if not record.get("error") and status != EXECUTE_RUNNING:
+                return self._to_run_response(record, execute_id)
+        return {
+            "error": True,
+            "error_type": "timeout",
+            "execute_id": execute_id,
+            "message": f"工作流执行超时（{int(timeout)}秒）"
+        }
+    
+    def run_workflow_polling(self, parameters=None, timeout=1200, on_progress=None, cancel=None):
+        """
+        提交异步工作流并轮询结果，连接不会在整个执行期间保持占用
+        
+        参数:
+            parameters (dict): 工作流参数
+            timeout (float): 最长等待时间（秒）
+            on_progress (callable): 进度回调，参数为 (执行状态, 已等待秒数)
+            cancel (CancelToken): 取消标记，提交前和轮询期间检查
+            
+        返回:
+            dict: 与run_workflow格式一致的API响应
+        """
+        if cancel is not None and cancel.cancelled:
+            return cancelled_result(cancel.reason)
+        submitted = self.submit_workflow(parameters)
+        if submitted.get("error"):
+            return submitted
+        return self.wait_for_execution(submitted["execute_id"], timeout=timeout, on_progress=on_progress, cancel=cancel)
+    
+    async def run_workflow_async(self, parameters=None, timeout=1200, initial_interval=2, max_interval=15, backoff=1.5, on_progress=None):
+        """
+        asyncio版本的异步工作流调用，等待期间不占用线程
+        
+        参数:
+            parameters (dict): 工作流参数
+            timeout (float): 最长等待时间（秒）
+            initial_interval (float): 首次轮询间隔（秒）
+            max_interval (float): 最大轮询间隔（秒）
+            backoff (float): 间隔增长倍数
+            on_progress (callable): 进度回调，参数为 (执行状态, 已等待秒数)
+            
+        返回:
+            dict: 与run_workflow格式一致的API响应
+        """
+        submitted = await asyncio.to_thread(self.submit_workflow, parameters)
+        if submitted.get("error"):
+            return submitted
+        execute_id = submitted["execute_id"]
+        
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for delay in self._poll_delays(initial_interval, max_interval, backoff):
+            if loop.time() - start + delay > timeout:
+                break
+            await asyncio.sleep(delay)
+            record = await asyncio.to_thread(self.get_execution_status, execute_id)
+            status = EXECUTE_RUNNING if record.get("error") else record.get("execute_status")
+            if on_progress:
+                on_progress(status, loop.time() - start)
+            if not record.get("error") and status != EXECUTE_RUNNING:
+                return self._to_run_response(record, execute_id)
+        return {
+            "error": True,
+            "error_type": "timeout",
+            "execute_id": execute_id,
+            "message": f"工作流执行超时（{int(timeout)}秒）"
+        }
+    
+    def run_workflow_future(self, parameters=None, timeout=1200, on_progress=None):
+        """
+        提交异步工作流并返回Future，所有任务在同一个后台事件循环中轮询
+        
+        参数:
+            parameters (dict): 工作流参数
+            timeout (float): 最长等待时间（秒）
+            on_progress (callable): 进度回调，在后台线程中调用
+            
+        返回:
+            concurrent.futures.Future: 结果为与run_workflow格式一致的API响应
+        """
+        coro = self.run_workflow_async(parameters, timeout=timeout, on_progress=on_progress)
+        return asyncio.run_coroutine_threadsafe(coro, _get_background_loop())
+            
+    def stream_workflow(self, parameters=None, timeout=None):
+        """
+        调用流式工作流接口，逐个产出SSE事件
+        
+        参数:
+            parameters (dict): 工作流参数
+            timeout (float): 两次数据之间的读取超时（秒），默认READ_TIMEOUT
+            
+        返回:
+            generator: 事件字典；请求失败时产出一个Error事件
+        """
+        payload = {
+            "workflow_id": self.workflow_id
+        }
+        
+        if parameters:
+            payload["parameters"] = parameters
+        
+        headers = self._headers()
+        headers["Accept"] = "text/event-stream"
+        try:
+            response = _request("POST", f"{self.api_base}/v1/workflow/stream_run", headers=headers, json=payload,
+                                timeout=(CONNECT_TIMEOUT, timeout or READ_TIMEOUT), stream=True)
+            with response:
+                if response.status_code != 200:
+                    yield {"id": None, "event": "Error", "data": {"error_message": f"API 调用失败: {response.text}"}}
+                    return
+                # SSE固定使用UTF-8编码
+                response.encoding = "utf-8"
+                yield from iter_sse_events(response.iter_lines(decode_unicode=True))
+        except requests.exceptions.RequestException as e:
+            yield {"id": None, "event": "Error", "data": {"error_message": _request_error(e)["message"]}}
+    
+    def build_cookie_parameters(self, video_url, cookies_dict):
+        """
+        构造需要cookie的工作流参数
         
         参数:
             video_url (str): 视频URL
             cookies_dict (dict): B站cookie字典
             
         返回:
-            dict: API响应
+            dict: 工作流参数，校验失败时为错误响应
         """
         # 检查URL格式
         if "bilibili.com/video/" not in video_url:
             return {
                 "error": True,
+                "error_type": "invalid_request",
                 "message": "URL格式不正确，应包含'bilibili.com/video/'"
             }
         
@@ -106,13 +627,47 @@ class CozeAPI:
             if cookie not in cookies_dict or not cookies_dict[cookie]:
                 return {
                     "error": True,
+                    "error_type": "invalid_request",
                     "message": f"缺少必要的cookie: {cookie}"
                 }
         
         # 使用正确的参数名称 - url 和 cookie
-        parameters = {
+        return {
             "url": clean_url,  # 使用'url'而不是'video_url'
             "cookie": cookies_dict  # 使用'cookie'而不是'cookies_dict'
         }
+    
+    def stream_workflow_with_cookies(self, video_url, cookies_dict, timeout=None):
+        """
+        以流式方式运行需要cookie的工作流
+        
+        返回:
+            WorkflowStream: 流式结果
+        """
+        parameters = self.build_cookie_parameters(video_url, cookies_dict)
+        if parameters.get("error"):
+            return WorkflowStream(iter([{"id": None, "event": "Error", "data": {"error_message": parameters["message"]}}]))
+        return WorkflowStream(self.stream_workflow(parameters, timeout=timeout))
             
-        return self.run_workflow(parameters) 
\ No newline at end of file
+    def run_workflow_with_cookies(self, video_url, cookies_dict, async_mode=False, on_progress=None, timeout=None, cancel=None):
+        """
+        运行需要cookie的工作流
+        
+        参数:
+            video_url (str): 视频URL
+            cookies_dict (dict): B站cookie字典
+            async_mode (bool): 是否以异步提交加轮询的方式运行
+            on_progress (callable): 异步模式下的进度回调
+            timeout (float): 本次调用的超时时间（秒），默认READ_TIMEOUT
+            cancel (CancelToken): 取消标记
+            
+        返回:
+            dict: API响应
+        """
+        parameters = self.build_cookie_parameters(video_url, cookies_dict)
+        if parameters.get("error"):
+            return parameters
+        
+        if async_mode:
+            return self.run_workflow_polling(parameters, timeout=timeout or READ_TIMEOUT, on_progress=on_progress, cancel=cancel)
+        return self.run_workflow(parameters, timeout=timeout, cancel=cancel) 
\ No newline at end of file
@@ -0,0 +1,221 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from mind_map import parse_outline, render_mind_map_html
+from render_artifacts import clean_summary_markdown, build_copy_payload
+from utils import canonical_video_url, cache_key_identity
+
+# 导出格式 -> (扩展名, MIME类型)
+EXPORT_FORMATS = {
+    "md": ("md", "text/markdown"),
+    "opml": ("opml", "text/x-opml"),
+    "xmind": ("xmind", "application/vnd.xmind.workbook"),
+    "html": ("html", "text/html"),
+}
+
+
+def build_opml(tree):
+    """
+    将大纲树转换为OPML，可导入大多数思维导图和大纲工具
+
+    参数:
+        tree (list): parse_outline返回的大纲树
+
+    返回:
+        bytes: OPML文件内容
+    """
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<opml version="2.0">',
+        f"  <head><title>{quoteattr(tree[0])[1:-1]}</title></head>",
+        "  <body>",
+    ]
+
+    def walk(node, depth):
+        indent = "  " * depth
+        if node[1]:
+            lines.append(f"{indent}<outline text={quoteattr(node[0])}>")
+            for child in node[1]:
+                walk(child, depth + 1)
+            lines.append(f"{indent}</outline>")
+        else:
+            lines.append(f"{indent}<outline text={quoteattr(node[0])}/>")
+
+    walk(tree, 2)
+    lines += ["  </body>", "</opml>", ""]
+    return "\n".join(lines).encode("utf-8")
+
+
+def build_xmind(tree):
+    """
+    将大纲树打包为XMind文件（content.json格式，XMind 8以后的版本可直接打开）
+
+    参数:
+        tree (list): parse_outline返回的大纲树
+
+    返回:
+        bytes: .xmind压缩包内容
+    """
+    # 编号和压缩包时间都固定，相同大纲生成的文件内容相同，按哈希存放时只保存一份
+    counter = iter(range(1, 1 << 30))
+
+    def topic(node):
+        data = {"id": f"topic-{next(counter)}", "class": "topic", "title": node[0]}
+        if node[1]:
+            data["children"] = {"attached": [topic(child) for child in node[1]]}
+        return data
+
+    content = [{
+        "id": "sheet-1",
+        "class": "sheet",
+        "title": tree[0],
+        "rootTopic": dict(topic(tree), structureClass="org.xmind.ui.map.unbalanced"),
+    }]
+    manifest = {"file-entries": {"content.json": {}, "metadata.json": {}}}
+    buffer = io.BytesIO()
+    entries = [
+        ("content.json", json.dumps(content, ensure_ascii=False)),
+        ("metadata.json", json.dumps({"creator": {"name": "biliv2mind"}})),
+        ("manifest.json", json.dumps(manifest)),
+    ]
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in entries:
+            info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, data)
+    return buffer.getvalue()
+
+
+def build_standalone_html(tree):
+    """
+    生成可离线打开的思维导图网页
+    """
+    title = quoteattr(tree[0])[1:-1]
+    return (
+        '<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="utf-8">\n'
+        f"<title>{title}</title>\n</head>\n<body>\n"
+        f"{render_mind_map_html(tree)}\n</body>\n</html>\n"
+    ).encode("utf-8")
+
+
+def build_export_bundle(summary, video_link):
+    """
+    生成一个结果的全部导出文件
+
+    参数:
+        summary (str): 工作流返回的AI总结
+        video_link (str): 视频链接，写入markdown的视频来源
+
+    返回:
+        dict: 格式 -> 文件内容(bytes)
+    """
+    summary_md = clean_summary_markdown(summary)
+    tree = parse_outline(summary_md)
+    return {
+        "md": build_copy_payload(summary_md, video_link).encode("utf-8"),
+        "opml": build_opml(tree),
+        "xmind": build_xmind(tree),
+        "html": build_standalone_html(tree),
+    }
+
+
+def save_export_bundles(export_store, results_store, batch):
+    """
+    生成导出文件并登记到对应的缓存条目，页面的后台写入线程、批处理和任务工作进程共用
+
+    参数:
+        export_store (ExportStore): 导出文件目录
+        results_store (ResultsStore): 结果库
+        batch (list): [(缓存键, AI总结)]
+    """
+    items = []
+    for key, summary in batch:
+        bundle = build_export_bundle(summary, canonical_video_url(cache_key_identity(key)))
+        items.append((key, {fmt: export_store.save(fmt, data) for fmt, data in bundle.items()}))
+    results_store.set_exports(items)
+
+
+def export_file_name(title, fmt):
+    """
+    根据总结标题生成下载文件名，去掉文件名中不允许的字符
+    """
+    name = re.sub(r'[\\/:*?"<>|\r\n]+', " ", title or "").strip()[:60] or "思维导图"
+    return f"{name}.{EXPORT_FORMATS[fmt][0]}"
+
+
+class ExportStore:
+    """
+    按内容哈希存放导出文件，相同内容只保存一份，下载时只需读取文件
+    """
+
+    def __init__(self, root):
+        """
+        初始化导出文件目录
+
+        参数:
+            root (str|Path): 存放导出文件的目录
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest, fmt):
+        return self.root / digest[:2] / f"{digest}.{EXPORT_FORMATS[fmt][0]}"
+
+    def save(self, fmt, data):
+        """
+        保存导出文件，已存在相同内容时直接返回
+
+        返回:
+            str: 内容的sha256
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, fmt)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # 先写临时文件再替换，读取方不会看到写了一半的文件
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return digest
+
+    def read(self, digest, fmt):
+        """
+        读取导出文件，不存在时返回None
+        """
+        try:
+            return self._path(digest, fmt).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def collect_garbage(self, referenced, min_age_seconds=3600):
+        """
+        删除不再被任何缓存条目引用的导出文件
+
+        参数:
+            referenced (set): 仍被引用的内容哈希
+            min_age_seconds (float): 只删除早于该时间的文件，避免删掉刚写入、尚未登记的文件
+
+        返回:
+            int: 删除的文件数
+        """
+        removed = 0
+        cutoff = time.time() - min_age_seconds
+        for path in self.root.glob("*/*"):
+            digest = path.name.split(".", 1)[0]
+            if digest in referenced:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,251 @@
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger("JobQueue")
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+_COLUMNS = (
+    "job_id", "key", "url", "user_id", "status", "attempts", "worker", "lease_expires",
+    "created_at", "updated_at", "message", "api_used", "tenant",
+)
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化任务队列，网页提交任务，独立的工作进程领取执行
+
+    同一视频同时只有一个排队或执行中的任务，重复提交返回已有任务。
+    工作进程通过租约领取任务，进程退出后租约过期，任务会被其他工作进程重新领取。
+    """
+
+    def __init__(self, db_path, max_attempts=3):
+        """
+        初始化任务队列
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            max_attempts (int): 任务最多被领取的次数，超过后标记为失败
+        """
+        self.db_path = str(db_path)
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self):
+        # 每个线程持有自己的连接，SQLite连接不能跨线程共享
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " user_id TEXT,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_expires REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " message TEXT,"
+            " api_used TEXT)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "tenant" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT")
+        # 同一视频只允许一个未完成的任务
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_key ON jobs(key) WHERE status IN ('queued', 'running')"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(key, created_at)")
+
+    @staticmethod
+    def _row_to_job(row):
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def _select(self, where, params):
+        return self._conn().execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE {where}", params)
+
+    def enqueue(self, key, url, user_id=None, tenant=None):
+        """
+        提交任务，该视频已有未完成的任务时直接返回该任务
+
+        参数:
+            key (str): 缓存键
+            url (str): 规范化后的视频链接
+            user_id (str): 提交者标识，任务成功后计入其调用次数
+            tenant (str): 提交时使用的访问密钥对应的租户，任务成功后计入该租户的调用次数
+
+        返回:
+            tuple: (任务, 是否新建)
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self._row_to_job(
+                self._select("key = ? AND status IN ('queued', 'running')", (key,)).fetchone()
+            )
+            if existing is None:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (job_id, key, url, user_id, tenant, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, url, user_id, tenant, JOB_QUEUED, now, now),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if existing is not None:
+            return existing, False
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        """
+        按任务ID查询任务，不存在时返回None
+        """
+        return self._row_to_job(self._select("job_id = ?", (job_id,)).fetchone())
+
+    def latest_for_key(self, key):
+        """
+        查询某个视频最近提交的任务
+        """
+        return self._row_to_job(
+            self._select("key = ? ORDER BY created_at DESC LIMIT 1", (key,)).fetchone()
+        )
+
+    def position(self, job_id):
+        """
+        查询排队任务前面还有多少个任务
+
+        返回:
+            int: 排在前面的任务数，任务不在排队状态时返回0
+        """
+        job = self.get(job_id)
+        if job is None or job["status"] != JOB_QUEUED:
+            return 0
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job["created_at"],)
+        ).fetchone()[0]
+
+    def claim(self, worker, lease_seconds):
+        """
+        领取排队任务；执行中但租约已过期的任务（工作进程已退出）也可被重新领取
+
+        同一提交者已在执行的任务越少越先领取，再按提交顺序，单个提交者批量提交时不会占满所有工作进程。
+
+        参数:
+            worker (str): 工作进程标识
+            lease_seconds (float): 租约时长，执行期间需定期调用heartbeat续约
+
+        返回:
+            dict: 领取到的任务，没有可领取的任务时返回None
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期且已达到最多领取次数的任务不再重试
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (JOB_FAILED, "任务多次执行中断，已放弃", now, now, self.max_attempts),
+            )
+            job = self._row_to_job(self._select(
+                "(status = 'queued') OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.status = 'running' AND r.lease_expires >= ? "
+                "AND r.user_id IS jobs.user_id), created_at LIMIT 1",
+                (now, now),
+            ).fetchone())
+            if job is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (JOB_RUNNING, worker, now + lease_seconds, now, job["job_id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if job is not None:
+            if job["status"] == JOB_RUNNING:
+                logger.warning(f"重新领取中断的任务 {job['job_id']}（原工作进程 {job['worker']}）")
+            job.update(status=JOB_RUNNING, worker=worker, attempts=job["attempts"] + 1)
+        return job
+
+    def heartbeat(self, job_id, worker, lease_seconds):
+        """
+        续约执行中的任务
+
+        返回:
+            bool: 是否仍持有该任务
+        """
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+            (now + lease_seconds, now, job_id, worker),
+        )
+        return cur.rowcount == 1
+
+    def finish(self, job_id, worker, status, message=None, api_used=None):
+        """
+        记录任务结果
+
+        参数:
+            job_id (str): 任务ID
+            worker (str): 工作进程标识，任务已被其他进程重新领取时不覆盖
+            status (str): JOB_DONE / JOB_FAILED
+            message (str): 失败原因或说明
+            api_used (str): 使用的工作流
+
+        返回:
+            bool: 是否写入成功
+        """
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = ?, message = ?, api_used = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE job_id = ? AND worker = ? AND status = 'running'",
+            (status, message, api_used, time.time(), job_id, worker),
+        )
+        return cur.rowcount == 1
+
+    def purge_finished(self, older_than_seconds):
+        """
+        删除完成超过指定时间的任务
+
+        返回:
+            int: 删除的任务数
+        """
+        cur = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - older_than_seconds,),
+        )
+        return cur.rowcount
+
+    def stats(self):
+        """
+        按状态统计任务数
+        """
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for status, count in self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
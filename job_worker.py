@@ -0,0 +1,165 @@
+"""
+执行任务队列中的视频处理任务，与网页进程分离运行
+
+用法:
+    python job_worker.py --workers 4
+    python job_worker.py --workers 2 --rate 6 --storage ./storage
+
+页面配置 JOB_QUEUE_MODE = true 后，提交的视频会写入任务队列，由本程序的工作进程执行。
+工作进程数量决定同时处理的视频数，可与网页分开部署和扩容；Ctrl+C 会在当前任务完成后退出。
+"""
+import os
+import sys
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+
+from cache_store import open_results_store
+from usage_store import UsageStore
+from exports import ExportStore
+from singleflight import SingleFlight
+from job_queue import JobQueue, JOB_DONE, JOB_FAILED
+from tenants import DEFAULT_TENANT, tenant_usage_id
+from batch_warm import (
+    load_service_config, build_runner, build_rate_limiter, build_admission, build_router, process_one,
+    negative_cache_ttl, result_ttl_seconds, pinned_ttl, RateLimiter, STATUS_DONE, STATUS_FAILED,
+)
+
+logger = logging.getLogger("JobWorker")
+
+# 任务租约时长（秒），执行期间每隔三分之一续约一次
+JOB_LEASE_SECONDS = 120
+# 队列为空时的轮询间隔（秒）
+POLL_INTERVAL = 1.0
+# 已完成任务的保留时间（秒）
+FINISHED_RETENTION_SECONDS = 7 * 86400
+
+
+def run_job(job, queue, worker, process):
+    """
+    执行单个任务，期间由后台线程续约
+
+    参数:
+        job (dict): 领取到的任务
+        queue (JobQueue): 任务队列
+        worker (str): 工作进程标识
+        process (callable): 任务 -> (状态, 说明)
+
+    返回:
+        tuple: (状态, 说明)
+    """
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(JOB_LEASE_SECONDS / 3):
+            if not queue.heartbeat(job["job_id"], worker, JOB_LEASE_SECONDS):
+                logger.warning(f"任务 {job['job_id']} 的租约已失效")
+                return
+
+    thread = threading.Thread(target=heartbeat, name=f"job-heartbeat-{job['job_id'][:8]}", daemon=True)
+    thread.start()
+    try:
+        return process(job)
+    except Exception as e:
+        logger.error(f"任务 {job['job_id']} 执行异常: {e}")
+        return STATUS_FAILED, str(e)
+    finally:
+        done.set()
+        thread.join()
+
+
+def worker_loop(index, args, stop):
+    """
+    工作进程主循环：领取任务、执行、写入结果缓存和调用次数
+    """
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker-{index}] %(message)s")
+    logger.setLevel(logging.INFO)
+    # 由父进程统一处理退出信号，子进程在当前任务完成后退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    service = load_service_config(args.secrets)
+    storage = Path(args.storage)
+    store = open_results_store(storage, default_ttl_seconds=result_ttl_seconds(service))
+    usage_store = UsageStore(storage / "usage.db")
+    queue = JobQueue(storage / "jobs.db")
+    runner = build_runner(service, rate_limiter=build_rate_limiter(service, storage))
+    admission = build_admission(service, storage)
+    router = build_router(service, storage)
+    single_flight = SingleFlight(store=store)
+    limiter = RateLimiter(args.rate)
+    negative_ttl = negative_cache_ttl(service)
+    pinned = pinned_ttl(service)
+    exports = ExportStore(storage / "exports")
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    def process(job):
+        return process_one(
+            job["key"], job["url"], runner, store, single_flight, limiter, negative_ttl, admission,
+            tenant=job["tenant"] or DEFAULT_TENANT, identity=job["user_id"], router=router,
+            pinned=pinned, exports=exports,
+        )
+
+    if index == 0:
+        queue.purge_finished(FINISHED_RETENTION_SECONDS)
+    logger.info(f"工作进程 {worker} 已启动")
+    while not stop.is_set():
+        job = queue.claim(worker, JOB_LEASE_SECONDS)
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+        logger.info(f"开始任务 {job['job_id']} {job['url']}（第{job['attempts']}次）")
+        status, message = run_job(job, queue, worker, process)
+        # 与页面一致：只有实际调用工作流并成功时才计入提交者的调用次数
+        if status == STATUS_DONE:
+            if job["user_id"]:
+                usage_store.increment(job["user_id"])
+            if job["tenant"]:
+                usage_store.increment(tenant_usage_id(job["tenant"]))
+        if status == STATUS_FAILED:
+            queue.finish(job["job_id"], worker, JOB_FAILED, message=message)
+        else:
+            queue.finish(job["job_id"], worker, JOB_DONE, api_used=message or None)
+        logger.info(f"[{status}] 任务 {job['job_id']} {message}")
+    logger.info(f"工作进程 {worker} 已退出")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="执行任务队列中的B站视频处理任务")
+    parser.add_argument("--workers", type=int, default=2, help="工作进程数")
+    parser.add_argument("--rate", type=float, default=0, help="每个工作进程每分钟最多开始处理的视频数，0为不限")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="配置文件路径")
+    parser.add_argument("--storage", default="./storage", help="存储目录，与页面保持一致")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [main] %(message)s")
+    logger.setLevel(logging.INFO)
+    Path(args.storage).mkdir(exist_ok=True)
+
+    # 使用spawn启动，子进程各自打开数据库连接和HTTP连接池
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    processes = [
+        ctx.Process(target=worker_loop, args=(i, args, stop), name=f"job-worker-{i}")
+        for i in range(max(1, args.workers))
+    ]
+    for p in processes:
+        p.start()
+
+    def shutdown(signum, frame):
+        logger.info("收到退出信号，等待当前任务完成")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    for p in processes:
+        p.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
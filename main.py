@@ -1,21 +1,42 @@
 import streamlit as st
-import json
 import time
 import os
-import pickle
 import base64
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 import hashlib
-from coze_api import CozeAPI
-from utils import truncate_text, get_current_time, parse_workflow_response, parse_bilibili_url
+from coze_api import CozeAPI, get_pool_stats
+from usage_store import UsageStore
+from cache_store import MemoryCache, ExpirySweeper, open_results_store, has_transcript, make_metadata, entry_expires_at
+from write_behind import WriteBehind
+from singleflight import SingleFlight
+from workflow_runner import WorkflowRunner, PRIMARY_API, BACKUP_API, FAILED_MESSAGE, to_result_data, is_content_failure
+from retry_policy import RetryPolicy, classify_result
+from utils import truncate_text, get_current_time, parse_video_identity, canonical_video_url, make_cache_key, cache_key_bvid, cache_key_identity
+from render_artifacts import build_render_artifacts, COPY_BUTTON_HEIGHT
+from mind_map import MIND_MAP_HEIGHT
+from transcript_index import TranscriptIndex
+from job_queue import JobQueue, JOB_QUEUED, JOB_DONE, ACTIVE_STATUSES
+from exports import ExportStore, EXPORT_FORMATS, save_export_bundles, export_file_name
+from search_index import summary_title
+from cancellation import CancelToken, cancelled_result, is_cancelled_result
+from admission import AdmissionController, TokenBucketLimiter
+from tenants import DEFAULT_TENANT, load_tenants, tenant_weights, tenant_usage_id
+from workflow_router import WorkflowRouter, ROUTE_ASR
+from batch_warm import pinned_ttl, stamp_result
 import streamlit.components.v1 as components
+# 脚本运行控制异常：会话关闭或用户停止时抛出StopException，页面交互触发重跑时抛出RerunException
+from streamlit.runtime.scriptrunner import StopException, RerunException
+
+# 结果面板放在片段中重跑；1.37之前的版本只提供experimental_fragment
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
 
 # 从 .streamlit/secrets.toml 中读取配置
 BOT_ID = st.secrets["my_service"]["BOT_ID"]
 COZE_API_TOKEN = st.secrets["my_service"]["COZE_API_TOKEN"]
 API_URL = st.secrets["my_service"]["API_URL"]
-ACCESS_KEY = st.secrets["my_service"]["ACCESS_KEY"]
+# 访问密钥：单个ACCESS_KEY，或 ACCESS_KEYS 中按租户配置的多个密钥（各自的每日额度和排队权重），见tenants.py
+TENANTS = load_tenants(st.secrets["my_service"])
 
 # 新BOT配置
 NEW_BOT_ID = st.secrets["my_service"]["NEW_BOT_ID"]  # "7530822380694323240"
@@ -33,10 +54,54 @@ for cookie in optional_cookies:
     if cookie in st.secrets["my_service"]:
         BILI_COOKIES[cookie] = st.secrets["my_service"][cookie]
 
+# 结果缓存配置
+RESULT_TTL_DAYS = int(st.secrets["my_service"].get("RESULT_TTL_DAYS", 14))  # 结果缓存保留天数
+# 置顶课程的BV号（PINNED_VIDEOS）按更长时间保留（PINNED_TTL_DAYS），与批处理和任务工作进程共用同一配置
+PINNED = pinned_ttl(st.secrets["my_service"])
+PINNED_VIDEOS = PINNED[0]
+NEGATIVE_CACHE_MINUTES = float(st.secrets["my_service"].get("NEGATIVE_CACHE_MINUTES", 30))  # 解析失败的视频首次退避时间
+NEGATIVE_CACHE_MAX_HOURS = float(st.secrets["my_service"].get("NEGATIVE_CACHE_MAX_HOURS", 24))  # 连续失败时的退避上限
+EXPIRY_SWEEP_SECONDS = float(st.secrets["my_service"].get("EXPIRY_SWEEP_SECONDS", 300))  # 过期缓存清理间隔
+WRITE_BEHIND_FLUSH_SECONDS = float(st.secrets["my_service"].get("WRITE_BEHIND_FLUSH_SECONDS", 1.0))  # 后台批量写入间隔
+WRITE_BEHIND_SYNC = st.secrets["my_service"].get("WRITE_BEHIND_SYNC", "NORMAL")  # 落盘策略 OFF / NORMAL / FULL
+MEMORY_CACHE_MAX_MB = int(st.secrets["my_service"].get("MEMORY_CACHE_MAX_MB", 256))  # 进程内存缓存预算
+
+# 工作流以异步提交加轮询的方式运行，等待期间可显示进度
+WORKFLOW_ASYNC_MODE = bool(st.secrets["my_service"].get("WORKFLOW_ASYNC_MODE", True))
+
+# 流式模式：新API以流式接口调用，AI总结边生成边显示
+WORKFLOW_STREAM_MODE = bool(st.secrets["my_service"].get("WORKFLOW_STREAM_MODE", False))
+
+# 任务队列模式：提交的视频写入任务队列，由 job_worker.py 的工作进程处理，页面按任务ID轮询状态
+JOB_QUEUE_MODE = bool(st.secrets["my_service"].get("JOB_QUEUE_MODE", False))
+JOB_POLL_SECONDS = float(st.secrets["my_service"].get("JOB_POLL_SECONDS", 2))
+
+# 全局限流：按工作流ID的每分钟调用次数（如 WORKFLOW_RATE_LIMITS = { "7530822380694323240" = 20 }），
+# 以及整个部署同时处理的视频数和排队上限，页面、任务工作进程和批处理共用
+WORKFLOW_RATE_LIMITS = dict(st.secrets["my_service"].get("WORKFLOW_RATE_LIMITS", {}))
+WORKFLOW_RATE_BURST = int(st.secrets["my_service"].get("WORKFLOW_RATE_BURST", 3))
+MAX_CONCURRENT_RUNS = int(st.secrets["my_service"].get("MAX_CONCURRENT_RUNS", 8))  # 0为不限
+ADMISSION_QUEUE_SIZE = int(st.secrets["my_service"].get("ADMISSION_QUEUE_SIZE", 20))
+BUSY_MESSAGE = "当前处理的视频较多，请稍后再试"
+
+# 字幕/语音识别路由：auto按历史结果预测，预计字幕提取会失败时直接语音识别；
+# subtitle总是先提取字幕（原有顺序），asr总是直接语音识别；ROUTE_OVERRIDES按BV号单独指定
+ROUTING_MODE = st.secrets["my_service"].get("ROUTING_MODE", "auto")
+ROUTE_OVERRIDES = dict(st.secrets["my_service"].get("ROUTE_OVERRIDES", {}))
+ROUTING_FETCH_META = bool(st.secrets["my_service"].get("ROUTING_FETCH_META", True))  # 读取UP主、分区和CC字幕信息
+ROUTING_EXPLORE_RATE = float(st.secrets["my_service"].get("ROUTING_EXPLORE_RATE", 0.05))  # 预测为语音识别时仍先提取字幕的比例
+
 # API调用次数限制
 MAX_PRIMARY_RETRY = 2  # 新API最多调用2次
 MAX_BACKUP_RETRY = 2   # 旧API最多调用2次
 
+# 单次视频处理的总时间预算（秒），在各次调用之间分配
+WORKFLOW_DEADLINE_SECONDS = float(st.secrets["my_service"].get("WORKFLOW_DEADLINE_SECONDS", 1800))
+
+# 对冲延迟：新API超过该秒数仍未成功时并行启动旧API，未配置则按顺序回退
+HEDGE_DELAY_SECONDS = st.secrets["my_service"].get("HEDGE_DELAY_SECONDS")
+if HEDGE_DELAY_SECONDS is not None: HEDGE_DELAY_SECONDS = float(HEDGE_DELAY_SECONDS)
+
 # 定义Bilibili小电视图标SVG
 bili_svg = """
 <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1024 1024">
@@ -297,6 +362,44 @@ st.markdown("""
         font-size: 0.9rem;
         line-height: 1.5;
     }
+
+    /* 只影响AI总结tab内的markdown标题 */
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h1 {
+        font-size: 1.5rem !important;
+        text-align: center !important;
+        color: #18191C !important;
+        font-weight: 700 !important;
+    }
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h2 {
+        font-size: 1.2rem !important;
+        text-align: left !important;
+        color: #18191C !important;
+        font-weight: 600 !important;
+    }
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h3 {
+        font-size: 1.1rem !important;
+        text-align: left !important;
+        color: #18191C !important;
+        font-weight: 600 !important;
+    }
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h4 {
+        font-size: 1rem !important;
+        text-align: left !important;
+        color: #18191C !important;
+        font-weight: 600 !important;
+    }
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h5 {
+        font-size: 0.95rem !important;
+        text-align: left !important;
+        color: #18191C !important;
+        font-weight: 600 !important;
+    }
+    div[data-testid="stTabs"] div[data-testid="stMarkdown"] h6 {
+        font-size: 0.9rem !important;
+        text-align: left !important;
+        color: #18191C !important;
+        font-weight: 600 !important;
+    }
 </style>
 """, unsafe_allow_html=True)
 
@@ -304,7 +407,8 @@ st.markdown("""
 STORAGE_DIR = Path("./storage")
 STORAGE_DIR.mkdir(exist_ok=True)
 USAGE_FILE = STORAGE_DIR / "usage_data.pkl"
-RESULTS_CACHE_FILE = STORAGE_DIR / "results_cache.pkl"
+USAGE_DB_FILE = STORAGE_DIR / "usage.db"
+USAGE_RETENTION_DAYS = 30  # 调用记录保留天数
 
 def get_user_identifier():
     try:
@@ -316,224 +420,494 @@ def get_user_identifier():
     identifier = f"{client_ip}_{today}"
     return hashlib.md5(identifier.encode()).hexdigest()
     
-def load_usage_data():
-    if USAGE_FILE.exists():
-        try:
-            with open(USAGE_FILE, "rb") as f: return pickle.load(f)
-        except: return {}
-    return {}
-
-def load_results_cache():
-    if RESULTS_CACHE_FILE.exists():
-        try:
-            with open(RESULTS_CACHE_FILE, "rb") as f:
-                return pickle.load(f)
-        except (pickle.UnpicklingError, EOFError, ValueError):
-            return {}
-    return {}
-
-def save_usage_data(data):
-    with open(USAGE_FILE, "wb") as f: pickle.dump(data, f)
-
-def save_results_cache(data):
-    with open(RESULTS_CACHE_FILE, "wb") as f:
-        pickle.dump(data, f)
-    
+@st.cache_resource
+def get_usage_store():
+    # 调用次数计数库，首次创建时从旧pickle文件迁移
+    return UsageStore(USAGE_DB_FILE, retention_days=USAGE_RETENTION_DAYS, legacy_pickle=USAGE_FILE)
+
+@st.cache_resource
+def get_results_store():
+    # 进程内共享同一个结果库，首次创建时从旧pickle文件迁移并升级缓存键
+    return open_results_store(STORAGE_DIR, default_ttl_seconds=RESULT_TTL_DAYS * 86400)
+
+@st.cache_resource
+def get_job_queue():
+    # 任务队列与 job_worker.py 共用同一个数据库
+    return JobQueue(STORAGE_DIR / "jobs.db")
+
+@st.cache_resource
+def get_admission():
+    # 并发上限和排队，与 job_worker.py、batch_warm.py 共用同一个数据库
+    if MAX_CONCURRENT_RUNS <= 0:
+        return None
+    return AdmissionController(
+        STORAGE_DIR / "admission.db", MAX_CONCURRENT_RUNS, ADMISSION_QUEUE_SIZE, weights=tenant_weights(TENANTS)
+    )
+
+@st.cache_resource
+def get_rate_limiter():
+    if not WORKFLOW_RATE_LIMITS:
+        return None
+    return TokenBucketLimiter(STORAGE_DIR / "admission.db", WORKFLOW_RATE_LIMITS, burst=WORKFLOW_RATE_BURST)
+
+@st.cache_resource
+def get_router():
+    # 路由统计与 job_worker.py、batch_warm.py 共用同一个数据库
+    return WorkflowRouter(
+        STORAGE_DIR / "routing.db", cookies=BILI_COOKIES, mode=ROUTING_MODE, overrides=ROUTE_OVERRIDES,
+        fetch_meta=ROUTING_FETCH_META, explore_rate=ROUTING_EXPLORE_RATE,
+    )
+
+@st.cache_resource
+def get_export_store():
+    # 导出文件按内容哈希存放在存储目录下
+    return ExportStore(STORAGE_DIR / "exports")
+
+@st.cache_resource
+def get_expiry_sweeper():
+    # 后台定期清理过期缓存，写入结果时不再扫描
+    return ExpirySweeper(get_results_store(), interval=EXPIRY_SWEEP_SECONDS, exports=get_export_store()).start()
+
+@st.cache_resource
+def get_memory_cache():
+    # 所有会话共享的内存缓存，避免每个会话各自持有一份结果
+    return MemoryCache(MEMORY_CACHE_MAX_MB * 1024 * 1024, RESULT_TTL_DAYS * 86400)
+
+@st.cache_resource
+def get_write_behind():
+    # 结果和调用计数由后台线程合并后批量写入，请求路径不等待磁盘
+    store = get_results_store()
+    usage_store = get_usage_store()
+    export_store = get_export_store()
+    writer = WriteBehind(flush_interval=WRITE_BEHIND_FLUSH_SECONDS, sync_mode=WRITE_BEHIND_SYNC)
+    writer.add_thread_init(lambda: store.set_synchronous(WRITE_BEHIND_SYNC))
+    writer.add_thread_init(lambda: usage_store.set_synchronous(WRITE_BEHIND_SYNC))
+    # 按注册顺序写入：先写结果，再释放租约，其他进程拿到租约时结果已落盘
+    writer.register("result", store.put_many)
+    writer.register(
+        "usage",
+        lambda batch: usage_store.increment_many([(uid, amount, when) for uid, (amount, when) in batch]),
+        merge=lambda old, new: (old[0] + new[0], max(old[1], new[1])),
+    )
+    writer.register("lease_release", lambda batch: [store.release_lease(key, owner) for (key, owner), _ in batch])
+    # 导出文件生成较慢，放在最后，不推迟租约释放
+    writer.register("export", lambda batch: save_export_bundles(export_store, store, batch))
+    return writer
+
+@st.cache_resource
+def get_single_flight():
+    # 进程内共享的请求合并器，借助结果库的租约表跨进程合并
+    writer = get_write_behind()
+    return SingleFlight(
+        store=get_results_store(),
+        release_hook=lambda key, owner: writer.submit("lease_release", (key, owner), True),
+    )
+
 def get_user_usage(user_id):
-    usage_data = load_usage_data()
-    if user_id not in usage_data:
-        usage_data[user_id] = {"call_count": 0, "last_call_time": None, "call_history": {}}
-        save_usage_data(usage_data)
-    return usage_data[user_id]
+    # 按主键读取当天计数，不存在时不写入；加上尚未写入的次数
+    usage = get_usage_store().get(user_id)
+    pending = get_write_behind().peek("usage", user_id)
+    if pending:
+        usage["call_count"] += pending[0]
+        usage["last_call_time"] = pending[1]
+    return usage
     
-def update_user_usage(user_id, call_count=None, last_call_time=None, call_history=None):
-    usage_data = load_usage_data()
-    if user_id not in usage_data: usage_data[user_id] = {"call_count": 0, "last_call_time": None, "call_history": {}}
-    if call_count is not None: usage_data[user_id]["call_count"] = call_count
-    if last_call_time is not None: usage_data[user_id]["last_call_time"] = last_call_time
-    if call_history is not None: usage_data[user_id]["call_history"] = call_history
-    save_usage_data(usage_data)
+def update_user_usage(user_id, tenant=None):
+    # 计数由后台线程写入，返回包含本次调用的最新次数；同时计入访问密钥所属租户的次数
+    now = datetime.now()
+    get_write_behind().submit("usage", user_id, (1, now))
+    if tenant:
+        get_write_behind().submit("usage", tenant_usage_id(tenant), (1, now))
+    return get_user_usage(user_id)["call_count"]
     
+# 每个进程启动一次过期清理线程
+get_expiry_sweeper()
+
 user_id = get_user_identifier()
 user_usage = get_user_usage(user_id)
-if 'call_count' not in st.session_state: st.session_state.call_count = user_usage["call_count"]
-if 'last_call_time' not in st.session_state: st.session_state.last_call_time = user_usage["last_call_time"]
+# 计数读取很轻，每次重跑都刷新，多个标签页共用同一计数
+st.session_state.call_count = user_usage["call_count"]
+st.session_state.last_call_time = user_usage["last_call_time"]
 if 'is_processing' not in st.session_state: st.session_state.is_processing = False
 if 'result_data' not in st.session_state: st.session_state.result_data = None
+if 'result_key' not in st.session_state: st.session_state.result_key = None
 if 'video_url' not in st.session_state: st.session_state.video_url = ""
 if 'access_key' not in st.session_state: st.session_state.access_key = ""
+if 'tenant' not in st.session_state: st.session_state.tenant = DEFAULT_TENANT
+# 任务ID同时写在链接中，关闭页面后重新打开可继续查看
+if 'job_id' not in st.session_state: st.session_state.job_id = st.query_params.get("job")
 
 # --- 配置 ---
 MAX_CALLS_PER_SESSION = 50
 
 # --- API 调用和缓存逻辑 ---
-def check_call_limits():
+def check_call_limits(tenant):
+    # 提交时重新读取，其他标签页或进程的调用也计入
+    st.session_state.call_count = get_user_usage(user_id)["call_count"]
     if st.session_state.call_count >= MAX_CALLS_PER_SESSION:
         return False, f"今日调用次数已达上限（{MAX_CALLS_PER_SESSION}次），请明天再来。"
+    # 访问密钥的每日额度由使用该密钥的所有用户共享
+    quota = tenant["daily_quota"]
+    if quota and get_user_usage(tenant_usage_id(tenant["name"]))["call_count"] >= quota:
+        return False, f"该访问密钥今日调用次数已达上限（{quota}次），请明天再来。"
     return True, ""
 
 def check_cache(key):
-    # 优先检查会话缓存（速度最快）
-    if key in st.session_state:
-        return st.session_state[key]
+    # 优先检查进程内共享缓存（速度最快）
+    memory_cache = get_memory_cache()
+    result = memory_cache.get(key)
+    if result:
+        return result
     
-    # 然后检查持久化文件缓存
-    cache_data = load_results_cache()
-    result = cache_data.get(key)
+    # 然后检查持久化缓存
+    result = get_results_store().get(key)
     if result:
-        # 如果在文件缓存中找到，将其加载到会话缓存中以便下次快速访问
-        st.session_state[key] = result
+        # 如果在持久化缓存中找到，放入共享内存缓存，过期时间与持久化记录保持一致
+        memory_cache.put(key, result, expires_at=entry_expires_at(result, RESULT_TTL_DAYS * 86400))
     return result
 
 def cache_result(key, result):
-    # 增加时间戳
-    from datetime import datetime, timedelta
-    now = datetime.now()
+    # 增加时间戳，置顶课程保留更久，过期清理由后台线程完成
     if isinstance(result, dict):
-        result = result.copy()
-        result['timestamp'] = now
-    st.session_state[key] = result
-    cache_data = load_results_cache()
-    cache_data[key] = result
-    # 清理只保留14天内的缓存
-    cutoff = now - timedelta(days=14)
-    keys_to_delete = []
-    for k, v in cache_data.items():
-        ts = v.get('timestamp') if isinstance(v, dict) else None
-        if ts and isinstance(ts, datetime):
-            if ts < cutoff:
-                keys_to_delete.append(k)
-        elif ts and isinstance(ts, str):
-            # 兼容字符串时间戳
-            try:
-                tsv = datetime.fromisoformat(ts)
-                if tsv < cutoff:
-                    keys_to_delete.append(k)
-            except Exception:
-                pass
-    for k in keys_to_delete:
-        del cache_data[k]
-    save_results_cache(cache_data)
+        result = stamp_result(key, result, PINNED)
+    # 内存缓存立即可见且只保留元数据，持久化交给后台线程
+    metadata = make_metadata(result)
+    get_memory_cache().put(key, metadata, expires_at=entry_expires_at(metadata, RESULT_TTL_DAYS * 86400))
+    get_write_behind().submit("result", key, result)
+    if isinstance(result, dict):
+        get_write_behind().submit("export", key, result.get("summary", ""))
+    # 写入时预先生成渲染内容，之后的重跑直接复用
+    if isinstance(metadata, dict):
+        get_render_artifacts(key, metadata)
+    return metadata
+
+@st.cache_data(max_entries=16, ttl=3600, show_spinner=False)
+def load_transcript(key):
+    # 逐字稿只在渲染逐字稿标签页时解压，同一视频在进程内只解压一次
+    return get_results_store().get_transcript(key)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _render_artifacts(key, timestamp, _summary):
+    # 按缓存键和写入时间缓存，同一结果的派生内容只计算一次；
+    # 内容生成后不再变化，所有会话共用同一份，重跑时不再序列化复制
+    return build_render_artifacts(_summary, canonical_video_url(cache_key_identity(key)))
+
+def get_render_artifacts(key, result):
+    """
+    获取结果面板的派生内容：清理后的总结、复制内容和复制按钮HTML
+    """
+    return _render_artifacts(key, result.get("timestamp"), result.get("summary", "未能生成AI总结。"))
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def read_export(digest, fmt):
+    # 导出文件按内容哈希命名，内容不会变化，可以放心缓存
+    return get_export_store().read(digest, fmt)
+
+def render_exports(key, result):
+    """
+    显示导出文件的下载按钮，尚未生成时在后台生成
+    """
+    digests = get_results_store().get_exports(key)
+    if not digests:
+        writer = get_write_behind()
+        # 旧缓存条目没有导出文件，首次查看时补生成
+        if writer.peek("export", key) is None:
+            writer.submit("export", key, result.get("summary", ""))
+        st.caption("导出文件生成中，稍后刷新即可下载。")
+        return
+    title = summary_title(result.get("summary"))
+    labels = {"md": "Markdown", "opml": "OPML", "xmind": "XMind", "html": "网页导图"}
+    for column, fmt in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS):
+        data = read_export(digests[fmt], fmt) if fmt in digests else None
+        if data is None:
+            continue
+        column.download_button(
+            f"⬇️ {labels[fmt]}", data=data, file_name=export_file_name(title, fmt),
+            mime=EXPORT_FORMATS[fmt][1], key=f"export_{fmt}", use_container_width=True,
+        )
+
+def get_transcript(key):
+    # 结果尚未落盘时直接从待写入队列读取，避免把空值缓存下来
+    pending = get_write_behind().peek("result", key)
+    if pending:
+        return pending.get("transcript")
+    return load_transcript(key)
+
+def to_failure_result(failure):
+    # 将失败记录转换为页面展示的错误信息
+    retry_at = datetime.fromtimestamp(failure["retry_after"]).strftime("%H:%M")
+    return {
+        "error": True,
+        "message": f"{failure['message']}（该视频近期已解析失败，请于 {retry_at} 后再试）",
+        "negative_cache": True,
+    }
+
+def check_failure(key):
+    # 近期解析失败且仍在退避期内的视频直接返回失败，不再调用工作流
+    failure = get_results_store().get_failure(key)
+    return to_failure_result(failure) if failure else None
+
+def record_failure(key, message):
+    # 记录视频本身导致的失败，连续失败时退避时间加倍
+    failure = get_results_store().record_failure(
+        key, message, NEGATIVE_CACHE_MINUTES * 60, NEGATIVE_CACHE_MAX_HOURS * 3600
+    )
+    return to_failure_result(failure)
+
+def lookup_result(key):
+    # 等待其他进程处理同一视频后读取结果，失败记录同样视为已有结果
+    return get_results_store().get(key) or check_failure(key)
+
+def invalidate_cache(key):
+    # 同时清除内存、待写入和持久化缓存
+    get_memory_cache().delete(key)
+    get_write_behind().discard("result", key)
+    get_results_store().delete(key)
     
-def try_run_workflow(video_url):
+def new_run(cache_key):
+    # 本次处理的状态，见guard_session_ui
+    return {"key": cache_key, "cancel": CancelToken(), "detached": False, "tenant": st.session_state.tenant,
+            "rerun": None}
+
+def process_video(cache_key, parsed_url, run):
+    """
+    取得处理名额后调用工作流处理视频，成功时写入缓存
+
+    参数:
+        cache_key (str): 缓存键
+        parsed_url (str): 规范化后的视频链接
+        run (dict): new_run()创建的处理状态
+
+    返回:
+        dict: 结果数据或错误信息
+    """
+    permit = wait_for_admission(run)
+    if permit is False:
+        return {"error": True, "message": BUSY_MESSAGE}
+    if run["cancel"].cancelled:
+        return {"error": True, "message": "处理已取消"}
+    try:
+        return run_workflows(cache_key, parsed_url, run)
+    finally:
+        if permit is not None:
+            permit.release()
+
+def wait_for_admission(run):
+    """
+    取得处理名额，名额已满时按访问密钥和用户公平排队，并显示前面的请求数和预计等待时间
+
+    参数:
+        run (dict): 本次处理的状态，见guard_session_ui
+
+    返回:
+        Permit: 处理名额；未启用并发上限或排队时被取消返回None，队列已满返回False
+    """
+    admission = get_admission()
+    if admission is None:
+        return None
+    queue_area = {}
+
+    def show(ahead, eta):
+        if "area" not in queue_area:
+            queue_area["area"] = st.empty()
+        queue_area["area"].info(f"⏳ 排队中，前面还有 {ahead} 个视频，预计等待约 {int(eta // 60) + 1} 分钟...")
+
+    permit = admission.admit(
+        cancel=run["cancel"], on_wait=lambda ahead, eta: guard_session_ui(run, lambda: show(ahead, eta)),
+        tenant=run["tenant"], identity=user_id,
+    )
+    if "area" in queue_area:
+        guard_session_ui(run, queue_area["area"].empty)
+    if permit is None and not run["cancel"].cancelled:
+        return False
+    return permit
+
+def render_route(decision):
+    """
+    显示路由结果，展开后可查看各统计范围的历史结果
+    """
+    route_label = "直接进行语音识别" if decision["route"] == ROUTE_ASR else "先提取视频脚本"
+    st.caption(f"🧭 {route_label}：{decision['reason']}")
+    with st.expander("路由依据"):
+        st.table([
+            {
+                "范围": item["scope"],
+                "字幕提取成功": item["ok"],
+                "字幕为空": item["empty"],
+                "预计成功率": f"{item['estimate']:.0%}",
+                "字幕提取平均耗时(秒)": item["avg_seconds"][PRIMARY_API],
+                "语音识别平均耗时(秒)": item["avg_seconds"][BACKUP_API],
+            }
+            for item in decision["evidence"]
+        ])
+
+def run_workflows(cache_key, parsed_url, run):
+    """
+    调用工作流并写入缓存，参数与返回值同process_video
+    """
+    # 按历史结果决定先提取字幕还是直接语音识别，失败后再尝试另一个
+    router = get_router()
+    features, decision = router.plan(cache_key_bvid(cache_key))
+    run["route"] = decision["route"]
+    run["on_attempt"] = router.observer(features)
+    guard_session_ui(run, lambda: render_route(decision))
+    if run["cancel"].cancelled:
+        # 会话在调用工作流之前已结束，不再发起调用
+        return {"error": True, "message": cancelled_result(run["cancel"].reason)["message"]}
+
+    result, success, api_used = None, False, None
+    if WORKFLOW_STREAM_MODE and decision["route"] != ROUTE_ASR:
+        result, success, api_used = try_stream_workflow(parsed_url, run)
+        if result is not None and not success and not is_cancelled_result(result):
+            # 字幕工作流刚以流式方式失败，接下来直接语音识别，不再重复调用
+            run["primary_outcome"] = classify_result(result)
+    if not success:
+        if run["cancel"].cancelled:
+            result = cancelled_result(run["cancel"].reason)
+        else:
+            result, success, api_used = try_run_workflow(parsed_url, run)
+    if not success:
+        if is_cancelled_result(result):
+            return {"error": True, "message": result.get("message")}
+        if is_content_failure(result):
+            return record_failure(cache_key, result.get("message"))
+        return {"error": True, "message": result.get("message")}
+
+    st.session_state.call_count = update_user_usage(user_id, run["tenant"])
+    st.session_state.last_call_time = datetime.now()
+
+    data = to_result_data(result, api_used)
+    if data.get("error"):
+        return data
+
+    # 会话可能已经结束，这里之后不再输出页面元素，数据来源由调用方显示
+    return cache_result(cache_key, data)
+
+def result_still_wanted(key):
+    """
+    会话结束后是否仍需完成处理：有其他会话在等待同一视频，或视频属于需要预热缓存的置顶课程
+    （其他进程中的等待者无法感知，它们会在租约释放后自行接手）
+    """
+    return get_single_flight().waiters(key) > 0 or cache_key_bvid(key) in PINNED_VIDEOS
+
+def guard_session_ui(run, render):
+    """
+    在处理期间刷新页面；会话关闭或用户停止后不再刷新，结果无人需要时取消处理
+
+    参数:
+        run (dict): 本次处理的状态 {"key", "cancel", "detached", "tenant", "rerun"}；
+            处理期间用户操作页面触发的重跑记录在rerun中，由调用方在处理结束后重新抛出
+        render (callable): 刷新页面的函数
+    """
+    if run["detached"]:
+        return
+    try:
+        render()
+    except StopException:
+        run["detached"] = True
+        if not result_still_wanted(run["key"]):
+            run["cancel"].cancel("session_abandoned")
+    except RerunException as e:
+        # 会话仍在，只是用户操作了页面：继续处理，结束后按这次操作重跑，不丢失控件状态
+        run["detached"] = True
+        run["rerun"] = e
+
+@st.cache_resource
+def get_coze_client(workflow_id):
+    # 每个工作流一个客户端，所有会话共享，底层复用同一个连接池
+    return CozeAPI(API_URL, COZE_API_TOKEN, workflow_id)
+
+@st.cache_resource
+def get_workflow_runner():
+    # 所有会话共享的工作流调度器，对冲统计在进程内累计
+    return WorkflowRunner(
+        get_coze_client(NEW_BOT_ID) if NEW_BOT_ID else None,
+        get_coze_client(BOT_ID),
+        BILI_COOKIES,
+        async_mode=WORKFLOW_ASYNC_MODE,
+        hedge_delay=HEDGE_DELAY_SECONDS,
+        primary_policy=RetryPolicy(max_attempts=MAX_PRIMARY_RETRY, base_delay=1.0, retry_on_empty=False),
+        backup_policy=RetryPolicy(max_attempts=MAX_BACKUP_RETRY, base_delay=3.0),
+        deadline_seconds=WORKFLOW_DEADLINE_SECONDS,
+        rate_limiter=get_rate_limiter(),
+    )
+
+def try_stream_workflow(video_url, run):
     """
-    尝试运行工作流，先尝试新API，如果失败则回退到旧API
+    以流式方式调用新API，AI总结边生成边显示
     
     参数:
         video_url (str): 视频URL
+        run (dict): 本次处理的状态，见guard_session_ui
         
     返回:
         tuple: (结果, 成功标志, 使用的API)
     """
-    # 创建API客户端
-    coze_api = CozeAPI(API_URL, COZE_API_TOKEN, None)
-    
-    # --- 尝试新API ---
-    success, result, api_used = False, None, None
-    
-    if NEW_BOT_ID:
-        try:
-            # 尝试新API
-            coze_api.workflow_id = NEW_BOT_ID
-            
-            # 准备Cookie参数
-            result = None
-            retry_count = 0
-            
-            while not success and retry_count < MAX_PRIMARY_RETRY:
-                try:
-                    if retry_count > 0:
-                        # st.info(f"正在重试视频脚本提取 (尝试 {retry_count+1}/{MAX_PRIMARY_RETRY})...")
-                        pass
-                        
-                    # 调用API - 注意这里使用正确的参数名称
-                    result = coze_api.run_workflow_with_cookies(video_url, BILI_COOKIES)
-                    
-                    # 检查结果
-                    if not result.get("error") and result.get("code") == 0:
-                        # 检查transcript是否为空
-                        try:
-                            parse_success, parsed_data = parse_workflow_response(result)
-                            if parse_success and parsed_data:
-                                transcript = parsed_data.get("transcript", "")
-                                if transcript and transcript.strip() != "":
-                                    success = True
-                                    api_used = "new_api"
-                                    break
-                        except Exception:
-                            # 如果解析失败，认为成功
-                            success = True
-                            api_used = "new_api"
-                            break
-                    
-                    retry_count += 1
-                    if retry_count < MAX_PRIMARY_RETRY:
-                        time.sleep(1)
-                    
-                except Exception:
-                    retry_count += 1
-                    if retry_count < MAX_PRIMARY_RETRY:
-                        time.sleep(1)
-        except Exception:
-            pass
+    if run["cancel"].cancelled:
+        # 会话已结束，不再打开新的流式调用
+        return cancelled_result(run["cancel"].reason), False, None
+    runner = get_workflow_runner()
+    started = time.monotonic()
+    stream = runner.stream_primary(video_url)
+    if stream is None:
+        return None, False, None
+
+    def render():
+        with st.container():
+            st.caption("✍️ AI总结生成中...")
+            st.write_stream(stream.text_deltas())
+
+    try:
+        guard_session_ui(run, render)
+        if run["cancel"].cancelled:
+            # 无人等待结果，关闭连接，不再读取剩余内容
+            stream.close()
+            runner.stats.record_cancelled_run()
+        result = stream.result()
+    finally:
+        stream.close()
+    success = runner.record_stream_result(result, time.monotonic() - started, run.get("on_attempt"))
+    if is_cancelled_result(result):
+        return result, False, None
+    return result, success, PRIMARY_API
+
+def try_run_workflow(video_url, run):
+    """
+    尝试运行工作流，先尝试新API，超时未成功或失败时启用旧API
     
-    # --- 如果新API失败，尝试旧API ---
-    if not success:
-        st.warning("本视频无可提取脚本，开始语音识别，请耐心等待...")
+    参数:
+        video_url (str): 视频URL
+        run (dict): 本次处理的状态，见guard_session_ui
         
-        try:
-            # 重置API客户端
-            coze_api.workflow_id = BOT_ID
-            
-            retry_count = 0
-            while not success and retry_count < MAX_BACKUP_RETRY:
-                try:
-                    if retry_count > 0:
-                        # st.info(f"正在重试语音识别 (尝试 {retry_count+1}/{MAX_BACKUP_RETRY})...")
-                        pass
-                        
-                    # 使用旧的参数格式
-                    result = coze_api.run_workflow({
-                        "url": video_url, 
-                        "title": "B站视频思维导图"
-                    })
-                    
-                    # 检查结果
-                    if not result.get("error") and result.get("code") == 0:
-                        # 检查transcript是否为空
-                        try:
-                            parse_success, parsed_data = parse_workflow_response(result)
-                            if parse_success and parsed_data:
-                                transcript = parsed_data.get("transcript", "")
-                                if transcript and transcript.strip() != "":
-                                    success = True
-                                    api_used = "old_api"
-                                    break
-                        except Exception:
-                            # 如果解析失败，认为成功
-                            success = True
-                            api_used = "old_api"
-                            break
-                    
-                    retry_count += 1
-                    if retry_count < MAX_BACKUP_RETRY:
-                        time.sleep(3)
-                        
-                except Exception:
-                    retry_count += 1
-                    if retry_count < MAX_BACKUP_RETRY:
-                        time.sleep(3)
-        except Exception:
-            pass
+    返回:
+        tuple: (结果, 成功标志, 使用的API)
+    """
+    progress_area = None
+    backup_notice = {"shown": False}
+
+    def start():
+        nonlocal progress_area
+        progress_area = st.empty()
     
-    # 如果两个API都失败了
-    if not success:
-        return {
-            "error": True,
-            "message": "视频内容解析失败：无法获取视频脚本或语音识别结果为空"
-        }, False, None
+    def render(state):
+        if state["backup_started"] and not backup_notice["shown"]:
+            backup_notice["shown"] = True
+            if state["hedged"]:
+                st.warning("视频脚本提取较慢，已同时开始语音识别，请耐心等待...")
+            elif run.get("route") == ROUTE_ASR:
+                st.info("语音识别耗时较长，请耐心等待...")
+            else:
+                st.warning("本视频无可提取脚本，开始语音识别，请耐心等待...")
+        label = "正在进行语音识别" if state["backup_started"] else "正在提取视频脚本"
+        progress_area.info(f"⏳ {label}，已等待 {int(state['elapsed'])} 秒...")
     
-    return result, True, api_used
+    guard_session_ui(run, start)
+    result = get_workflow_runner().run(
+        video_url, on_tick=lambda state: guard_session_ui(run, lambda: render(state)), cancel=run["cancel"],
+        route=run.get("route"), on_attempt=run.get("on_attempt"), primary_outcome=run.get("primary_outcome"),
+    )
+    guard_session_ui(run, lambda: progress_area.empty())
+    return result
 
 # --- UI 布局 ---
 st.markdown('<div class="main-container">', unsafe_allow_html=True)
@@ -574,7 +948,7 @@ st.markdown("""
 st.session_state.access_key = st.text_input("密钥", type="password", placeholder="请输入您的访问密钥", label_visibility="collapsed", key="key_input")
 
 # 按钮和使用情况
-submit_button = st.button("🚀 一键生成", use_container_width=True, disabled=st.session_state.is_processing)
+submit_button = st.button("🚀 一键生成", use_container_width=True, disabled=st.session_state.is_processing or bool(st.session_state.job_id))
 
 # 使用情况显示
 st.markdown(f"""
@@ -587,207 +961,273 @@ st.markdown(f"""
 if submit_button:
     if not st.session_state.video_url or not st.session_state.access_key:
         st.error("请输入B站视频链接和访问密钥！")
-    elif st.session_state.access_key != ACCESS_KEY:
+    elif st.session_state.access_key not in TENANTS:
         st.error("访问密钥不正确！")
     else:
-        is_valid_url, parsed_url = parse_bilibili_url(st.session_state.video_url)
+        is_valid_url, identity = parse_video_identity(st.session_state.video_url)
         if not is_valid_url:
-            st.error(parsed_url)
+            st.error(identity)
         else:
-            can_call, message = check_call_limits()
+            tenant = TENANTS[st.session_state.access_key]
+            st.session_state.tenant = tenant["name"]
+            can_call, message = check_call_limits(tenant)
             if not can_call:
                 st.error(message)
             else:
-                cache_key = json.dumps({"url": parsed_url}, sort_keys=True)
+                cache_key = make_cache_key(identity)
                 
                 cached_result = check_cache(cache_key)
                 
                 if cached_result:
                     # 检查缓存的transcript是否为空
-                    transcript = cached_result.get("transcript", "")
-                    if not transcript or transcript.strip() == "":
-                        # 如果缓存的transcript为空，删除缓存并重新处理
-                        cache_data = load_results_cache()
-                        if cache_key in cache_data:
-                            del cache_data[cache_key]
-                            save_results_cache(cache_data)
-                        if cache_key in st.session_state:
-                            del st.session_state[cache_key]
-                        cached_result = None
-                        st.session_state.is_processing = True
+                    if not has_transcript(cached_result):
+                        # 逐字稿为空的旧缓存转为失败记录，退避期内不再重新处理
+                        invalidate_cache(cache_key)
+                        st.session_state.result_data = record_failure(cache_key, FAILED_MESSAGE)
                     else:
                         st.session_state.result_data = cached_result
+                        st.session_state.result_key = cache_key
                         st.toast("🎉 命中缓存，快速加载！")
                 else:
-                    st.session_state.is_processing = True
+                    failure = check_failure(cache_key)
+                    if failure:
+                        st.session_state.result_data = failure
+                    elif JOB_QUEUE_MODE:
+                        # 写入任务队列，同一视频已有未完成的任务时复用该任务
+                        job, created = get_job_queue().enqueue(
+                            cache_key, canonical_video_url(identity), user_id, tenant=tenant["name"]
+                        )
+                        st.session_state.job_id = job["job_id"]
+                        st.session_state.result_data = None
+                        st.query_params["job"] = job["job_id"]
+                    else:
+                        st.session_state.is_processing = True
                 st.rerun()
 
+# --- 任务状态 ---
+def finish_job(job):
+    # 任务结束后从结果缓存读取结果，并清除任务ID
+    if job["status"] == JOB_DONE:
+        result = check_cache(job["key"])
+        if result:
+            st.session_state.result_data = result
+            st.session_state.result_key = job["key"]
+        else:
+            st.session_state.result_data = check_failure(job["key"]) or {"error": True, "message": "结果已过期，请重新提交"}
+    else:
+        st.session_state.result_data = check_failure(job["key"]) or {"error": True, "message": job["message"] or FAILED_MESSAGE}
+    st.session_state.job_id = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+if st.session_state.job_id:
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+    elif job["status"] in ACTIVE_STATUSES:
+        elapsed = int(time.time() - job["created_at"])
+        if job["status"] == JOB_QUEUED:
+            ahead = get_job_queue().position(job["job_id"])
+            st.info(f"⏳ 已加入处理队列，前面还有 {ahead} 个视频，已等待 {elapsed} 秒。可以关闭页面，稍后通过当前链接查看结果。")
+        else:
+            st.info(f"🧠 AI正在解析视频内容，已等待 {elapsed} 秒。可以关闭页面，稍后通过当前链接查看结果。")
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+    else:
+        finish_job(job)
+
+# --- 搜索已解析的视频 ---
+def open_search_result(key):
+    # 从搜索结果直接打开已缓存的视频，不计入调用次数
+    st.session_state.result_data = check_cache(key)
+    st.session_state.result_key = key
+
+with st.expander("🔍 搜索已解析的视频"):
+    search_query = st.text_input("搜索", placeholder="输入总结或逐字稿中的关键词", label_visibility="collapsed", key="search_query")
+    if search_query:
+        search_results = get_results_store().search(search_query)
+        if not search_results:
+            st.caption("没有找到相关视频")
+        for i, item in enumerate(search_results):
+            bvid = cache_key_bvid(item["key"])
+            st.markdown(f"**{item['title'] or bvid}** · `{bvid}`")
+            if item["snippet"]:
+                st.caption(item["snippet"])
+            st.button("查看结果", key=f"search_open_{i}", on_click=open_search_result, args=(item["key"],))
+
 # --- 处理和结果展示 ---
 if st.session_state.is_processing:
     with st.spinner("🧠 AI正在解析视频内容，请稍候..."):
-        is_valid_url, parsed_url = parse_bilibili_url(st.session_state.video_url)
-        cache_key = json.dumps({"url": parsed_url}, sort_keys=True)
+        is_valid_url, identity = parse_video_identity(st.session_state.video_url)
+        cache_key = make_cache_key(identity)
+        parsed_url = canonical_video_url(identity)
+        run = new_run(cache_key)
         
         # 检查缓存
         cached_result = check_cache(cache_key)
         if cached_result:
             # 检查缓存的transcript是否为空
-            transcript = cached_result.get("transcript", "")
-            if not transcript or transcript.strip() == "":
-                # 如果缓存的transcript为空，删除缓存并重新处理
-                cache_data = load_results_cache()
-                if cache_key in cache_data:
-                    del cache_data[cache_key]
-                    save_results_cache(cache_data)
-                if cache_key in st.session_state:
-                    del st.session_state[cache_key]
-                cached_result = None
+            if not has_transcript(cached_result):
+                # 逐字稿为空的旧缓存转为失败记录
+                invalidate_cache(cache_key)
+                cached_result = record_failure(cache_key, FAILED_MESSAGE)
+                st.session_state.result_data = cached_result
             else:
                 st.session_state.result_data = cached_result
+                st.session_state.result_key = cache_key
                 st.toast("🎉 命中缓存，快速加载！")
                 if "api_used" in cached_result:
                     api_source = "主API" if cached_result["api_used"] == "new_api" else "备用API"
                     st.success(f"数据来源: {api_source}")
-        else:
-            # 尝试调用API（优先新API，失败则使用旧API）
-            result, success, api_used = try_run_workflow(parsed_url)
-
-            if success:
-                st.session_state.call_count += 1
-                st.session_state.last_call_time = datetime.now()
-                update_user_usage(user_id, call_count=st.session_state.call_count, last_call_time=st.session_state.last_call_time)
-                
-                parse_success, data = parse_workflow_response(result)
-                if parse_success:
-                    # 检查transcript内容是否为空
-                    transcript = data.get("transcript", "")
-                    if not transcript or transcript.strip() == "":
-                        st.session_state.result_data = {
-                            "error": True, 
-                            "message": "视频内容解析失败：无法获取视频脚本或语音识别结果为空",
-                            "raw": result
-                        }
-                    else:
-                        # 在结果数据中添加使用的API信息
-                        data["api_used"] = api_used
-                        st.session_state.result_data = data
-                        cache_result(cache_key, data)
-                        
-                        # 显示数据来源
-                        api_source = "主API" if api_used == "new_api" else "备用API"
-                        st.success(f"数据来源: {api_source}")
-                else:
-                    st.session_state.result_data = {"error": True, "message": data, "raw": result}
-            else:
-                st.session_state.result_data = {"error": True, "message": result.get("message")}
         
+        if not cached_result:
+            cached_result = check_failure(cache_key)
+            st.session_state.result_data = cached_result
+
+        if not cached_result:
+            # 相同视频的并发请求只执行一次工作流，其余请求等待同一结果
+            result_data, shared = get_single_flight().do(
+                cache_key,
+                lambda: process_video(cache_key, parsed_url, run),
+                lookup=lambda: lookup_result(cache_key),
+            )
+            st.session_state.result_data = result_data
+            st.session_state.result_key = cache_key
+            if shared and not result_data.get("error"):
+                st.toast("🎉 已合并到相同视频的处理结果！")
+            elif "api_used" in result_data:
+                # 显示数据来源
+                api_source = "主API" if result_data["api_used"] == "new_api" else "备用API"
+                st.success(f"数据来源: {api_source}")
         st.session_state.is_processing = False
+        if run["rerun"] is not None:
+            # 处理期间用户操作了页面，按那次操作重跑
+            raise run["rerun"]
         st.rerun()
 
-if st.session_state.result_data:
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _transcript_index(key, timestamp, _text):
+    # 同一结果的逐字稿只切分一次，所有会话共享
+    return TranscriptIndex(_text)
+
+def select_transcript_match():
+    # 选中搜索结果后跳转到所在页
+    match = st.session_state.transcript_match
+    if match is not None:
+        st.session_state.transcript_page = match["page"] + 1
+
+def render_transcript(key, result):
+    """
+    分页显示逐字稿，每次只向浏览器发送一页；支持关键词定位和按需下载全文
+    """
+    text = result.get("transcript") or get_transcript(key)
+    if not text:
+        st.info("未能获取视频逐字稿。")
+        return
+    index = _transcript_index(key, result.get("timestamp"), text)
+
+    # 切换到新的结果时回到第一页
+    if st.session_state.get("transcript_key") != key:
+        st.session_state.transcript_key = key
+        st.session_state.transcript_page = 1
+        st.session_state.transcript_query = ""
+        st.session_state.transcript_download = False
+
+    query = st.text_input("搜索逐字稿", placeholder="输入关键词定位到所在页", key="transcript_query")
+    if query:
+        matches = index.search(query)
+        if matches:
+            st.selectbox(
+                f"找到 {len(matches)} 处" + ("（仅显示前200处）" if len(matches) >= 200 else ""),
+                matches,
+                index=None,
+                format_func=lambda m: f"第{m['page'] + 1}页：{m['snippet']}",
+                key="transcript_match",
+                on_change=select_transcript_match,
+            )
+        else:
+            st.caption("未找到匹配内容")
+
+    page = st.number_input(
+        f"页码（共 {index.page_count} 页）", min_value=1, max_value=index.page_count, step=1, key="transcript_page"
+    )
+    st.text_area("视频逐字稿", value=index.page(page - 1), label_visibility="collapsed", height=500)
+
+    # 全文只在用户需要时才发送到浏览器
+    if st.session_state.transcript_download or st.button("准备下载全文"):
+        st.session_state.transcript_download = True
+        st.download_button(
+            "⬇️ 下载逐字稿全文", data=text.encode("utf-8"),
+            file_name=f"{cache_key_bvid(key)}_transcript.txt", mime="text/plain",
+        )
+
+@fragment
+def render_result_panel():
+    """
+    渲染结果面板，面板内的交互只重跑本片段
+    """
     if st.session_state.result_data.get("error"):
         st.error(f"处理失败: {st.session_state.result_data.get('message')}")
         if 'raw' in st.session_state.result_data: st.json(st.session_state.result_data['raw'])
-    else:
-        st.success("✅ 视频分析完成！")
-        workflow_data = st.session_state.result_data
-        st.markdown('<div class="results-container">', unsafe_allow_html=True)
-        
-        # 删除tab上方的标题显示
-
-        # 调整tab顺序：AI总结、逐字稿
-        tab1, tab2 = st.tabs(["📄 AI总结", "📝 逐字稿"])
-
-        with tab1:
-            summary_content = workflow_data.get("summary", "未能生成AI总结。")
-            # 使用更精确的选择器，只影响AI总结区域
-            st.markdown("""
-            <style>
-            /* 只影响AI总结tab内的markdown标题 */
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h1 {
-                font-size: 1.5rem !important;
-                text-align: center !important;
-                color: #18191C !important;
-                font-weight: 700 !important;
-            }
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h2 {
-                font-size: 1.2rem !important;
-                text-align: left !important;
-                color: #18191C !important;
-                font-weight: 600 !important;
-            }
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h3 {
-                font-size: 1.1rem !important;
-                text-align: left !important;
-                color: #18191C !important;
-                font-weight: 600 !important;
-            }
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h4 {
-                font-size: 1rem !important;
-                text-align: left !important;
-                color: #18191C !important;
-                font-weight: 600 !important;
-            }
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h5 {
-                font-size: 0.95rem !important;
-                text-align: left !important;
-                color: #18191C !important;
-                font-weight: 600 !important;
-            }
-            div[data-testid="stTabs"] div[data-testid="stMarkdown"] h6 {
-                font-size: 0.9rem !important;
-                text-align: left !important;
-                color: #18191C !important;
-                font-weight: 600 !important;
-            }
-            </style>
-            """, unsafe_allow_html=True)
-            # 去除 markdown 代码块包裹，防止原样显示
-            raw_md = summary_content  # 保留原始markdown源码
-            if raw_md.startswith("```markdown"): raw_md = raw_md.replace("```markdown", "", 1).strip()
-            if raw_md.endswith("```"): raw_md = raw_md[:-3].strip()
-            summary_md = raw_md  # 预览和复制都用同一份
-            
-            # 直接渲染AI总结内容，不使用CSS类
-            st.markdown(summary_md)
-            
-            # 准备要复制的完整内容
-            video_link = st.session_state.video_url
-            
-            # 将视频来源插入到标题下方
-            summary_lines = summary_md.split('\n', 1)
-            link_text = f"[_视频来源_]({video_link})"
-            
-            if len(summary_lines) > 1:
-                # 如果内容包含换行符（即有标题和正文），则将链接插入标题下方
-                title = summary_lines[0]
-                content = summary_lines[1]
-                full_content_to_copy = f"{title}\n\n{link_text}\n\n{content}"
-            else:
-                # 如果内容只有一行（或为空），则将链接附加到末尾
-                full_content_to_copy = f"{summary_md}\n\n{link_text}"
-
-            components.html(f'''
-            <button id="copy-md-btn" style="margin:0px 0;padding:6px 16px;border-radius:8px;border:none;background:#FB7299;color:#fff;font-weight:600;cursor:pointer;font-size:0.85rem;line-height:1.2;width:auto;white-space:normal;text-align:center;">点击复制文件</button>
-            <textarea id="md-src" style="position:absolute;left:-9999px;">{full_content_to_copy.replace("'", "&#39;").replace('"', '&quot;')}</textarea>
-            <script>
-            document.getElementById('copy-md-btn').onclick = function() {{
-                var ta = document.getElementById('md-src');
-                ta.style.display = 'block';
-                ta.select();
-                document.execCommand('copy');
-                ta.style.display = 'none';
-                this.innerText = '已复制!';
-                setTimeout(()=>{{this.innerText='点击复制文件'}}, 1200);
-            }}
-            </script>
-            ''', height=36)
-            st.caption('提示：此文本保存成.md文件可直接导入Xmind或在线工具<a href="https://wanglin2.github.io/mind-map/#/" target="_blank" style="color:#FB7299;font-weight:600;text-decoration:underline;">SimpleMindMap</a>生成精美思维导图。', unsafe_allow_html=True)
-
-        with tab2:
-            transcript_content = workflow_data.get("transcript", "未能获取视频逐字稿。")
-            st.text_area("视频逐字稿", value=transcript_content, label_visibility="collapsed", height=800)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
+        return
+
+    st.success("✅ 视频分析完成！")
+    workflow_data = st.session_state.result_data
+    result_key = st.session_state.result_key
+    artifacts = get_render_artifacts(result_key, workflow_data)
+    st.markdown('<div class="results-container">', unsafe_allow_html=True)
+
+    # 调整tab顺序：AI总结、思维导图、逐字稿
+    tab1, tab_map, tab2 = st.tabs(["📄 AI总结", "🧠 思维导图", "📝 逐字稿"])
+
+    with tab1:
+        # 直接渲染AI总结内容，不使用CSS类
+        st.markdown(artifacts["summary_md"])
+        components.html(artifacts["copy_html"], height=COPY_BUTTON_HEIGHT)
+        render_exports(result_key, workflow_data)
+        st.caption('提示：此文本保存成.md文件可直接导入Xmind或在线工具<a href="https://wanglin2.github.io/mind-map/#/" target="_blank" style="color:#FB7299;font-weight:600;text-decoration:underline;">SimpleMindMap</a>生成精美思维导图。', unsafe_allow_html=True)
+
+    with tab_map:
+        if artifacts["mind_map_nodes"] > 1:
+            # 点击节点展开或收起子树
+            components.html(artifacts["mind_map_html"], height=MIND_MAP_HEIGHT, scrolling=True)
+        else:
+            st.info("AI总结中没有可生成思维导图的层级结构。")
+
+    with tab2:
+        render_transcript(result_key, workflow_data)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+if st.session_state.result_data:
+    render_result_panel()
+
+st.markdown('</div>', unsafe_allow_html=True)
 
-st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+# --- 运行状态（侧边栏，供运维查看） ---
+with st.sidebar.expander("运行状态"):
+    st.caption("结果内存缓存")
+    st.json(get_memory_cache().stats())
+    st.caption("过期清理")
+    st.json(get_expiry_sweeper().stats())
+    st.caption("任务队列")
+    st.json(get_job_queue().stats())
+    if get_admission() is not None:
+        st.caption("并发与排队")
+        st.json(get_admission().stats())
+        st.caption("各访问密钥排队情况")
+        st.json(get_admission().tenant_stats())
+    if get_rate_limiter() is not None:
+        st.caption("工作流限速")
+        st.json(get_rate_limiter().stats())
+    st.caption("后台写入")
+    st.json(get_write_behind().stats())
+    st.caption("Coze连接池")
+    st.json(get_pool_stats())
+    st.caption("工作流对冲")
+    st.json(get_workflow_runner().stats.snapshot())
+    st.caption("字幕/语音识别路由")
+    st.json(get_router().stats())
+    st.caption("工作流熔断")
+    st.json(get_workflow_runner().breakers.snapshot())
@@ -0,0 +1,190 @@
+import re
+import json
+
+# 初次显示时展开的层数，更深的子树在点击时才生成
+INITIAL_DEPTH = 2
+# 思维导图iframe的高度
+MIND_MAP_HEIGHT = 600
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_LIST_ITEM = re.compile(r"^(\s*)(?:[-*+]|\d+[.)])\s+(.*)$")
+_INLINE_MARKUP = [
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),   # 图片
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),    # 链接
+    (re.compile(r"(\*\*|__)(.+?)\1"), r"\2"),          # 粗体
+    (re.compile(r"(?<!\w)([*_])(.+?)\1(?!\w)"), r"\2"),  # 斜体
+    (re.compile(r"`([^`]*)`"), r"\1"),                 # 行内代码
+]
+
+
+def _plain(text):
+    # 去掉行内markdown标记，只保留文字
+    for pattern, repl in _INLINE_MARKUP:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+
+def parse_outline(markdown, root_title="AI总结"):
+    """
+    将AI总结的markdown解析为大纲树
+
+    标题按级别嵌套，列表项按缩进嵌套在最近的标题下，普通段落作为当前节点的子节点。
+    节点以 [文字, 子节点列表] 表示，便于紧凑地序列化。
+
+    参数:
+        markdown (str): 清理后的AI总结
+        root_title (str): 没有一级标题时根节点的文字
+
+    返回:
+        list: 根节点 [文字, 子节点列表]
+    """
+    root = [root_title, []]
+    # 标题栈：(级别, 节点)；根节点级别为0
+    headings = [(0, root)]
+    # 当前标题下的列表栈：(缩进, 节点)
+    items = []
+    root_from_h1 = False
+
+    for line in (markdown or "").splitlines():
+        if not line.strip() or line.strip().startswith("```"):
+            continue
+        heading = _HEADING.match(line.strip())
+        if heading:
+            level = len(heading.group(1))
+            text = _plain(heading.group(2))
+            items = []
+            if level == 1 and not root_from_h1 and not root[1]:
+                # 第一个一级标题作为根节点
+                root[0] = text
+                root_from_h1 = True
+                continue
+            while headings[-1][0] >= level:
+                headings.pop()
+            node = [text, []]
+            headings[-1][1][1].append(node)
+            headings.append((level, node))
+            continue
+        item = _LIST_ITEM.match(line)
+        if item:
+            indent = len(item.group(1).expandtabs(4))
+            node = [_plain(item.group(2)), []]
+            while items and items[-1][0] >= indent:
+                items.pop()
+            parent = items[-1][1] if items else headings[-1][1]
+            parent[1].append(node)
+            items.append((indent, node))
+            continue
+        # 普通段落挂在最近的列表项或标题下
+        parent = items[-1][1] if items else headings[-1][1]
+        text = _plain(line.strip().lstrip(">").strip())
+        if text:
+            parent[1].append([text, []])
+    return root
+
+
+def count_nodes(tree):
+    """
+    统计大纲树的节点数
+    """
+    stack, total = [tree], 0
+    while stack:
+        node = stack.pop()
+        total += 1
+        stack.extend(node[1])
+    return total
+
+
+def render_mind_map_html(tree, initial_depth=INITIAL_DEPTH):
+    """
+    生成可折叠的思维导图HTML，大纲数据内嵌为JSON，子树在展开时才创建DOM
+
+    参数:
+        tree (list): parse_outline返回的大纲树
+        initial_depth (int): 初次显示时展开的层数
+
+    返回:
+        str: components.html使用的HTML
+    """
+    # 防止内容中的 </script> 提前结束脚本
+    data = json.dumps(tree, ensure_ascii=False).replace("</", "<\\/")
+    return f'''
+<style>
+  body {{ margin: 0; font-family: -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif; }}
+  #toolbar {{ position: sticky; top: 0; background: #fff; padding: 6px 8px; z-index: 2; border-bottom: 1px solid #E3E5E7; }}
+  #toolbar button {{ padding: 4px 12px; margin-right: 6px; border-radius: 8px; border: none; background: #FB7299; color: #fff; font-weight: 600; cursor: pointer; font-size: 0.8rem; }}
+  #map {{ padding: 12px; overflow: auto; }}
+  .mm-node {{ display: flex; align-items: center; }}
+  .mm-children {{ display: flex; flex-direction: column; border-left: 2px solid #FC8BAD; margin-left: 12px; padding-left: 12px; }}
+  .mm-children > .mm-node {{ position: relative; margin: 4px 0; }}
+  .mm-children > .mm-node::before {{ content: ""; position: absolute; left: -12px; top: 50%; width: 12px; border-top: 2px solid #FC8BAD; }}
+  .mm-label {{ padding: 4px 10px; border-radius: 8px; background: #F6F7F8; color: #18191C; font-size: 0.85rem; max-width: 360px; line-height: 1.4; cursor: default; white-space: normal; }}
+  .mm-root > .mm-label {{ background: #FB7299; color: #fff; font-weight: 700; font-size: 1rem; }}
+  .mm-toggle {{ cursor: pointer; }}
+  .mm-toggle::after {{ content: " ⊕"; color: #FB7299; font-weight: 700; }}
+  .mm-open > .mm-toggle::after {{ content: " ⊖"; }}
+  .mm-root > .mm-toggle::after {{ color: #fff; }}
+</style>
+<div id="toolbar"><button id="mm-expand">展开全部</button><button id="mm-collapse">收起</button></div>
+<div id="map"></div>
+<script>
+const TREE = {data};
+const MAX_EXPAND_NODES = 3000;
+
+function makeNode(node, depth, isRoot) {{
+  const el = document.createElement("div");
+  el.className = "mm-node" + (isRoot ? " mm-root" : "");
+  const label = document.createElement("div");
+  label.className = "mm-label";
+  label.textContent = node[0];
+  el.appendChild(label);
+  el._node = node;
+  if (node[1].length) {{
+    label.classList.add("mm-toggle");
+    label.onclick = () => toggle(el);
+    if (depth < {initial_depth}) expand(el, depth);
+  }}
+  el._depth = depth;
+  return el;
+}}
+
+function expand(el, depth) {{
+  // 子节点只在第一次展开时创建
+  if (!el._children) {{
+    const box = document.createElement("div");
+    box.className = "mm-children";
+    for (const child of el._node[1]) box.appendChild(makeNode(child, depth + 1, false));
+    el._children = box;
+    el.appendChild(box);
+  }}
+  el._children.style.display = "";
+  el.classList.add("mm-open");
+}}
+
+function collapse(el) {{
+  if (el._children) el._children.style.display = "none";
+  el.classList.remove("mm-open");
+}}
+
+function toggle(el) {{
+  if (el.classList.contains("mm-open")) collapse(el); else expand(el, el._depth);
+}}
+
+function expandAll(el, budget) {{
+  const queue = [el];
+  while (queue.length && budget.left > 0) {{
+    const cur = queue.shift();
+    if (!cur._node[1].length) continue;
+    expand(cur, cur._depth);
+    budget.left -= cur._node[1].length;
+    for (const child of cur._children.children) queue.push(child);
+  }}
+}}
+
+const rootEl = makeNode(TREE, 0, true);
+document.getElementById("map").appendChild(rootEl);
+document.getElementById("mm-expand").onclick = () => expandAll(rootEl, {{left: MAX_EXPAND_NODES}});
+document.getElementById("mm-collapse").onclick = () => {{
+  for (const child of (rootEl._children ? rootEl._children.children : [])) collapse(child);
+}};
+</script>
+'''
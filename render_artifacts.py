@@ -0,0 +1,94 @@
+import html
+from mind_map import parse_outline, render_mind_map_html, count_nodes
+
+# 复制按钮所在iframe的高度
+COPY_BUTTON_HEIGHT = 36
+
+
+def clean_summary_markdown(summary):
+    """
+    去除AI总结外层的 ```markdown 代码块包裹，防止原样显示
+
+    参数:
+        summary (str): 工作流返回的AI总结
+
+    返回:
+        str: 可直接渲染的markdown
+    """
+    raw_md = summary or ""
+    if raw_md.startswith("```markdown"): raw_md = raw_md.replace("```markdown", "", 1).strip()
+    if raw_md.endswith("```"): raw_md = raw_md[:-3].strip()
+    return raw_md
+
+
+def build_copy_payload(summary_md, video_link):
+    """
+    生成复制按钮复制的完整内容，视频来源插入到标题下方
+
+    参数:
+        summary_md (str): 清理后的AI总结
+        video_link (str): 视频链接
+
+    返回:
+        str: 要复制的markdown
+    """
+    summary_lines = summary_md.split('\n', 1)
+    link_text = f"[_视频来源_]({video_link})"
+
+    if len(summary_lines) > 1:
+        # 如果内容包含换行符（即有标题和正文），则将链接插入标题下方
+        title = summary_lines[0]
+        content = summary_lines[1]
+        return f"{title}\n\n{link_text}\n\n{content}"
+    # 如果内容只有一行（或为空），则将链接附加到末尾
+    return f"{summary_md}\n\n{link_text}"
+
+
+def build_copy_button_html(payload):
+    """
+    生成复制按钮的HTML，内容转义后放入隐藏的textarea
+
+    参数:
+        payload (str): 要复制的内容
+
+    返回:
+        str: components.html使用的HTML
+    """
+    return f'''
+            <button id="copy-md-btn" style="margin:0px 0;padding:6px 16px;border-radius:8px;border:none;background:#FB7299;color:#fff;font-weight:600;cursor:pointer;font-size:0.85rem;line-height:1.2;width:auto;white-space:normal;text-align:center;">点击复制文件</button>
+            <textarea id="md-src" style="position:absolute;left:-9999px;">{html.escape(payload)}</textarea>
+            <script>
+            document.getElementById('copy-md-btn').onclick = function() {{
+                var ta = document.getElementById('md-src');
+                ta.style.display = 'block';
+                ta.select();
+                document.execCommand('copy');
+                ta.style.display = 'none';
+                this.innerText = '已复制!';
+                setTimeout(()=>{{this.innerText='点击复制文件'}}, 1200);
+            }}
+            </script>
+            '''
+
+
+def build_render_artifacts(summary, video_link):
+    """
+    计算结果面板需要的派生内容，同一结果只需计算一次
+
+    参数:
+        summary (str): 工作流返回的AI总结
+        video_link (str): 视频链接
+
+    返回:
+        dict: {"summary_md", "copy_payload", "copy_html", "mind_map_html", "mind_map_nodes"}
+    """
+    summary_md = clean_summary_markdown(summary)
+    copy_payload = build_copy_payload(summary_md, video_link)
+    outline = parse_outline(summary_md)
+    return {
+        "summary_md": summary_md,
+        "copy_payload": copy_payload,
+        "copy_html": build_copy_button_html(copy_payload),
+        "mind_map_html": render_mind_map_html(outline),
+        "mind_map_nodes": count_nodes(outline),
+    }
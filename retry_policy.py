@@ -0,0 +1,229 @@
+import time
+import random
+import threading
+from utils import parse_workflow_response
+
+# 工作流调用结果的分类
+OUTCOME_OK = "ok"                # 得到有效逐字稿
+OUTCOME_EMPTY = "empty"          # 调用成功但逐字稿为空，与具体视频有关
+OUTCOME_RETRYABLE = "retryable"  # 超时、连接失败、5xx、限流等临时错误
+OUTCOME_FATAL = "fatal"          # 参数错误、鉴权失败等重试也不会成功的错误
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# 不反映服务健康状况的错误类型，不计入熔断
+NON_SERVICE_ERROR_TYPES = {"invalid_request", "cancelled"}
+
+
+def classify_result(result):
+    """
+    对run_workflow的返回结果分类
+
+    参数:
+        result (dict): 工作流API响应
+
+    返回:
+        str: OUTCOME_* 之一
+    """
+    if not result:
+        return OUTCOME_RETRYABLE
+    if result.get("error"):
+        error_type = result.get("error_type")
+        status_code = result.get("status_code")
+        if error_type == "invalid_request":
+            return OUTCOME_FATAL
+        if status_code is not None:
+            if status_code in RETRYABLE_STATUS_CODES or status_code >= 500:
+                return OUTCOME_RETRYABLE
+            return OUTCOME_FATAL
+        return OUTCOME_RETRYABLE
+    if result.get("code") != 0:
+        return OUTCOME_RETRYABLE
+    try:
+        parse_success, parsed_data = parse_workflow_response(result)
+        if not parse_success:
+            return OUTCOME_RETRYABLE
+        transcript = parsed_data.get("transcript", "") if parsed_data else ""
+        if transcript and transcript.strip() != "":
+            return OUTCOME_OK
+        return OUTCOME_EMPTY
+    except Exception:
+        # 如果解析失败，认为成功
+        return OUTCOME_OK
+
+
+def counts_as_service_failure(result, outcome):
+    """
+    判断一次调用结果是否说明工作流本身不可用，用于熔断计数
+    """
+    if outcome not in (OUTCOME_RETRYABLE, OUTCOME_FATAL):
+        return False
+    return (result or {}).get("error_type") not in NON_SERVICE_ERROR_TYPES
+
+
+class RetryPolicy:
+    """
+    单个工作流的重试策略：最多调用次数、带抖动的指数退避、是否对空结果重试
+    """
+
+    def __init__(self, max_attempts=2, base_delay=1.0, max_delay=30.0, multiplier=2.0,
+                 jitter=0.5, retry_on_empty=True, min_attempt_timeout=30.0):
+        """
+        初始化重试策略
+
+        参数:
+            max_attempts (int): 最多调用次数
+            base_delay (float): 首次重试前的等待时间（秒）
+            max_delay (float): 单次等待上限（秒）
+            multiplier (float): 每次重试等待时间的增长倍数
+            jitter (float): 抖动比例，实际等待在 [delay*(1-jitter), delay] 之间
+            retry_on_empty (bool): 逐字稿为空时是否重试
+            min_attempt_timeout (float): 剩余时间预算低于该值时不再发起调用（秒）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_on_empty = retry_on_empty
+        self.min_attempt_timeout = min_attempt_timeout
+
+    def backoff(self, attempt):
+        """
+        计算第attempt次（从0开始）失败后的等待时间
+        """
+        delay = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry(self, outcome):
+        if outcome == OUTCOME_RETRYABLE:
+            return True
+        if outcome == OUTCOME_EMPTY:
+            return self.retry_on_empty
+        return False
+
+
+class Deadline:
+    """
+    端到端的时间预算，在剩余的调用之间平均分配
+    """
+
+    def __init__(self, total_seconds):
+        self.total_seconds = total_seconds
+        self.expires_at = time.monotonic() + total_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def split(self, attempts_left):
+        """
+        为下一次调用分配超时时间
+
+        参数:
+            attempts_left (int): 包括本次在内的剩余调用次数
+
+        返回:
+            float: 本次调用的超时时间（秒）
+        """
+        return self.remaining() / max(1, attempts_left)
+
+
+class CircuitBreaker:
+    """
+    单个工作流的熔断器：连续失败达到阈值后在冷却期内跳过该工作流，冷却后放行一次试探调用
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        """
+        初始化熔断器
+
+        参数:
+            failure_threshold (int): 触发熔断的连续失败次数
+            reset_timeout (float): 熔断后的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        """
+        判断是否允许发起调用
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self):
+        """
+        调用未产生可判断的结果（如被取消）时，释放半开状态下的试探名额
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "rejected": self.rejected,
+            }
+
+
+class CircuitBreakerRegistry:
+    """
+    按工作流ID管理熔断器
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, workflow_id):
+        with self._lock:
+            breaker = self._breakers.get(workflow_id)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[workflow_id] = breaker
+            return breaker
+
+    def snapshot(self):
+        with self._lock:
+            return {workflow_id: b.snapshot() for workflow_id, b in self._breakers.items()}
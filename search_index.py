@@ -0,0 +1,102 @@
+import re
+
+# 中日韩文字连续片段，按二元组切分
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ]+")
+# 字母数字片段，按词切分
+_WORD = re.compile(r"[0-9A-Za-z]+")
+# 一次查询最多使用的词元数，避免超长输入拖慢检索
+MAX_QUERY_TOKENS = 32
+
+
+def tokenize(text):
+    """
+    将文本切分为检索词元：中文按相邻两字切分（二元组），英文和数字按词切分并转小写
+
+    参数:
+        text (str): 原文
+
+    返回:
+        list: 词元列表，按在原文中出现的顺序
+    """
+    tokens = []
+    pos = 0
+    text = text or ""
+    for match in _CJK_RUN.finditer(text):
+        tokens.extend(w.lower() for w in _WORD.findall(text[pos:match.start()]))
+        run = match.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        pos = match.end()
+    tokens.extend(w.lower() for w in _WORD.findall(text[pos:]))
+    return tokens
+
+
+def to_index_text(text):
+    """
+    生成写入全文索引的文本，词元之间以空格分隔
+    """
+    return " ".join(tokenize(text))
+
+
+def build_match_query(query):
+    """
+    将用户输入转换为FTS5的MATCH表达式，所有词元都需出现
+
+    单个汉字无法组成二元组，改用前缀匹配以该字开头的二元组。
+
+    参数:
+        query (str): 用户输入的关键词
+
+    返回:
+        str: MATCH表达式，没有可检索的词元时返回None
+    """
+    terms = []
+    for token in tokenize(query)[:MAX_QUERY_TOKENS]:
+        if len(token) == 1 and _CJK_RUN.match(token):
+            terms.append(f'"{token}"*')
+        else:
+            terms.append(f'"{token}"')
+    if not terms:
+        return None
+    return " AND ".join(dict.fromkeys(terms))
+
+
+def make_snippet(text, query, context=40):
+    """
+    截取关键词附近的片段，找不到完整关键词时按第一个词元定位
+
+    参数:
+        text (str): 原文
+        query (str): 用户输入的关键词
+        context (int): 关键词前后保留的字数
+
+    返回:
+        str: 片段，原文中找不到任何词元时返回None
+    """
+    if not text:
+        return None
+    lowered = text.lower()
+    needles = [(query or "").strip().lower()] + tokenize(query)
+    for needle in needles:
+        if not needle:
+            continue
+        pos = lowered.find(needle)
+        if pos >= 0:
+            start = max(0, pos - context)
+            end = min(len(text), pos + len(needle) + context)
+            snippet = " ".join(text[start:end].split())
+            return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+    return None
+
+
+def summary_title(summary):
+    """
+    取AI总结的第一行标题作为视频标题
+    """
+    for line in (summary or "").splitlines():
+        line = line.strip().strip("`").lstrip("#").strip()
+        if line and line != "markdown":
+            return line
+    return None
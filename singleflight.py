@@ -0,0 +1,154 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger("SingleFlight")
+
+
+class LeaderAborted(Exception):
+    """
+    执行者被中断（如页面会话结束）而没有结果，等待者应重新发起处理
+    """
+
+
+class SingleFlight:
+    """
+    合并相同key的并发请求：第一个调用者执行，其余调用者等待同一个结果
+
+    进程内通过共享Future合并；传入store时，还会借助其租约表在多进程之间合并，
+    其他进程的调用者轮询持久化缓存直到结果写入或租约失效。
+    """
+
+    def __init__(self, store=None, lease_seconds=120, poll_interval=2.0, release_hook=None):
+        """
+        初始化请求合并器
+
+        参数:
+            store (ResultsStore): 共享的持久化缓存，为None时只做进程内合并
+            lease_seconds (float): 跨进程租约有效期，执行期间会自动续约
+            poll_interval (float): 等待其他进程结果时的轮询间隔（秒）
+            release_hook (callable): 自定义租约释放 (key, owner)，结果延迟写入时
+                用于在结果落盘之后再释放租约，避免其他进程误以为没有结果
+        """
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.release_hook = release_hook
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._waiters = {}
+        self.leader_runs = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, lookup=None):
+        """
+        执行或加入对key的处理
+
+        参数:
+            key (str): 合并键（规范化后的视频标识）
+            fn (callable): 实际执行的函数，只会被一个调用者执行
+            lookup (callable): 查询持久化结果的函数，用于等待其他进程的处理结果
+
+        返回:
+            tuple: (结果, 是否为共享的结果)
+        """
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+                else:
+                    self.coalesced += 1
+                    self._waiters[key] = self._waiters.get(key, 0) + 1
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except LeaderAborted:
+                # 执行者被中断，由等待者之一接手
+                continue
+            finally:
+                with self._lock:
+                    remaining = self._waiters[key] - 1
+                    if remaining:
+                        self._waiters[key] = remaining
+                    else:
+                        del self._waiters[key]
+
+        try:
+            try:
+                shared_result = self._wait_for_other_process(key, lookup)
+                if shared_result is not None:
+                    future.set_result(shared_result)
+                    return shared_result, True
+                self.leader_runs += 1
+                result = self._run_with_lease(key, fn)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            except BaseException:
+                # 中断执行者的控制流异常不能传给其他线程的等待者
+                future.set_exception(LeaderAborted(key))
+                raise
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def waiters(self, key):
+        """
+        当前进程内正在等待key结果的调用者数
+
+        返回:
+            int: 等待者数量，不含执行者本身
+        """
+        with self._lock:
+            return self._waiters.get(key, 0)
+
+    def _wait_for_other_process(self, key, lookup):
+        # 其他进程持有租约时，轮询等待其结果；租约释放但无结果则由本进程接手
+        if self.store is None:
+            return None
+        while not self.store.acquire_lease(key, self.owner, self.lease_seconds):
+            time.sleep(self.poll_interval)
+            if lookup is not None:
+                result = lookup()
+                if result:
+                    return result
+        if lookup is not None:
+            # 拿到租约前其他进程可能刚好完成
+            result = lookup()
+            if result:
+                self.store.release_lease(key, self.owner)
+                return result
+        return None
+
+    def _run_with_lease(self, key, fn):
+        if self.store is None:
+            return fn()
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.store.renew_lease(key, self.owner, self.lease_seconds)
+                except Exception as e:
+                    logger.error(f"租约续期失败: {e}")
+
+        t = threading.Thread(target=heartbeat, daemon=True)
+        t.start()
+        try:
+            return fn()
+        finally:
+            stop.set()
+            if self.release_hook is not None:
+                self.release_hook(key, self.owner)
+            else:
+                self.store.release_lease(key, self.owner)
@@ -0,0 +1,139 @@
+"""
+本地Coze接口替身，用于在没有真实工作流时调试同步、异步轮询和流式三种调用方式
+
+用法:
+    python sse_stub_server.py --port 8765
+    然后在 .streamlit/secrets.toml 中设置 API_URL = "http://127.0.0.1:8765/v1/workflow/run"
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_SUMMARY = """# 示例视频总结
+
+## 第一部分
+- 要点一
+- 要点二
+
+## 第二部分
+- 要点三
+"""
+SAMPLE_TRANSCRIPT = "这是一段示例逐字稿。" * 20
+
+# execute_id -> 已被查询的次数
+_executions = {}
+_executions_lock = threading.Lock()
+
+
+def sample_output():
+    return json.dumps({"transcript": SAMPLE_TRANSCRIPT, "summary": SAMPLE_SUMMARY}, ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 由命令行参数设置
+    chunk_delay = 0.05
+    running_polls = 2
+    empty_transcript = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _output(self):
+        if self.empty_transcript:
+            return json.dumps({"transcript": "", "summary": ""})
+        return sample_output()
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/v1/workflow/run":
+            if payload.get("is_async"):
+                execute_id = uuid.uuid4().hex
+                with _executions_lock:
+                    _executions[execute_id] = 0
+                self._send_json({"code": 0, "msg": "", "execute_id": execute_id})
+            else:
+                self._send_json({"code": 0, "msg": "", "data": self._output()})
+        elif self.path == "/v1/workflow/stream_run":
+            self._stream()
+        else:
+            self._send_json({"code": 4000, "msg": "not found"}, status=404)
+
+    def do_GET(self):
+        # /v1/workflows/{workflow_id}/run_histories/{execute_id}
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 5 and parts[1] == "workflows" and parts[3] == "run_histories":
+            execute_id = parts[4]
+            with _executions_lock:
+                if execute_id not in _executions:
+                    self._send_json({"code": 4000, "msg": "execute_id not found", "data": []})
+                    return
+                _executions[execute_id] += 1
+                polls = _executions[execute_id]
+            if polls <= self.running_polls:
+                record = {"execute_id": execute_id, "execute_status": "Running"}
+            else:
+                record = {
+                    "execute_id": execute_id,
+                    "execute_status": "Success",
+                    "output": json.dumps({"Output": self._output()}, ensure_ascii=False),
+                }
+            self._send_json({"code": 0, "msg": "", "data": [record]})
+        else:
+            self._send_json({"code": 4000, "msg": "not found"}, status=404)
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        seq = 0
+
+        def send(event, data):
+            nonlocal seq
+            chunk = f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            self.wfile.write(chunk.encode("utf-8"))
+            self.wfile.flush()
+            seq += 1
+
+        if not self.empty_transcript:
+            for line in SAMPLE_SUMMARY.splitlines(keepends=True):
+                send("Message", {"content": line, "node_title": "输出", "node_seq_id": str(seq), "node_is_finish": False})
+                time.sleep(self.chunk_delay)
+        send("Message", {"content": self._output(), "node_title": "End", "node_seq_id": "0", "node_is_finish": True})
+        send("Done", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地Coze接口替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="流式输出每段之间的间隔（秒）")
+    parser.add_argument("--running-polls", type=int, default=2, help="异步执行在返回成功前保持Running的查询次数")
+    parser.add_argument("--empty-transcript", action="store_true", help="返回空逐字稿，模拟无字幕视频")
+    args = parser.parse_args()
+
+    StubHandler.chunk_delay = args.chunk_delay
+    StubHandler.running_polls = args.running_polls
+    StubHandler.empty_transcript = args.empty_transcript
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Coze stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# 只配置了单个ACCESS_KEY时使用的租户名
+DEFAULT_TENANT = "default"
+
+
+def load_tenants(service):
+    """
+    读取访问密钥配置，每个密钥对应一个租户
+
+    secrets.toml 中的格式:
+        [my_service.ACCESS_KEYS.team_a]
+        key = "..."
+        daily_quota = 200   # 该密钥每天最多调用工作流的次数，0为不限
+        weight = 2          # 排队时的权重，权重越大分到的处理名额越多
+
+    原有的单个ACCESS_KEY仍然可用，对应default租户，不限额、权重为1。
+
+    参数:
+        service (dict): my_service配置段
+
+    返回:
+        dict: 访问密钥 -> {"name", "daily_quota", "weight"}
+    """
+    tenants = {}
+    legacy_key = service.get("ACCESS_KEY")
+    if legacy_key:
+        tenants[legacy_key] = {"name": DEFAULT_TENANT, "daily_quota": 0, "weight": 1.0}
+    for name, item in dict(service.get("ACCESS_KEYS", {})).items():
+        tenants[item["key"]] = {
+            "name": name,
+            "daily_quota": int(item.get("daily_quota", 0)),
+            "weight": max(0.01, float(item.get("weight", 1))),
+        }
+    return tenants
+
+
+def tenant_weights(tenants):
+    """
+    返回:
+        dict: 租户名 -> 权重
+    """
+    return {tenant["name"]: tenant["weight"] for tenant in tenants.values()}
+
+
+def tenant_usage_id(name):
+    # 租户的每日调用次数与用户计数存放在同一个计数库中
+    return f"tenant:{name}"
@@ -0,0 +1,122 @@
+import bisect
+import threading
+
+# 每页的目标字数，分页时尽量在句末断开
+PAGE_CHARS = 3000
+# 在目标字数之后最多再向后寻找句末的字数
+BREAK_LOOKAHEAD = 300
+# 句末标点，分页优先在这些字符之后断开
+SENTENCE_ENDS = "。！？!?；;\n"
+# 每个索引缓存的关键词查询结果数
+SEARCH_CACHE_SIZE = 64
+
+
+def split_pages(text, page_chars=PAGE_CHARS, lookahead=BREAK_LOOKAHEAD):
+    """
+    将逐字稿切分为若干页，返回每页的起始偏移
+
+    参数:
+        text (str): 逐字稿
+        page_chars (int): 每页目标字数
+        lookahead (int): 超过目标字数后向后寻找句末的范围
+
+    返回:
+        list: 每页在原文中的起始偏移，第一项为0
+    """
+    starts = [0]
+    pos = 0
+    length = len(text)
+    while length - pos > page_chars:
+        cut = pos + page_chars
+        window = text[cut:cut + lookahead]
+        breaks = [window.find(ch) for ch in SENTENCE_ENDS]
+        breaks = [i for i in breaks if i >= 0]
+        if breaks:
+            cut += min(breaks) + 1
+        if cut >= length:
+            break
+        starts.append(cut)
+        pos = cut
+    return starts
+
+
+class TranscriptIndex:
+    """
+    逐字稿的分页和页偏移索引：创建时切分页并转换一次小写，按页读取无需遍历全文；
+    关键词查询扫描预先转换的小写全文，同一关键词的结果缓存后直接返回，页面重跑时不再扫描
+    """
+
+    def __init__(self, text, page_chars=PAGE_CHARS):
+        """
+        初始化索引，只在创建时切分和转换小写一次
+
+        参数:
+            text (str): 逐字稿
+            page_chars (int): 每页目标字数
+        """
+        self.text = text or ""
+        self.page_starts = split_pages(self.text, page_chars)
+        self._lower = self.text.lower()
+        self._searches = {}
+        self._lock = threading.Lock()
+
+    @property
+    def page_count(self):
+        return len(self.page_starts)
+
+    def page(self, index):
+        """
+        读取第index页（从0开始）的内容
+        """
+        index = max(0, min(index, self.page_count - 1))
+        end = self.page_starts[index + 1] if index + 1 < self.page_count else len(self.text)
+        return self.text[self.page_starts[index]:end]
+
+    def page_of(self, offset):
+        """
+        根据原文偏移查找所在页（从0开始）
+        """
+        return bisect.bisect_right(self.page_starts, offset) - 1
+
+    def search(self, keyword, limit=200, context=20):
+        """
+        查找关键词出现的位置，忽略英文大小写
+
+        参数:
+            keyword (str): 关键词
+            limit (int): 最多返回的匹配数
+            context (int): 片段中关键词前后保留的字数
+
+        返回:
+            list: [{"offset", "page", "snippet"}]，page从0开始；多个会话共用同一结果，调用方不应修改
+        """
+        keyword = (keyword or "").strip().lower()
+        if not keyword:
+            return []
+        cache_key = (keyword, limit, context)
+        with self._lock:
+            cached = self._searches.get(cache_key)
+        if cached is not None:
+            return cached
+        matches = self._find(keyword, limit, context)
+        with self._lock:
+            if len(self._searches) >= SEARCH_CACHE_SIZE:
+                self._searches.clear()
+            self._searches[cache_key] = matches
+        return matches
+
+    def _find(self, keyword, limit, context):
+        haystack = self._lower
+        matches = []
+        pos = haystack.find(keyword)
+        while pos >= 0 and len(matches) < limit:
+            start = max(0, pos - context)
+            end = min(len(self.text), pos + len(keyword) + context)
+            snippet = self.text[start:end].replace("\n", " ")
+            matches.append({
+                "offset": pos,
+                "page": self.page_of(pos),
+                "snippet": ("…" if start > 0 else "") + snippet + ("…" if end < len(self.text) else ""),
+            })
+            pos = haystack.find(keyword, pos + len(keyword))
+        return matches
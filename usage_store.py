@@ -0,0 +1,196 @@
+import sqlite3
+import pickle
+import threading
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger("UsageStore")
+
+
+class UsageStore:
+    """
+    基于SQLite的调用次数计数，按 (用户, 日期) 存放，自增操作在多进程间原子执行
+    """
+
+    def __init__(self, db_path, retention_days=30, legacy_pickle=None):
+        """
+        初始化计数库
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            retention_days (int): 计数记录保留天数，更早的记录在每日首次写入时清理
+            legacy_pickle (str|Path): 旧版usage_data.pkl路径，存在时执行一次性迁移
+        """
+        self.db_path = str(db_path)
+        self.retention_days = retention_days
+        self._local = threading.local()
+        self._compacted_day = None
+        self._init_schema()
+        if legacy_pickle:
+            self._migrate_pickle(Path(legacy_pickle))
+
+    def _conn(self):
+        # 每个线程持有自己的连接，SQLite连接不能跨线程共享
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " user_id TEXT NOT NULL,"
+            " day TEXT NOT NULL,"
+            " call_count INTEGER NOT NULL DEFAULT 0,"
+            " last_call_time REAL,"
+            " PRIMARY KEY (user_id, day))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_day ON usage(day)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def _migrate_pickle(self, pickle_path):
+        """
+        将旧版usage_data.pkl导入SQLite，导入后把原文件改名保留
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'pickle_migrated'").fetchone():
+            return
+        rows = []
+        if pickle_path.exists():
+            try:
+                with open(pickle_path, "rb") as f:
+                    legacy = pickle.load(f)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                legacy = {}
+            for user_id, usage in legacy.items():
+                last_call_time = usage.get("last_call_time")
+                # 旧数据的用户标识已包含日期，按最后调用时间归到对应日期
+                day = last_call_time.strftime("%Y-%m-%d") if isinstance(last_call_time, datetime) else self.today()
+                rows.append((
+                    user_id, day, usage.get("call_count", 0),
+                    last_call_time.timestamp() if isinstance(last_call_time, datetime) else None,
+                ))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO usage (user_id, day, call_count, last_call_time) VALUES (?, ?, ?, ?)", rows
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('pickle_migrated', ?)", (datetime.now().isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if pickle_path.exists():
+            pickle_path.rename(pickle_path.with_suffix(pickle_path.suffix + ".migrated"))
+            logger.info("已从 %s 迁移 %d 条调用记录", pickle_path, len(rows))
+
+    @staticmethod
+    def today():
+        return datetime.now().strftime("%Y-%m-%d")
+
+    def get(self, user_id, day=None):
+        """
+        读取用户当天的调用记录，不存在时不会写入
+
+        参数:
+            user_id (str): 用户标识
+            day (str): 日期，默认今天
+
+        返回:
+            dict: {"call_count", "last_call_time"}
+        """
+        row = self._conn().execute(
+            "SELECT call_count, last_call_time FROM usage WHERE user_id = ? AND day = ?",
+            (user_id, day or self.today()),
+        ).fetchone()
+        if row is None:
+            return {"call_count": 0, "last_call_time": None}
+        return {
+            "call_count": row[0],
+            "last_call_time": datetime.fromtimestamp(row[1]) if row[1] is not None else None,
+        }
+
+    def get_count(self, user_id, day=None):
+        return self.get(user_id, day)["call_count"]
+
+    def increment(self, user_id, amount=1, when=None):
+        """
+        原子地增加用户当天的调用次数
+
+        参数:
+            user_id (str): 用户标识
+            amount (int): 增加的次数
+            when (datetime): 调用时间，默认当前时间
+
+        返回:
+            int: 增加后的调用次数
+        """
+        when = when or datetime.now()
+        day = when.strftime("%Y-%m-%d")
+        conn = self._conn()
+        row = conn.execute(
+            "INSERT INTO usage (user_id, day, call_count, last_call_time) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id, day) DO UPDATE SET "
+            " call_count = call_count + excluded.call_count,"
+            " last_call_time = excluded.last_call_time "
+            "RETURNING call_count",
+            (user_id, day, amount, when.timestamp()),
+        ).fetchone()
+        self._compact_daily(day)
+        return row[0]
+
+    def increment_many(self, items):
+        """
+        在一个事务中批量增加调用次数
+
+        参数:
+            items (list): [(用户标识, 增加的次数, 调用时间)]
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, amount, when in items:
+                conn.execute(
+                    "INSERT INTO usage (user_id, day, call_count, last_call_time) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id, day) DO UPDATE SET "
+                    " call_count = call_count + excluded.call_count,"
+                    " last_call_time = MAX(COALESCE(last_call_time, 0), excluded.last_call_time)",
+                    (user_id, when.strftime("%Y-%m-%d"), amount, when.timestamp()),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._compact_daily(self.today())
+
+    def set_synchronous(self, mode):
+        """
+        设置当前线程连接的落盘策略
+
+        参数:
+            mode (str): OFF / NORMAL / FULL
+        """
+        self._conn().execute(f"PRAGMA synchronous={mode}")
+
+    def _compact_daily(self, day):
+        # 每个进程每天最多清理一次过期记录
+        if self._compacted_day == day:
+            return
+        self._compacted_day = day
+        self.compact()
+
+    def compact(self):
+        """
+        删除超过保留天数的记录
+
+        返回:
+            int: 删除的记录数
+        """
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        cur = self._conn().execute("DELETE FROM usage WHERE day < ?", (cutoff,))
+        return cur.rowcount
@@ -77,15 +77,78 @@ def parse_workflow_response(response):
     except Exception as e:
         return False, f"解析响应时发生错误: {str(e)}"
 
-def parse_bilibili_url(url):
+# AV号与BV号互转所用的参数（B站2024年后的编码方式）
+_BV_XOR_CODE = 23442827791579
+_BV_MASK_CODE = 2251799813685247
+_BV_MAX_AID = 1 << 51
+_BV_ALPHABET = "FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf"
+_BV_ENCODE_MAP = (8, 7, 0, 5, 1, 3, 2, 4, 6)
+_BV_DECODE_MAP = tuple(reversed(_BV_ENCODE_MAP))
+_BV_BASE = 58
+_BV_PREFIX = "BV1"
+
+def av2bv(aid):
+    """
+    将AV号转换为BV号，无需请求B站接口
+    
+    参数:
+        aid (int): AV号（不含av前缀）
+        
+    返回:
+        str: BV号
+    """
+    bvid = [""] * len(_BV_ENCODE_MAP)
+    tmp = (_BV_MAX_AID | int(aid)) ^ _BV_XOR_CODE
+    for i in range(len(_BV_ENCODE_MAP)):
+        bvid[_BV_ENCODE_MAP[i]] = _BV_ALPHABET[tmp % _BV_BASE]
+        tmp //= _BV_BASE
+    return _BV_PREFIX + "".join(bvid)
+
+def bv2av(bvid):
+    """
+    将BV号转换为AV号
+    
+    参数:
+        bvid (str): BV号
+        
+    返回:
+        int: AV号，格式不正确时抛出ValueError
+    """
+    if len(bvid) != len(_BV_PREFIX) + len(_BV_ENCODE_MAP) or bvid[:3].upper() != _BV_PREFIX:
+        raise ValueError(f"BV号格式不正确: {bvid}")
+    tmp = 0
+    for i in range(len(_BV_DECODE_MAP)):
+        tmp = tmp * _BV_BASE + _BV_ALPHABET.index(bvid[3 + _BV_DECODE_MAP[i]])
+    return (tmp & _BV_MASK_CODE) ^ _BV_XOR_CODE
+
+def canonical_video_url(identity):
+    """
+    根据视频标识生成规范的视频链接，第1P不带分P参数
+    
+    参数:
+        identity (tuple): (BV号, 分P序号)
+        
+    返回:
+        str: 视频链接
     """
-    解析B站视频链接，提取视频ID并保留分P参数
+    bvid, part = identity
+    video_url = f"https://www.bilibili.com/video/{bvid}/"
+    if part > 1:
+        video_url = f"{video_url}?p={part}"
+    return video_url
+
+def parse_video_identity(url):
+    """
+    解析B站视频链接，得到规范的视频标识 (BV号, 分P序号)
+    
+    AV号会在本地转换为BV号，未指定分P时视为第1P，
+    因此同一视频的av链接、BV链接、p=1和不带p的链接得到相同的标识。
     
     参数:
         url (str): B站视频链接
         
     返回:
-        tuple: (成功标志, 解析后的视频链接或错误信息)
+        tuple: (成功标志, (BV号, 分P序号)或错误信息)
     """
     try:
         if not url:
@@ -94,49 +157,112 @@ def parse_bilibili_url(url):
         # 首先检查URL格式是否合法
         if "bilibili.com/video/" not in url:
             return False, "请提供完整的B站视频链接，如: https://www.bilibili.com/video/BV1xx411c7mD/"
+        
+        # 检查是否包含分P参数
+        part = 1
+        p_match = re.search(r'[?&]p=(\d+)', url)
+        if p_match:
+            part = max(1, int(p_match.group(1)))
             
         # 尝试匹配BV号
-        bv_pattern = r'(?:BV|bv)([a-zA-Z0-9]+)'
-        bv_match = re.search(bv_pattern, url)
-        
+        bv_match = re.search(r'(?:BV|bv)([a-zA-Z0-9]+)', url)
         if bv_match:
-            bv_id = f"BV{bv_match.group(1)}"
-            
-            # 构造规范的视频URL
-            video_url = f"https://www.bilibili.com/video/{bv_id}/"
-            
-            # 检查是否包含分P参数
-            p_pattern = r'[?&]p=(\d+)'
-            p_match = re.search(p_pattern, url)
-            
-            if p_match:
-                p_value = p_match.group(1)
-                video_url = f"{video_url}?p={p_value}"
-                
-            return True, video_url
-        
-        # 如果没有匹配到BV号，尝试匹配AV号
-        av_pattern = r'(?:AV|av)(\d+)'
-        av_match = re.search(av_pattern, url, re.IGNORECASE)
+            bvid = f"BV{bv_match.group(1)}"
+            # 标准BV号可以与AV号互转，借此规范大小写等写法差异
+            try:
+                bvid = av2bv(bv2av(bvid))
+            except ValueError:
+                pass
+            return True, (bvid, part)
         
+        # 如果没有匹配到BV号，尝试匹配AV号并在本地转换
+        av_match = re.search(r'(?:AV|av)(\d+)', url, re.IGNORECASE)
         if av_match:
-            av_id = f"av{av_match.group(1)}"
-            
-            # 构造规范的视频URL
-            video_url = f"https://www.bilibili.com/video/{av_id}/"
-            
-            # 检查是否包含分P参数
-            p_pattern = r'[?&]p=(\d+)'
-            p_match = re.search(p_pattern, url)
-            
-            if p_match:
-                p_value = p_match.group(1)
-                video_url = f"{video_url}?p={p_value}"
-                
-            return True, video_url
+            aid = int(av_match.group(1))
+            if 0 < aid < _BV_MAX_AID:
+                return True, (av2bv(aid), part)
         
         # 如果都没有匹配到，则认为链接格式不正确
         return False, "无法识别的B站视频链接格式，请确保链接包含正确的BV号或AV号"
     
     except Exception as e:
-        return False, f"解析视频链接时发生错误: {str(e)}" 
\ No newline at end of file
+        return False, f"解析视频链接时发生错误: {str(e)}"
+
+def parse_bilibili_url(url):
+    """
+    解析B站视频链接，返回规范化的视频链接
+    
+    参数:
+        url (str): B站视频链接
+        
+    返回:
+        tuple: (成功标志, 解析后的视频链接或错误信息)
+    """
+    success, identity = parse_video_identity(url)
+    if not success:
+        return False, identity
+    return True, canonical_video_url(identity)
+
+def make_cache_key(identity):
+    """
+    根据视频标识生成结果缓存键
+    
+    参数:
+        identity (tuple): parse_video_identity返回的 (BV号, 分P序号)
+        
+    返回:
+        str: 缓存键
+    """
+    bvid, part = identity
+    return json.dumps({"bvid": bvid, "p": part}, sort_keys=True)
+
+def cache_key_identity(key):
+    """
+    从缓存键还原视频标识
+    
+    参数:
+        key (str): make_cache_key生成的缓存键
+        
+    返回:
+        tuple: (BV号, 分P序号)，无法识别时返回None
+    """
+    try:
+        data = json.loads(key)
+        return data["bvid"], int(data.get("p") or 1)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+def cache_key_bvid(key):
+    """
+    从缓存键中取出BV号
+    
+    参数:
+        key (str): make_cache_key生成的缓存键
+        
+    返回:
+        str: BV号，无法识别时返回None
+    """
+    identity = cache_key_identity(key)
+    return identity[0] if identity else None
+
+# 缓存键格式版本，变更格式时递增并提供升级函数
+CACHE_KEY_VERSION = 2
+
+def upgrade_cache_key(old_key):
+    """
+    将旧格式 {"url": ...} 的缓存键转换为按视频标识的新格式
+    
+    参数:
+        old_key (str): 旧缓存键
+        
+    返回:
+        str: 新缓存键，无法识别时返回None
+    """
+    try:
+        url = json.loads(old_key).get("url")
+    except (ValueError, AttributeError):
+        return None
+    success, identity = parse_video_identity(url or "")
+    if not success:
+        return None
+    return make_cache_key(identity)
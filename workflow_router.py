@@ -0,0 +1,298 @@
+import time
+import random
+import sqlite3
+import threading
+import logging
+
+import requests
+
+from retry_policy import OUTCOME_OK, OUTCOME_EMPTY
+from workflow_runner import PRIMARY_API, BACKUP_API
+
+logger = logging.getLogger("WorkflowRouter")
+
+# 路由方式
+ROUTE_AUTO = "auto"          # 按历史结果预测
+ROUTE_SUBTITLE = "subtitle"  # 先调用字幕工作流，失败后语音识别（原有顺序）
+ROUTE_ASR = "asr"            # 直接调用语音识别工作流，失败后再尝试字幕
+ROUTES = (ROUTE_AUTO, ROUTE_SUBTITLE, ROUTE_ASR)
+
+# 统计范围，从具体到宽泛
+SCOPE_VIDEO = "video"
+SCOPE_UPLOADER = "uploader"
+SCOPE_TYPE = "type"
+SCOPE_SUBTITLE = "subtitle_list"  # 视频信息接口是否返回CC字幕列表
+SCOPE_GLOBAL = "global"
+SCOPE_LABELS = {SCOPE_VIDEO: "本视频", SCOPE_UPLOADER: "该UP主", SCOPE_TYPE: "该分区", SCOPE_GLOBAL: "全部视频"}
+SUBTITLE_LABELS = {"1": "有CC字幕列表的视频", "0": "无CC字幕列表的视频"}
+
+VIEW_API_URL = "https://api.bilibili.com/x/web-interface/view"
+# 视频信息缓存时间（秒），字幕可能在投稿后补充
+META_TTL_SECONDS = 7 * 86400
+
+
+def fetch_video_meta(bvid, cookies, timeout=3.0):
+    """
+    从B站视频信息接口读取UP主、分区和CC字幕情况
+
+    参数:
+        bvid (str): BV号
+        cookies (dict): B站cookie字典，未登录时接口不返回字幕列表
+        timeout (float): 超时时间（秒）
+
+    返回:
+        dict: {"uploader", "type", "has_subtitle"}，请求失败时返回None
+    """
+    try:
+        response = requests.get(
+            VIEW_API_URL, params={"bvid": bvid}, cookies=cookies, timeout=timeout,
+            headers={"User-Agent": "Mozilla/5.0", "Referer": "https://www.bilibili.com/"},
+        )
+        body = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"读取视频信息失败 {bvid}: {e}")
+        return None
+    if body.get("code") != 0 or not isinstance(body.get("data"), dict):
+        logger.warning(f"读取视频信息失败 {bvid}: {body.get('message')}")
+        return None
+    data = body["data"]
+    subtitle = data.get("subtitle") or {}
+    return {
+        "uploader": str((data.get("owner") or {}).get("mid") or "") or None,
+        "type": data.get("tname") or (str(data["tid"]) if data.get("tid") else None),
+        "has_subtitle": bool(subtitle.get("list")),
+    }
+
+
+class WorkflowRouter:
+    """
+    记录字幕工作流和语音识别工作流按视频、UP主、分区的结果和耗时，预测应先调用哪个工作流
+
+    字幕工作流在没有字幕的视频上只会返回空逐字稿，预测这类视频时直接调用语音识别，
+    省去字幕工作流的调用和重试等待。视频信息接口是否返回CC字幕列表只作为其中一个统计范围：
+    未登录的cookie和AI字幕都可能返回空列表，实际效果以历史结果为准。
+    统计存放在SQLite中，页面、任务工作进程和批处理共用。
+    """
+
+    def __init__(self, db_path, cookies=None, mode=ROUTE_AUTO, overrides=None, fetch_meta=True, asr_threshold=0.25,
+                 min_samples=3, prior_weight=2.0, explore_rate=0.05):
+        """
+        初始化路由器
+
+        参数:
+            db_path (str|Path): SQLite数据库文件路径
+            mode (str): ROUTE_AUTO按预测路由；ROUTE_SUBTITLE / ROUTE_ASR 对所有视频强制使用该路由
+            overrides (dict): BV号 -> 路由，对单个视频强制使用该路由
+            cookies (dict): 读取视频信息时使用的B站cookie
+            fetch_meta (bool): 是否读取视频信息（UP主、分区、CC字幕）
+            asr_threshold (float): 字幕工作流成功概率低于该值时直接调用语音识别
+            min_samples (int): 历史结果少于该数量时不做判断，按原有顺序调用
+            prior_weight (float): 具体范围的估计向更宽范围收缩时，更宽范围估计所占的等效样本数
+            explore_rate (float): 预测为语音识别时仍先提取字幕的比例，使字幕提取的估计能随新结果修正
+        """
+        self.db_path = str(db_path)
+        self.cookies = cookies or {}
+        self.mode = mode if mode in ROUTES else ROUTE_AUTO
+        self.overrides = {bvid: route for bvid, route in (overrides or {}).items() if route in ROUTES}
+        self.fetch_meta = fetch_meta
+        self.asr_threshold = asr_threshold
+        self.min_samples = min_samples
+        self.prior_weight = prior_weight
+        self.explore_rate = explore_rate
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.decisions = {ROUTE_SUBTITLE: 0, ROUTE_ASR: 0}
+        self.explored = 0
+        self._init_schema()
+
+    def _conn(self):
+        # 每个线程持有自己的连接，SQLite连接不能跨线程共享
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS route_stats ("
+            " scope TEXT NOT NULL,"
+            " scope_key TEXT NOT NULL,"
+            " api TEXT NOT NULL,"
+            " ok INTEGER NOT NULL DEFAULT 0,"
+            " empty INTEGER NOT NULL DEFAULT 0,"
+            " total_seconds REAL NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (scope, scope_key, api))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS video_meta ("
+            " bvid TEXT PRIMARY KEY,"
+            " uploader TEXT,"
+            " type TEXT,"
+            " has_subtitle INTEGER,"
+            " fetched_at REAL NOT NULL)"
+        )
+
+    def features(self, bvid):
+        """
+        取得视频的路由特征，视频信息优先读取本地缓存
+
+        返回:
+            dict: {"bvid", "uploader", "type", "has_subtitle"}，未知的字段为None
+        """
+        features = {"bvid": bvid, "uploader": None, "type": None, "has_subtitle": None}
+        if not bvid:
+            return features
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT uploader, type, has_subtitle, fetched_at FROM video_meta WHERE bvid = ?", (bvid,)
+        ).fetchone()
+        if row and row[3] >= time.time() - META_TTL_SECONDS:
+            features.update(uploader=row[0], type=row[1], has_subtitle=None if row[2] is None else bool(row[2]))
+            return features
+        meta = fetch_video_meta(bvid, self.cookies) if self.fetch_meta else None
+        if meta is None:
+            return features
+        features.update(meta)
+        conn.execute(
+            "INSERT OR REPLACE INTO video_meta (bvid, uploader, type, has_subtitle, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (bvid, meta["uploader"], meta["type"], int(meta["has_subtitle"]), time.time()),
+        )
+        return features
+
+    @staticmethod
+    def _scopes(features):
+        scopes = [(SCOPE_GLOBAL, "*")]
+        if features.get("has_subtitle") is not None:
+            scopes.append((SCOPE_SUBTITLE, "1" if features["has_subtitle"] else "0"))
+        for scope, field in ((SCOPE_TYPE, "type"), (SCOPE_UPLOADER, "uploader"), (SCOPE_VIDEO, "bvid")):
+            if features.get(field):
+                scopes.append((scope, features[field]))
+        return scopes
+
+    def record(self, features, api, outcome, seconds):
+        """
+        记录一次工作流调用的结果，只记录与视频内容有关的结果（有效逐字稿或空逐字稿）
+
+        参数:
+            features (dict): features()返回的路由特征
+            api (str): PRIMARY_API / BACKUP_API
+            outcome (str): classify_result的结果分类
+            seconds (float): 调用耗时
+        """
+        if outcome not in (OUTCOME_OK, OUTCOME_EMPTY):
+            return
+        ok, empty = (1, 0) if outcome == OUTCOME_OK else (0, 1)
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for scope, scope_key in self._scopes(features):
+                conn.execute(
+                    "INSERT INTO route_stats (scope, scope_key, api, ok, empty, total_seconds, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(scope, scope_key, api) DO UPDATE SET ok = ok + excluded.ok, "
+                    "empty = empty + excluded.empty, total_seconds = total_seconds + excluded.total_seconds, "
+                    "updated_at = excluded.updated_at",
+                    (scope, scope_key, api, ok, empty, seconds, now),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _counts(self, scope, scope_key, api):
+        row = self._conn().execute(
+            "SELECT ok, empty, total_seconds FROM route_stats WHERE scope = ? AND scope_key = ? AND api = ?",
+            (scope, scope_key, api),
+        ).fetchone()
+        return row or (0, 0, 0.0)
+
+    def predict(self, features):
+        """
+        预测应先调用的工作流，并给出依据
+
+        字幕工作流的成功概率从全部视频逐级收缩估计到有无CC字幕列表、分区、UP主和本视频：
+        每一级以上一级的估计为先验，样本越多越接近本级的实际比例。
+        预测为语音识别时按explore_rate的比例仍先提取字幕，避免估计偏低后再也得不到字幕提取的结果。
+
+        参数:
+            features (dict): features()返回的路由特征
+
+        返回:
+            dict: {"route", "reason", "subtitle_success", "evidence"}；
+                evidence为各统计范围的 {"scope", "ok", "empty", "estimate", "avg_seconds"}
+        """
+        estimate = 0.5
+        samples = 0
+        evidence = []
+        for scope, scope_key in self._scopes(features):
+            ok, empty, total_seconds = self._counts(scope, scope_key, PRIMARY_API)
+            n = ok + empty
+            estimate = (ok + self.prior_weight * estimate) / (n + self.prior_weight)
+            samples += n
+            backup_ok, backup_empty, backup_seconds = self._counts(scope, scope_key, BACKUP_API)
+            backup_n = backup_ok + backup_empty
+            evidence.append({
+                "scope": SUBTITLE_LABELS[scope_key] if scope == SCOPE_SUBTITLE else SCOPE_LABELS[scope],
+                "ok": ok,
+                "empty": empty,
+                "estimate": round(estimate, 3),
+                "avg_seconds": {
+                    PRIMARY_API: round(total_seconds / n, 1) if n else None,
+                    BACKUP_API: round(backup_seconds / backup_n, 1) if backup_n else None,
+                },
+            })
+
+        override = self.overrides.get(features.get("bvid"), self.mode)
+        if override != ROUTE_AUTO:
+            route, reason = override, "已配置强制路由"
+        elif samples < self.min_samples:
+            route, reason = ROUTE_SUBTITLE, "历史结果不足"
+        elif estimate >= self.asr_threshold:
+            route, reason = ROUTE_SUBTITLE, f"字幕提取预计成功率 {estimate:.0%}"
+        elif random.random() < self.explore_rate:
+            route, reason = ROUTE_SUBTITLE, f"字幕提取预计成功率 {estimate:.0%}，抽样重新验证字幕提取"
+            with self._lock:
+                self.explored += 1
+        else:
+            route, reason = ROUTE_ASR, f"字幕提取预计成功率 {estimate:.0%}，低于 {self.asr_threshold:.0%}"
+        with self._lock:
+            self.decisions[route] += 1
+        return {"route": route, "reason": reason, "subtitle_success": round(estimate, 3), "evidence": evidence}
+
+    def plan(self, bvid):
+        """
+        取得视频特征并预测路由
+
+        返回:
+            tuple: (路由特征, 预测结果)
+        """
+        features = self.features(bvid)
+        decision = self.predict(features)
+        logger.info(f"{bvid} 路由到 {decision['route']}: {decision['reason']}")
+        return features, decision
+
+    def observer(self, features):
+        """
+        返回传给WorkflowRunner.run的on_attempt回调，记录该视频每次调用的结果
+        """
+        def on_attempt(api, outcome, seconds):
+            self.record(features, api, outcome, seconds)
+        return on_attempt
+
+    def stats(self):
+        """
+        路由决策次数和全部视频范围内各工作流的结果统计
+        """
+        outcomes = {}
+        for api, ok, empty, total_seconds in self._conn().execute(
+                "SELECT api, ok, empty, total_seconds FROM route_stats WHERE scope = ?", (SCOPE_GLOBAL,)):
+            n = ok + empty
+            outcomes[api] = {"ok": ok, "empty": empty, "avg_seconds": round(total_seconds / n, 1) if n else None}
+        with self._lock:
+            return {"decisions": dict(self.decisions), "explored": self.explored, "outcomes": outcomes}
@@ -0,0 +1,445 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import parse_workflow_response
+from cancellation import CancelToken, cancelled_result, is_cancelled_result
+from retry_policy import (
+    RetryPolicy, Deadline, CircuitBreakerRegistry, classify_result, counts_as_service_failure,
+    OUTCOME_OK, OUTCOME_EMPTY, OUTCOME_FATAL,
+)
+
+logger = logging.getLogger("WorkflowRunner")
+
+# 结果中记录的API来源
+PRIMARY_API = "new_api"  # 字幕提取工作流
+BACKUP_API = "old_api"   # 语音识别工作流
+
+FAILED_MESSAGE = "视频内容解析失败：无法获取视频脚本或语音识别结果为空"
+
+
+def is_valid_result(result):
+    """
+    判断工作流响应是否包含非空的逐字稿
+
+    参数:
+        result (dict): 工作流API响应
+
+    返回:
+        bool: 是否为可用结果
+    """
+    return classify_result(result) == OUTCOME_OK
+
+
+def to_result_data(result, api_used):
+    """
+    将工作流响应转换为可缓存的结果数据
+
+    参数:
+        result (dict): 工作流API响应
+        api_used (str): 使用的API
+
+    返回:
+        dict: 结果数据；失败时包含error和message
+    """
+    parse_success, data = parse_workflow_response(result)
+    if not parse_success:
+        return {"error": True, "message": data, "raw": result}
+
+    # 检查transcript内容是否为空
+    transcript = data.get("transcript", "")
+    if not transcript or transcript.strip() == "":
+        return {
+            "error": True,
+            "message": FAILED_MESSAGE,
+            "raw": result
+        }
+
+    # 在结果数据中添加使用的API信息
+    data["api_used"] = api_used
+    return data
+
+
+def is_content_failure(result):
+    """
+    判断失败是否由视频本身导致（两个工作流都返回空逐字稿或不可重试的错误），
+    超时、熔断等临时故障返回False，这类失败不应记入失败缓存
+
+    参数:
+        result (dict): WorkflowRunner.run失败时返回的结果
+
+    返回:
+        bool: 是否为视频本身导致的失败
+    """
+    outcomes = (result or {}).get("outcomes") or {}
+    if BACKUP_API not in outcomes:
+        return False
+    return all(outcome in (OUTCOME_EMPTY, OUTCOME_FATAL) for outcome in outcomes.values())
+
+
+class HedgeStats:
+    """
+    记录对冲触发次数和各工作流胜出次数，用于权衡对冲延迟与调用成本
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.hedges_fired = 0
+        self.fallbacks = 0
+        self.wins = {PRIMARY_API: 0, BACKUP_API: 0}
+        self.hedged_wins = {PRIMARY_API: 0, BACKUP_API: 0}
+        self.failures = 0
+        self.cancelled_runs = 0
+        self.cancelled_attempts = 0
+        self.wasted_attempts = 0
+
+    def record_cancelled_run(self):
+        with self._lock:
+            self.cancelled_runs += 1
+
+    def record_attempt(self, cancelled=False, wasted=False):
+        # cancelled: 调用因取消而提前结束；wasted: 调用完成时结果已不再需要
+        with self._lock:
+            if cancelled:
+                self.cancelled_attempts += 1
+            if wasted:
+                self.wasted_attempts += 1
+
+    def record(self, winner, hedged, fallback):
+        with self._lock:
+            self.runs += 1
+            if hedged:
+                self.hedges_fired += 1
+            if fallback:
+                self.fallbacks += 1
+            if winner is None:
+                self.failures += 1
+                return
+            self.wins[winner] += 1
+            if hedged:
+                self.hedged_wins[winner] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "hedges_fired": self.hedges_fired,
+                "hedge_rate": self.hedges_fired / self.runs if self.runs else 0.0,
+                "fallbacks": self.fallbacks,
+                "wins": dict(self.wins),
+                "hedged_wins": dict(self.hedged_wins),
+                "failures": self.failures,
+                "cancelled_runs": self.cancelled_runs,
+                "cancelled_attempts": self.cancelled_attempts,
+                "wasted_attempts": self.wasted_attempts,
+            }
+
+
+class WorkflowRunner:
+    """
+    调度字幕工作流（主）和语音识别工作流（备），不依赖Streamlit，可在页面和后台任务中复用
+
+    hedge_delay为None时按原有顺序执行：主工作流全部重试失败后再启动备用工作流；
+    设置hedge_delay后，主工作流在该时间内未成功就并行启动备用工作流，先得到有效逐字稿者胜出。
+    """
+
+    def __init__(self, primary_client, backup_client, cookies, async_mode=False, hedge_delay=None,
+                 primary_policy=None, backup_policy=None, deadline_seconds=1800, breakers=None,
+                 max_workers=16, rate_limiter=None):
+        """
+        初始化工作流调度器
+
+        参数:
+            primary_client (CozeAPI): 字幕提取工作流客户端，为None时直接使用备用工作流
+            backup_client (CozeAPI): 语音识别工作流客户端
+            cookies (dict): B站cookie字典
+            async_mode (bool): 是否以异步提交加轮询的方式调用工作流
+            hedge_delay (float): 对冲延迟（秒），None表示不对冲
+            primary_policy (RetryPolicy): 主工作流重试策略，默认调用2次，逐字稿为空时不重试
+            backup_policy (RetryPolicy): 备用工作流重试策略，默认调用2次
+            deadline_seconds (float): 单次运行的端到端时间预算（秒）
+            breakers (CircuitBreakerRegistry): 按工作流ID的熔断器
+            max_workers (int): 执行工作流调用的线程数
+            rate_limiter (TokenBucketLimiter): 按工作流ID的调用限速，为None时不限速
+        """
+        self.primary_client = primary_client
+        self.backup_client = backup_client
+        self.cookies = cookies
+        self.async_mode = async_mode
+        self.hedge_delay = hedge_delay
+        # 没有字幕的视频重试字幕工作流也不会成功，空结果直接交给语音识别
+        self.primary_policy = primary_policy or RetryPolicy(max_attempts=2, base_delay=1.0, retry_on_empty=False)
+        self.backup_policy = backup_policy or RetryPolicy(max_attempts=2, base_delay=3.0)
+        self.deadline_seconds = deadline_seconds
+        self.breakers = breakers or CircuitBreakerRegistry()
+        self.rate_limiter = rate_limiter
+        self.stats = HedgeStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="workflow")
+
+    def _call_primary(self, video_url, on_progress, timeout, cancel):
+        return self.primary_client.run_workflow_with_cookies(
+            video_url, self.cookies, async_mode=self.async_mode, on_progress=on_progress, timeout=timeout,
+            cancel=cancel,
+        )
+
+    def _call_backup(self, video_url, on_progress, timeout, cancel):
+        # 使用旧的参数格式
+        parameters = {
+            "url": video_url,
+            "title": "B站视频思维导图"
+        }
+        if self.async_mode:
+            return self.backup_client.run_workflow_polling(parameters, timeout=timeout, on_progress=on_progress,
+                                                           cancel=cancel)
+        return self.backup_client.run_workflow(parameters, timeout=timeout, cancel=cancel)
+
+    def _attempts(self, api_name, client, call, policy, deadline, reserve_attempts, video_url, stop, progress,
+                  outcomes, on_attempt):
+        # 在后台线程中按重试策略调用，stop被设置、时间预算耗尽或熔断时不再发起新的调用；
+        # reserve_attempts为之后可能启动的工作流预留的调用次数，分配超时时一并计入；
+        # outcomes记录每个工作流最后一次调用的结果分类，未能发起调用时记为skipped，调用被取消时记为cancelled；
+        # stop同时作为取消标记传给调用，异步轮询在被取消后立即返回；
+        # on_attempt在每次调用完成后回调 (工作流, 结果分类, 耗时秒数)，用于路由统计
+        breaker = self.breakers.get(client.workflow_id)
+        outcomes.setdefault(api_name, "skipped")
+
+        def on_progress(status, elapsed):
+            progress[api_name] = (status, elapsed)
+
+        for attempt in range(policy.max_attempts):
+            if stop.cancelled:
+                return None
+            timeout = deadline.split(policy.max_attempts - attempt + reserve_attempts)
+            if timeout < policy.min_attempt_timeout:
+                logger.error(f"{api_name} 剩余时间预算不足，停止重试")
+                return None
+            if self.rate_limiter is not None and not self.rate_limiter.take(
+                    client.workflow_id, cancel=stop, timeout=timeout - policy.min_attempt_timeout):
+                # 等待令牌期间被取消或占用了调用所需的时间预算
+                if not stop.cancelled:
+                    logger.error(f"{api_name} 等待限速令牌超时，停止调用")
+                return None
+            timeout = min(timeout, deadline.split(policy.max_attempts - attempt + reserve_attempts))
+            if not breaker.allow():
+                logger.error(f"{api_name} 处于熔断状态，跳过调用")
+                return None
+            started = time.monotonic()
+            try:
+                result = call(video_url, on_progress, timeout, stop)
+            except Exception as e:
+                logger.error(f"{api_name} 调用异常: {e}")
+                result = {"error": True, "error_type": "exception", "message": str(e)}
+
+            if is_cancelled_result(result):
+                # 取消的调用不反映服务状态，归还熔断器的探测名额
+                breaker.release()
+                outcomes[api_name] = "cancelled"
+                self.stats.record_attempt(cancelled=True)
+                return None
+            if stop.cancelled:
+                # 同步调用无法中途中断，完成时已有胜出者或运行已取消，结果不再使用
+                self.stats.record_attempt(wasted=True)
+            outcome = classify_result(result)
+            outcomes[api_name] = outcome
+            if on_attempt is not None:
+                try:
+                    on_attempt(api_name, outcome, time.monotonic() - started)
+                except Exception as e:
+                    logger.error(f"记录调用结果失败: {e}")
+            if counts_as_service_failure(result, outcome):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if outcome == OUTCOME_OK:
+                return result
+            if not policy.should_retry(outcome) or attempt + 1 >= policy.max_attempts:
+                return None
+            delay = policy.backoff(attempt)
+            if delay >= deadline.remaining() or stop.wait(delay):
+                return None
+        return None
+
+    def stream_primary(self, video_url):
+        """
+        以流式方式调用主工作流，便于页面逐段显示总结
+
+        参数:
+            video_url (str): 视频URL
+
+        返回:
+            WorkflowStream: 流式结果，主工作流不可用、处于熔断或被限速时返回None
+        """
+        if self.primary_client is None:
+            return None
+        # 先检查熔断再取令牌，熔断时不占用其他调用方的令牌
+        breaker = self.breakers.get(self.primary_client.workflow_id)
+        if not breaker.allow():
+            return None
+        if self.rate_limiter is not None and self.rate_limiter.try_take(self.primary_client.workflow_id):
+            # 没有可用令牌时不等待，交给run()排队调用，归还熔断器的探测名额
+            breaker.release()
+            return None
+        try:
+            return self.primary_client.stream_workflow_with_cookies(
+                video_url, self.cookies, timeout=self.deadline_seconds
+            )
+        except BaseException:
+            breaker.release()
+            raise
+
+    def record_stream_result(self, result, elapsed=None, on_attempt=None):
+        """
+        记录流式调用的结果，更新主工作流的熔断状态
+
+        参数:
+            result (dict): WorkflowStream.result()的返回
+            elapsed (float): 调用耗时（秒）
+            on_attempt (callable): 同run()的on_attempt
+
+        返回:
+            bool: 是否为可用结果
+        """
+        breaker = self.breakers.get(self.primary_client.workflow_id)
+        if is_cancelled_result(result):
+            # 取消的调用不反映服务状态，归还熔断器的探测名额
+            breaker.release()
+            self.stats.record_attempt(cancelled=True)
+            return False
+        outcome = classify_result(result)
+        if on_attempt is not None:
+            try:
+                on_attempt(PRIMARY_API, outcome, elapsed or 0.0)
+            except Exception as e:
+                logger.error(f"记录调用结果失败: {e}")
+        if counts_as_service_failure(result, outcome):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return outcome == OUTCOME_OK
+
+    def run(self, video_url, on_tick=None, tick_interval=1.0, cancel=None, route=None, on_attempt=None,
+            primary_outcome=None):
+        """
+        运行工作流，返回第一个有效结果
+
+        参数:
+            video_url (str): 视频URL
+            on_tick (callable): 在调用线程中周期性回调，参数为状态字典
+                (elapsed, backup_started, hedged, progress)，可用于刷新页面
+            tick_interval (float): 回调间隔（秒）
+            cancel (CancelToken): 取消标记，被取消后停止重试和轮询，最迟一个回调间隔后返回
+            route (str): "asr"时先调用语音识别工作流，失败后再调用字幕工作流，不对冲；
+                其他值按原有顺序（见WorkflowRouter）
+            on_attempt (callable): 每次调用完成后在工作线程中回调 (工作流, 结果分类, 耗时秒数)
+            primary_outcome (str): 主工作流已以流式方式调用且失败时传入其结果分类，
+                不再重复调用主工作流，直接调用备用工作流
+
+        返回:
+            tuple: (结果, 成功标志, 使用的API)；被取消时结果的error_type为cancelled
+        """
+        stop = CancelToken(parent=cancel)
+        deadline = Deadline(self.deadline_seconds)
+        progress = {}
+        outcomes = {}
+        futures = {}
+        start = time.monotonic()
+        backup_started = False
+        primary_started = False
+        hedged = False
+        fallback = False
+        asr_first = route == "asr" and self.primary_client is not None
+        skip_primary = primary_outcome is not None and self.primary_client is not None
+        if skip_primary:
+            outcomes[PRIMARY_API] = primary_outcome
+
+        def start_primary(reserve_attempts):
+            futures[self._executor.submit(
+                self._attempts, PRIMARY_API, self.primary_client, self._call_primary, self.primary_policy,
+                deadline, reserve_attempts, video_url, stop, progress, outcomes, on_attempt
+            )] = PRIMARY_API
+
+        def start_backup(reserve_attempts=0):
+            futures[self._executor.submit(
+                self._attempts, BACKUP_API, self.backup_client, self._call_backup, self.backup_policy,
+                deadline, reserve_attempts, video_url, stop, progress, outcomes, on_attempt
+            )] = BACKUP_API
+
+        if self.primary_client is None:
+            start_backup()
+            backup_started = True
+        elif skip_primary:
+            # 流式调用已失败，回退到备用工作流
+            fallback = True
+            start_backup()
+            backup_started = True
+        elif asr_first:
+            # 预测字幕工作流会返回空逐字稿，直接语音识别，为字幕工作流保留回退的时间预算
+            start_backup(self.primary_policy.max_attempts)
+            backup_started = True
+        else:
+            start_primary(self.backup_policy.max_attempts)
+            primary_started = True
+
+        winner = None
+        try:
+            while futures and winner is None:
+                if stop.cancelled:
+                    break
+                timeout = tick_interval
+                if not backup_started and self.hedge_delay is not None:
+                    timeout = max(0.0, min(tick_interval, start + self.hedge_delay - time.monotonic()))
+                done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    api_name = futures.pop(future)
+                    result = future.result()
+                    if result is not None and winner is None:
+                        winner = (result, api_name)
+                if winner is not None or stop.cancelled:
+                    break
+
+                if not backup_started:
+                    primary_running = PRIMARY_API in futures.values()
+                    elapsed = time.monotonic() - start
+                    if not primary_running:
+                        # 主工作流已失败，回退到备用工作流
+                        fallback = True
+                        start_backup()
+                        backup_started = True
+                    elif self.hedge_delay is not None and elapsed >= self.hedge_delay:
+                        # 主工作流超过对冲延迟仍未成功，并行启动备用工作流
+                        hedged = True
+                        start_backup()
+                        backup_started = True
+                elif asr_first and not primary_started and BACKUP_API not in futures.values():
+                    # 语音识别失败，回退到字幕工作流
+                    fallback = True
+                    start_primary(0)
+                    primary_started = True
+
+                if on_tick:
+                    on_tick({
+                        "elapsed": time.monotonic() - start,
+                        "backup_started": backup_started,
+                        "hedged": hedged,
+                        "progress": dict(progress),
+                    })
+        finally:
+            # 通知落后的一方不再发起新的重试，正在轮询的调用立即返回，其余调用的结果会被忽略；
+            # on_tick抛出异常时同样会停止后台调用
+            stop.cancel("finished")
+
+        if winner is None and cancel is not None and cancel.cancelled:
+            self.stats.record_cancelled_run()
+            logger.info(f"工作流运行已取消: {cancel.reason}")
+            return cancelled_result(cancel.reason, outcomes=dict(outcomes)), False, None
+
+        self.stats.record(winner[1] if winner else None, hedged, fallback)
+
+        if winner is None:
+            return {
+                "error": True,
+                "message": FAILED_MESSAGE,
+                "outcomes": dict(outcomes),
+            }, False, None
+        return winner[0], True, winner[1]
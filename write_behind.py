@@ -0,0 +1,256 @@
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger("WriteBehind")
+
+# 落盘策略，对应SQLite的PRAGMA synchronous
+SYNC_OFF = "OFF"        # 交给操作系统决定何时写盘
+SYNC_NORMAL = "NORMAL"  # WAL模式下检查点时写盘，进程崩溃不丢数据
+SYNC_FULL = "FULL"      # 每个批次提交时都写盘
+
+
+class WriteBehind:
+    """
+    后台写入线程：请求路径只把持久化操作放入队列，由后台线程合并后按批次写入
+
+    每类操作通过register注册批量写入函数，相同类型、相同key的操作在写入前合并，
+    合并方式由merge决定（默认后写覆盖先写）。各类操作按注册顺序写入。
+    批量写入失败时逐条重试，仍失败的操作放回队列，在之后的批次中重试，超过重试次数后才丢弃。
+    """
+
+    def __init__(self, flush_interval=1.0, max_batch=500, sync_mode=SYNC_NORMAL, max_retries=5):
+        """
+        初始化后台写入
+
+        参数:
+            flush_interval (float): 两次写入之间的最长间隔（秒）
+            max_batch (int): 待写入操作达到该数量时立即写入
+            sync_mode (str): 落盘策略 SYNC_OFF / SYNC_NORMAL / SYNC_FULL
+            max_retries (int): 单个操作写入失败后最多放回队列的次数
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.sync_mode = sync_mode
+        self.max_retries = max_retries
+        self._handlers = {}
+        self._thread_inits = []
+        self._pending = {}
+        self._applying = {}
+        self._retries = {}
+        self._pending_count = 0
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._flushed_generation = 0
+        self._generation = 0
+        self._closed = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.written = 0
+        self.errors = 0
+        self.requeued = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._started = False
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # 首次提交时才启动线程，保证注册的初始化函数都已就绪
+        if not self._started:
+            self._started = True
+            self._thread.start()
+
+    def register(self, kind, apply_batch, merge=None):
+        """
+        注册一类持久化操作
+
+        参数:
+            kind (str): 操作类型
+            apply_batch (callable): 批量写入函数，参数为 [(key, payload)]
+            merge (callable): 合并同key的两次操作 (旧payload, 新payload) -> payload，默认取新值
+        """
+        with self._cond:
+            self._handlers[kind] = (apply_batch, merge)
+            self._pending.setdefault(kind, {})
+
+    def add_thread_init(self, fn):
+        """
+        注册在写入线程中执行的初始化函数，如设置连接的落盘策略
+        """
+        with self._cond:
+            self._thread_inits.append(fn)
+
+    def submit(self, kind, key, payload):
+        """
+        放入一个持久化操作，立即返回
+
+        参数:
+            kind (str): 已注册的操作类型
+            key: 合并键
+            payload: 操作数据
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehind 已关闭")
+            self._ensure_started()
+            pending = self._pending[kind]
+            _, merge = self._handlers[kind]
+            self.submitted += 1
+            if key in pending:
+                self.coalesced += 1
+                pending[key] = merge(pending[key], payload) if merge else payload
+            else:
+                pending[key] = payload
+                self._pending_count += 1
+            if self._pending_count >= self.max_batch:
+                self._cond.notify_all()
+
+    def discard(self, kind, key):
+        """
+        撤销尚未写入的操作
+        """
+        with self._cond:
+            if self._pending.get(kind, {}).pop(key, None) is not None:
+                self._pending_count -= 1
+            self._retries.get(kind, {}).pop(key, None)
+
+    def peek(self, kind, key):
+        """
+        查询尚未写入的操作，便于写入完成前读到最新数据
+
+        返回:
+            payload，没有待写入操作时返回None
+        """
+        with self._cond:
+            if key in self._pending.get(kind, {}):
+                return self._pending[kind][key]
+            return self._applying.get(kind, {}).get(key)
+
+    def flush(self, timeout=None):
+        """
+        立即写入当前所有待写入操作，并等待写入完成
+
+        返回:
+            bool: 是否在超时前完成
+        """
+        with self._cond:
+            if not self._started:
+                return True
+            self._generation += 1
+            target = self._generation
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._flushed_generation >= target, timeout=timeout)
+
+    def close(self, timeout=10.0):
+        """
+        写入剩余操作并停止后台线程，进程退出时自动调用
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            started = self._started
+        if started:
+            self._thread.join(timeout)
+
+    def _run(self):
+        for fn in self._thread_inits:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"写入线程初始化失败: {e}")
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._flush_requested or self._pending_count >= self.max_batch,
+                    timeout=self.flush_interval,
+                )
+                closing = self._closed
+                generation = self._generation
+                self._flush_requested = False
+                self._applying = self._pending
+                self._pending = {kind: {} for kind in self._handlers}
+                self._pending_count = 0
+                handlers = list(self._handlers.items())
+            self._apply(handlers)
+            with self._cond:
+                self._applying = {}
+                self._flushed_generation = max(self._flushed_generation, generation)
+                self._cond.notify_all()
+                # 关闭时继续写入放回队列的操作，重试次数有上限，不会一直循环
+                if closing and not self._pending_count:
+                    return
+
+    def _apply(self, handlers):
+        for kind, (apply_batch, _) in handlers:
+            batch = list(self._applying.get(kind, {}).items())
+            if not batch:
+                continue
+            try:
+                apply_batch(batch)
+                self._written(kind, batch)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"批量写入 {kind} 失败（{len(batch)} 条）: {e}")
+                failed = batch
+                if len(batch) > 1:
+                    # 逐条写入，单条数据有问题时不影响同批次的其他操作
+                    failed = []
+                    for item in batch:
+                        try:
+                            apply_batch([item])
+                            self._written(kind, [item])
+                        except Exception:
+                            failed.append(item)
+                self._requeue(kind, failed)
+        self.batches += 1
+
+    def _written(self, kind, items):
+        with self._cond:
+            self.written += len(items)
+            retries = self._retries.get(kind)
+            if retries:
+                for key, _ in items:
+                    retries.pop(key, None)
+
+    def _requeue(self, kind, items):
+        # 写入失败的操作放回队列，与期间新提交的同key操作合并（新操作在后）
+        if not items:
+            return
+        with self._cond:
+            pending = self._pending[kind]
+            _, merge = self._handlers[kind]
+            retries = self._retries.setdefault(kind, {})
+            for key, payload in items:
+                attempts = retries.get(key, 0) + 1
+                if attempts > self.max_retries:
+                    retries.pop(key, None)
+                    self.dropped += 1
+                    logger.error(f"写入 {kind} {key} 重试{self.max_retries}次仍失败，已丢弃")
+                    continue
+                retries[key] = attempts
+                self.requeued += 1
+                if key in pending:
+                    # 默认后写覆盖先写，期间已有新操作时直接使用新操作
+                    if merge:
+                        pending[key] = merge(payload, pending[key])
+                else:
+                    pending[key] = payload
+                    self._pending_count += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": self._pending_count,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "written": self.written,
+                "errors": self.errors,
+                "requeued": self.requeued,
+                "dropped": self.dropped,
+                "sync_mode": self.sync_mode,
+            }